@@ -0,0 +1,212 @@
+# arena.py
+
+import json
+
+import numpy as np
+
+from multilateration import DEFAULT_ANCHORS
+from game_rules import LineCrossingRule, horizontal_line, vertical_line
+
+# ------------------------------------------------------------------
+#   Arena description, as found under "arena" in the config or in a
+#   JSON file that key points to. Units are arena units (cm).
+#
+#   anchors   [[x, y(, z)], ...]      UWB anchors, for the solver and plot
+#   boundary  [[x, y], ...]           arena polygon, also the zone "arena"
+#   lines     one entry per goal line or wall:
+#               name, and either y (horizontal) or x (vertical) for an
+#               unbounded axis-aligned line, or start/end for a segment;
+#               direction (+1/-1/0, see game_rules), cooldown, hysteresis;
+#               command: byte sent to the drone that crossed;
+#               score: "player1" / "player2" for a goal; wall: true;
+#               sound: effect played (a key of the config's audio effects)
+#   zones     [{"name", "polygon": [[x, y], ...], "command"}]
+#             reported on entry and exit; command (optional) is sent on entry
+# ------------------------------------------------------------------
+DEFAULT_ARENA = {
+    "anchors": DEFAULT_ANCHORS,
+    "boundary": [[0, 0], [5, 573], [295, 570], [289, 0]],
+    "lines": [
+        {"name": "player1_goal", "y": 565, "direction": +1, "cooldown": 1.0, "command": 0x4A,
+         "score": "player1", "sound": "goal"},
+        {"name": "player2_goal", "y": 10, "direction": -1, "cooldown": 1.0, "command": 0x4B,
+         "score": "player2", "sound": "goal"},
+        {"name": "virtual_wall", "x": 285, "direction": +1, "cooldown": 3.0, "command": 0xFF,
+         "wall": True, "sound": "wall"},
+    ],
+    "zones": [],
+}
+
+# Name of the zone made from the boundary polygon.
+ARENA_ZONE = "arena"
+
+
+class Arena:
+    """
+    Anchors, boundary, line rules and zones of the playing field, compiled
+    once: lines become LineCrossingRules (which RulesEngine keeps as edge
+    arrays) and the boundary plus the zones a ZoneIndex.
+    """
+
+    def __init__(self, anchors=DEFAULT_ANCHORS, boundary=(), lines=(), zones=()):
+        self.anchors = np.asarray(anchors, dtype=float)
+        self.boundary = np.asarray(boundary, dtype=float).reshape(-1, 2)
+        self.lines = [dict(line) for line in lines]
+        self.zones = [dict(zone) for zone in zones]
+        for line in self.lines:
+            if "name" not in line or not ({"x", "y"} & line.keys() or {"start", "end"} <= line.keys()):
+                raise ValueError(f"arena line needs a name and x, y or start/end: {line}")
+
+        polygons = [self.boundary] if len(self.boundary) else []
+        names = [ARENA_ZONE] if len(self.boundary) else []
+        for zone in self.zones:
+            names.append(zone["name"])
+            polygons.append(np.asarray(zone["polygon"], dtype=float))
+        self.zone_names = names
+        self.zone_commands = [None] * (len(names) - len(self.zones)) + [z.get("command") for z in self.zones]
+        self.index = ZoneIndex(polygons) if polygons else None
+
+    @classmethod
+    def from_config(cls, spec=None):
+        """
+        An Arena from a config dict, the path of a JSON file holding one, or
+        None for DEFAULT_ARENA. Keys left out take their default.
+        """
+        if spec is None:
+            spec = {}
+        elif isinstance(spec, str):
+            with open(spec, 'r', encoding='utf-8') as f:
+                spec = json.load(f)
+        merged = dict(DEFAULT_ARENA, **spec)
+        return cls(merged["anchors"], merged["boundary"], merged["lines"], merged["zones"])
+
+    def line_rules(self, actions_for):
+        """
+        One LineCrossingRule per line; actions_for(line) returns its actions.
+        """
+        rules = []
+        for line in self.lines:
+            kwargs = {k: line[k] for k in ("cooldown", "hysteresis") if k in line}
+            direction = line.get("direction", 0)
+            actions = actions_for(line)
+            if "y" in line:
+                rules.append(horizontal_line(line["name"], line["y"], actions, direction, **kwargs))
+            elif "x" in line:
+                rules.append(vertical_line(line["name"], line["x"], actions, direction, **kwargs))
+            else:
+                rules.append(LineCrossingRule(line["name"], tuple(line["start"]), tuple(line["end"]),
+                                              actions, direction, **kwargs))
+        return rules
+
+    def bounds(self, margin=0.05):
+        """
+        (xmin, ymin, xmax, ymax) around the boundary, zones and anchors.
+        """
+        points = [self.anchors[:, :2]] + ([self.boundary] if len(self.boundary) else []) + \
+                 [np.asarray(z["polygon"], dtype=float) for z in self.zones]
+        points = np.vstack(points)
+        lo, hi = points.min(axis=0), points.max(axis=0)
+        pad = (hi - lo) * margin
+        return (*(lo - pad), *(hi + pad))
+
+    def line_segment(self, line):
+        """
+        End points of a line for drawing; unbounded lines span bounds().
+        """
+        xmin, ymin, xmax, ymax = self.bounds()
+        if "y" in line:
+            return (xmin, line["y"]), (xmax, line["y"])
+        if "x" in line:
+            return (line["x"], ymin), (line["x"], ymax)
+        return tuple(line["start"]), tuple(line["end"])
+
+    def contains(self, points):
+        """
+        (k, zones) bool array: which of zone_names each point lies in.
+        """
+        if self.index is None:
+            return np.zeros((len(points), 0), dtype=bool)
+        return self.index.contains(points)
+
+
+class ZoneIndex:
+    """
+    Point-in-polygon tests for many polygons at once in constant time.
+
+    A uniform grid over the polygons is classified up front: per cell and
+    polygon, entirely outside, entirely inside, or on the polygon's edge.
+    A lookup is then one array index per point; only points in an edge
+    cell fall back to the exact even-odd test, which runs against the
+    concatenated edge arrays of all polygons in one vectorized pass.
+    """
+
+    OUTSIDE, INSIDE, EDGE = 0, 1, 2
+
+    def __init__(self, polygons, cells=64):
+        polygons = [np.asarray(p, dtype=float)[:, :2] for p in polygons]
+        for p in polygons:
+            if len(p) < 3:
+                raise ValueError("a zone polygon needs at least three points")
+        self.n_zones = len(polygons)
+
+        # Edges of all polygons back to back, polygon by polygon.
+        self.a = np.vstack(polygons)
+        self.b = np.vstack([np.roll(p, -1, axis=0) for p in polygons])
+        self.starts = np.cumsum([0] + [len(p) for p in polygons[:-1]])
+
+        lo = self.a.min(axis=0)
+        hi = self.a.max(axis=0)
+        self.cell = max(float((hi - lo).max()) / cells, 1e-9)
+        self.origin = lo
+        self.shape = (int((hi[1] - lo[1]) / self.cell) + 1, int((hi[0] - lo[0]) / self.cell) + 1)
+        ny, nx = self.shape
+
+        # Cells classified by their centers ...
+        cy, cx = np.mgrid[0:ny, 0:nx]
+        centers = np.column_stack([(cx.ravel() + 0.5) * self.cell + lo[0],
+                                   (cy.ravel() + 0.5) * self.cell + lo[1]])
+        grid = self.exact(centers).astype(np.int8).reshape(ny, nx, self.n_zones)
+
+        # ... except those an edge passes through, and their neighbours.
+        zone_of_edge = np.repeat(np.arange(self.n_zones), [len(p) for p in polygons])
+        for a, b, zone in zip(self.a, self.b, zone_of_edge):
+            steps = int(np.hypot(*(b - a)) / (self.cell / 4)) + 2
+            samples = a + np.linspace(0.0, 1.0, steps)[:, None] * (b - a)
+            ix = ((samples[:, 0] - lo[0]) / self.cell).astype(int)
+            iy = ((samples[:, 1] - lo[1]) / self.cell).astype(int)
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    grid[np.clip(iy + dy, 0, ny - 1), np.clip(ix + dx, 0, nx - 1), zone] = self.EDGE
+        self.grid = grid
+
+    def exact(self, points):
+        """
+        Even-odd test of (k, 2) points against every polygon: (k, zones) bool.
+        """
+        x = points[:, 0:1]
+        y = points[:, 1:2]
+        ax, ay = self.a[:, 0], self.a[:, 1]
+        bx, by = self.b[:, 0], self.b[:, 1]
+        spans = (ay > y) != (by > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = ax + (y - ay) * (bx - ax) / (by - ay)
+        crossings = spans & (x < x_cross)
+        return np.add.reduceat(crossings, self.starts, axis=1, dtype=np.int32) % 2 == 1
+
+    def contains(self, points):
+        xy = np.asarray(points, dtype=float).reshape(len(points), -1)[:, :2]
+        ix = np.floor((xy[:, 0] - self.origin[0]) / self.cell).astype(int)
+        iy = np.floor((xy[:, 1] - self.origin[1]) / self.cell).astype(int)
+        ny, nx = self.shape
+        on_grid = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+
+        result = np.zeros((len(xy), self.n_zones), dtype=bool)
+        state = self.grid[iy[on_grid], ix[on_grid]]
+        result[on_grid] = state == self.INSIDE
+        edge = state == self.EDGE
+        rows = np.flatnonzero(edge.any(axis=1))
+        if len(rows):
+            points_on_grid = np.flatnonzero(on_grid)[rows]
+            exact = self.exact(xy[points_on_grid])
+            result[points_on_grid] = np.where(edge[rows], exact, result[points_on_grid])
+        return result
@@ -0,0 +1,234 @@
+# async_io.py
+
+import sys
+import asyncio
+import logging
+import threading
+import functools
+
+try:
+    import qasync
+except ImportError:
+    qasync = None
+
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+# Telemetry packets waiting for the consumer coroutine, per engine
+PACKET_QUEUE_SIZE = 4096
+
+
+def qt_event_loop(app):
+    """
+    An asyncio loop running on Qt's event loop (qasync), or None when
+    qasync is not installed.
+    """
+    if qasync is None:
+        return None
+    return qasync.QEventLoop(app)
+
+
+class AsyncEngine:
+    """
+    asyncio I/O backend for a TrackingEngine.
+
+    One event loop replaces the engine thread and the serial reader thread.
+    The serial port is watched with add_reader() and read without blocking
+    as soon as bytes arrive; cflib's callback threads hand telemetry packets
+    over with call_soon_threadsafe(); two coroutines decode the packets and
+    apply fixes and flow-deck samples (TrackingEngine.process_pending).
+
+    Packets wait in a bounded asyncio.Queue. When the consumer falls behind,
+    new packets are dropped and counted in dropped_packets rather than
+    piling up; fixes keep the reader's own bounded queue. A port without a
+    selectable file descriptor (Windows COM ports) keeps its reader thread,
+    which then only wakes the loop.
+
+    start() runs the loop in its own thread, so MainForm and the headless
+    runner work unchanged. Given a qt_event_loop() it runs on the GUI
+    thread instead and the engine's callbacks arrive there directly.
+    """
+
+    def __init__(self, engine, queue_size=PACKET_QUEUE_SIZE):
+        self.engine = engine
+        self.queue_size = queue_size
+        self.loop = None
+        self.dropped_packets = 0
+        self._packets = None
+        self._wake = None
+        self._tasks = []
+        self._thread = None
+        self._loop_thread_id = None
+        self._watched = None
+
+        tracker = engine.tracker
+        tracker.fixesAvailable.connect(self.notify)
+        for link in engine.registry:
+            link.telemetry.packet_handler = functools.partial(self.post_packet, link.telemetry)
+            # Replayed packets bypass the handler; their samples still wake us.
+            link.telemetry.flowDeckUpdated.connect(lambda t, h, yaw: self.notify())
+        METRICS.gauge("queue_depth", "Items waiting in a hand-over queue", {"queue": "packets"},
+                      fn=lambda: self._packets.qsize() if self._packets is not None else 0)
+        METRICS.counter("telemetry_packets_dropped_total", "Telemetry packets dropped by a full queue",
+                        fn=lambda: self.dropped_packets)
+        if "serial" in engine.connections.links:
+            engine.connections.add("serial", self.open_serial, self.close_serial)
+
+    @property
+    def running(self):
+        return self.loop is not None and self.loop.is_running()
+
+    def start(self, loop=None):
+        """
+        Starts the coroutines and the engine's connections. Without a loop
+        a new one runs in an "asyncio-io" thread; a given loop (e.g. from
+        qt_event_loop) is used as is and must be run by the caller.
+        """
+        if self.loop is not None:
+            return
+        self._packets = asyncio.Queue(self.queue_size)
+        self._wake = asyncio.Event()
+        if loop is None:
+            self.loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), daemon=True,
+                                            name="asyncio-io")
+            self._thread.start()
+            ready.wait()
+        else:
+            self.loop = loop
+            loop.call_soon(self._begin)
+        self.engine.start(thread=False)
+
+    def stop(self):
+        """
+        Stops the connections and the loop, then the engine, which applies
+        whatever is still queued.
+        """
+        self.engine.connections.stop()
+        if self.loop is not None and self._thread is not None:
+            self._call(self._unwatch)
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        elif self.loop is not None and not self.loop.is_closed():
+            self._unwatch()
+            for task in self._tasks:
+                task.cancel()
+        self.engine.stop()
+
+    def notify(self):
+        """
+        Wakes the processing coroutine; callable from any thread.
+        """
+        if threading.get_ident() == self._loop_thread_id:
+            self._wake.set()
+        elif self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._wake.set)
+
+    def post_packet(self, telemetry, pk):
+        """
+        cflib port callback: queues the packet on the loop. Runs in the
+        radio thread, so it only schedules.
+        """
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._offer, (telemetry, pk))
+
+    # -----------------------------------------------------------------
+    #   Serial port, opened and closed by the connection manager
+    # -----------------------------------------------------------------
+    def open_serial(self):
+        tracker = self.engine.tracker
+        selectable = sys.platform != 'win32'
+        tracker.open_serial(start_reader=not selectable)
+        if selectable:
+            self._call(functools.partial(self._watch, tracker.reader))
+
+    def close_serial(self):
+        # The fd must leave the selector before the port closes it.
+        if self._watched is not None:
+            self._call(self._unwatch)
+        self.engine.tracker.close_serial()
+
+    def _watch(self, reader):
+        fd = reader.ser.fileno()
+        self.loop.add_reader(fd, self._on_readable, reader)
+        self._watched = fd
+
+    def _unwatch(self):
+        if self._watched is not None:
+            self.loop.remove_reader(self._watched)
+            self._watched = None
+
+    def _on_readable(self, reader):
+        try:
+            reader.read_available()
+        except Exception as e:
+            self._unwatch()
+            log.warning("Serial reader stopped: %s", e)
+            self.engine.tracker.serialLost.emit(str(e))
+
+    def _call(self, func, timeout=2.0):
+        """
+        Runs func() on the loop and waits for it, from another thread.
+        """
+        if threading.get_ident() == self._loop_thread_id or not self.running:
+            func()
+            return
+
+        async def call():
+            func()
+        asyncio.run_coroutine_threadsafe(call(), self.loop).result(timeout)
+
+    # -----------------------------------------------------------------
+    #   Loop and consumers
+    # -----------------------------------------------------------------
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(ready.set)
+        self._begin()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def _begin(self):
+        self._loop_thread_id = threading.get_ident()
+        self._tasks = [self.loop.create_task(self._consume_packets()),
+                       self.loop.create_task(self._process())]
+
+    async def _shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.loop.stop()
+
+    def _offer(self, item):
+        try:
+            self._packets.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped_packets += 1
+
+    async def _consume_packets(self):
+        packets = self._packets
+        while True:
+            telemetry, pk = await packets.get()
+            telemetry.packet_callback(pk)
+            # Take the rest of a burst without going back to the selector.
+            while not packets.empty():
+                telemetry, pk = packets.get_nowait()
+                telemetry.packet_callback(pk)
+
+    async def _process(self):
+        wake = self._wake
+        while True:
+            # Woken by new data, or when a fused state is due regardless.
+            try:
+                await asyncio.wait_for(wake.wait(), self.engine.fusion.timeout())
+            except asyncio.TimeoutError:
+                pass
+            # Clear before draining so data queued meanwhile wakes us again.
+            wake.clear()
+            self.engine.process_pending()
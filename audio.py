@@ -0,0 +1,296 @@
+# audio.py
+
+import time
+import wave
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+# miniaudio (pip install miniaudio) drives the sound card and decodes
+# MP3, FLAC and Vorbis; without it only 16-bit WAV effects mixed to the
+# null or a file sink work, and AudioEngine refuses anything else.
+try:
+    import miniaudio
+except ImportError:
+    miniaudio = None
+
+MINIAUDIO_HINT = 'install it (pip install miniaudio), or set "audio": {"enabled": false}'
+
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+TRIGGER_LATENCY = METRICS.histogram("audio_latency_seconds", "Time from a sound trigger to its first sample playing")
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+BLOCK_FRAMES = 256      # ~6 ms per mixing block at 44.1 kHz
+QUEUE_SIZE = 16         # triggers waiting for the next block
+MAX_VOICES = 8          # sounds playing at once; the oldest is cut
+
+
+def load_effect(path, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    Decodes a sound file into float32 PCM (frames, channels) in [-1, 1] at
+    the given rate. WAV is read with the standard library; MP3, FLAC and
+    Vorbis need miniaudio.
+    """
+    if path.lower().endswith(".wav"):
+        with wave.open(path, 'rb') as f:
+            if f.getsampwidth() != 2:
+                raise ValueError(f"{path}: only 16-bit WAV is supported")
+            rate, n_channels = f.getframerate(), f.getnchannels()
+            pcm = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2').reshape(-1, n_channels)
+        pcm = resample(pcm.astype(np.float32) / 32768.0, rate, sample_rate)
+    elif miniaudio is not None:
+        decoded = miniaudio.decode_file(path, output_format=miniaudio.SampleFormat.SIGNED16,
+                                        nchannels=channels, sample_rate=sample_rate)
+        pcm = np.frombuffer(decoded.samples, dtype=np.int16).reshape(-1, channels).astype(np.float32) / 32768.0
+    else:
+        raise RuntimeError(f"{path}: decoding needs the miniaudio package")
+    if pcm.shape[1] != channels:
+        pcm = np.repeat(pcm.mean(axis=1, keepdims=True), channels, axis=1)
+    return np.ascontiguousarray(pcm, dtype=np.float32)
+
+
+def resample(pcm, rate, sample_rate):
+    """
+    Linear resampling, good enough for short effects.
+    """
+    if rate == sample_rate or not len(pcm):
+        return pcm
+    n = int(round(len(pcm) * sample_rate / rate))
+    src = np.arange(n) * (rate / sample_rate)
+    return np.column_stack([np.interp(src, np.arange(len(pcm)), pcm[:, c]) for c in range(pcm.shape[1])])
+
+
+# ------------------------------------------------------------------
+#   Sinks: where the mix goes. A sink calls render(frames) from its
+#   own long-lived thread whenever it needs the next block; `latency`
+#   is how long a rendered block takes to be heard.
+# ------------------------------------------------------------------
+class PacedSink:
+    """
+    Pulls blocks in real time from a thread of its own and discards them.
+    Stands in for a sound card in headless runs and tests, so triggers,
+    mixing and latency behave as they would with one.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, channels=CHANNELS, block_frames=BLOCK_FRAMES):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_frames = block_frames
+        self.latency = block_frames / sample_rate
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self, render):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(render,), daemon=True, name="audio")
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _run(self, render):
+        period = self.block_frames / self.sample_rate
+        due = time.monotonic()
+        while not self._stop_event.is_set():
+            self.write(render(self.block_frames))
+            due += period
+            delay = due - time.monotonic()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            elif delay < -0.1:
+                due = time.monotonic()  # fell behind (e.g. suspended): resync
+
+    def write(self, block):
+        pass
+
+
+class WavSink(PacedSink):
+    """
+    A PacedSink that writes the mix to a 16-bit WAV file.
+    """
+
+    def __init__(self, path, sample_rate=SAMPLE_RATE, channels=CHANNELS, block_frames=BLOCK_FRAMES):
+        super().__init__(sample_rate, channels, block_frames)
+        self.path = path
+        self._file = None
+
+    def start(self, render):
+        self._file = wave.open(self.path, 'wb')
+        self._file.setnchannels(self.channels)
+        self._file.setsampwidth(2)
+        self._file.setframerate(self.sample_rate)
+        super().start(render)
+
+    def stop(self):
+        super().stop()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def write(self, block):
+        self._file.writeframes(block.tobytes())
+
+
+class DeviceSink:
+    """
+    The default sound card through miniaudio, which calls back for blocks
+    from its own audio thread.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, channels=CHANNELS, block_frames=BLOCK_FRAMES, buffer_ms=20):
+        if miniaudio is None:
+            raise RuntimeError("sound output needs the miniaudio package")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_frames = block_frames
+        self.latency = buffer_ms / 1000.0
+        self.device = miniaudio.PlaybackDevice(output_format=miniaudio.SampleFormat.SIGNED16, nchannels=channels,
+                                               sample_rate=sample_rate, buffersize_msec=buffer_ms)
+        self._stream = None
+
+    def start(self, render):
+        def stream():
+            frames = yield b""
+            while True:
+                frames = yield render(frames or self.block_frames).tobytes()
+
+        self._stream = stream()
+        next(self._stream)
+        self.device.start(self._stream)
+
+    def stop(self):
+        self.device.stop()
+        self.device.close()
+
+
+def make_sink(name, sample_rate=SAMPLE_RATE, channels=CHANNELS, block_frames=BLOCK_FRAMES):
+    """
+    "device", "null" or the path of a .wav file to record the mix to. A
+    device that cannot be opened falls back to "null"; "device" without
+    miniaudio raises RuntimeError.
+    """
+    if name == "null":
+        return PacedSink(sample_rate, channels, block_frames)
+    if name != "device":
+        return WavSink(name, sample_rate, channels, block_frames)
+    if miniaudio is None:
+        raise RuntimeError(f'the "device" sound sink needs the miniaudio package; {MINIAUDIO_HINT}')
+    try:
+        return DeviceSink(sample_rate, channels, block_frames)
+    except Exception as e:
+        log.warning("No sound output (%s); mixing to the null sink", e)
+        return PacedSink(sample_rate, channels, block_frames)
+
+
+class AudioEngine:
+    """
+    Sound effects with a fixed, small trigger cost.
+
+    Effects are decoded once, at construction, into float32 PCM. play()
+    only stamps the trigger and appends it to a short queue, so it is safe
+    to call from the engine thread on every goal. The sink's thread takes
+    the queue at the start of each block and mixes every playing voice
+    into it. The time from play() to the first block of the sound
+    reaching the sink, plus the sink's own buffering, is recorded as the
+    trigger-to-sound latency.
+
+    Without miniaudio, a "device" sink or an effect that is not a WAV file
+    raises RuntimeError here rather than leaving the game silent.
+    """
+
+    def __init__(self, effects, sink="null", volume=1.0, sample_rate=SAMPLE_RATE, channels=CHANNELS,
+                 block_frames=BLOCK_FRAMES, queue_size=QUEUE_SIZE, max_voices=MAX_VOICES):
+        self.volume = volume
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.queue_size = queue_size
+        self.max_voices = max_voices
+        self.effects = {}
+        undecodable = [path for path in (effects or {}).values() if not path.lower().endswith(".wav")]
+        if miniaudio is None and undecodable:
+            raise RuntimeError(f"sound effects {', '.join(undecodable)} need the miniaudio package; "
+                               f"{MINIAUDIO_HINT}, or use 16-bit WAV files")
+        for name, path in (effects or {}).items():
+            try:
+                self.effects[name] = load_effect(path, sample_rate, channels)
+            except Exception as e:
+                log.warning("Sound effect %s not loaded: %s", name, e)
+        self.sink = make_sink(sink, sample_rate, channels, block_frames) if isinstance(sink, str) else sink
+        self.clock = time.perf_counter
+
+        self._commands = deque()   # (effect, gain, trigger time) from play()
+        self._voices = []          # [pcm, position, gain, trigger time]
+        self._mix = np.zeros((block_frames, channels), dtype=np.float32)
+        self._silence = np.zeros((block_frames, channels), dtype=np.int16)
+        self.played = 0
+        self.dropped = 0
+        self.unknown = 0
+        self._started = False
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            self.sink.start(self.render)
+
+    def stop(self):
+        if self._started:
+            self._started = False
+            self.sink.stop()
+
+    def play(self, name, gain=1.0):
+        """
+        Queues an effect by name; returns at once. Triggers beyond the
+        queue's size or for effects that did not load are counted and
+        dropped.
+        """
+        if name not in self.effects:
+            self.unknown += 1
+            return
+        if len(self._commands) >= self.queue_size:
+            self.dropped += 1
+            return
+        self._commands.append((name, gain, self.clock()))
+
+    def render(self, frames):
+        """
+        The next `frames` frames of the mix as int16 (frames, channels).
+        Called by the sink's thread only.
+        """
+        now = self.clock()
+        commands = self._commands
+        if not commands and not self._voices:
+            return self._silence[:frames] if len(self._silence) >= frames else \
+                np.zeros((frames, self.channels), dtype=np.int16)
+        for _ in range(len(commands)):
+            name, gain, t = commands.popleft()
+            self._voices.append([self.effects[name], 0, gain, t])
+            self.played += 1
+        if len(self._voices) > self.max_voices:
+            del self._voices[:len(self._voices) - self.max_voices]
+
+        if len(self._mix) < frames:
+            self._mix = np.zeros((frames, self.channels), dtype=np.float32)
+        mix = self._mix[:frames]
+        mix.fill(0.0)
+        playing = []
+        for voice in self._voices:
+            pcm, position, gain, t = voice
+            if position == 0:
+                TRIGGER_LATENCY.observe(now - t + self.sink.latency)
+            n = min(frames, len(pcm) - position)
+            mix[:n] += pcm[position:position + n] * (gain * self.volume)
+            voice[1] = position + n
+            if voice[1] < len(pcm):
+                playing.append(voice)
+        self._voices = playing
+        np.clip(mix, -1.0, 1.0, out=mix)
+        return (mix * 32767.0).astype(np.int16)
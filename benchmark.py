@@ -0,0 +1,519 @@
+# benchmark.py
+#
+# Headless latency / throughput benchmarks for the tracking and telemetry
+# pipeline, driven by the simulated inputs in simulation.py.
+#
+#   python benchmark.py --output results.json [--baseline previous.json]
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+import contextlib
+import subprocess
+from collections import deque
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+from PyQt5.QtCore import QEventLoop
+from PyQt5.QtWidgets import QApplication
+
+from position_protocol import PositionStreamDecoder, encode_position_frame
+from multilateration import Multilaterator, DEFAULT_ANCHORS
+from estimator import KalmanEstimator
+from game_rules import RulesEngine, horizontal_line, vertical_line
+from simulation import FakeCrazyflie, lissajous
+
+RESULTS_VERSION = 1
+
+
+# -----------------------------------------------------------------
+#   Helpers
+# -----------------------------------------------------------------
+def summarize(samples_ns):
+    """
+    Latency percentiles in microseconds from a list of nanosecond samples.
+    """
+    a = np.asarray(samples_ns, dtype=float) / 1000.0
+    if not a.size:
+        return {"count": 0}
+    p50, p90, p99 = np.percentile(a, [50, 90, 99])
+    return {"count": int(a.size), "mean_us": float(a.mean()), "p50_us": float(p50),
+            "p90_us": float(p90), "p99_us": float(p99), "max_us": float(a.max())}
+
+
+def time_calls(fn, args_list):
+    """
+    Calls fn(*args) for each entry and returns the per-call latencies in ns.
+    """
+    clock = time.perf_counter_ns
+    samples = []
+    for args in args_list:
+        t0 = clock()
+        fn(*args)
+        samples.append(clock() - t0)
+    return samples
+
+
+def pump(app, seconds):
+    # Bounded processEvents so a feed the GUI cannot keep up with still ends.
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        app.processEvents(QEventLoop.AllEvents, 20)
+        time.sleep(0.0002)
+
+
+def trajectory_fixes(n, rate_hz=100.0):
+    return [(i / rate_hz, np.array(lissajous(i / rate_hz))) for i in range(n)]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return None
+
+
+# -----------------------------------------------------------------
+#   Stage benchmarks (no Qt)
+# -----------------------------------------------------------------
+def bench_parser(n):
+    results = {}
+    binary = bytearray(b''.join(encode_position_frame(*lissajous(i * 0.01), i, i) for i in range(n)))
+    text = bytearray(b''.join(b"[%.2f, %.2f, %.2f]\n" % lissajous(i * 0.01) for i in range(n)))
+    for name, buf in (("binary", binary), ("text", text)):
+        decoder = PositionStreamDecoder()
+        t0 = time.perf_counter_ns()
+        decoder.decode(buf, len(buf), 0.0, lambda t, fix: None)
+        elapsed = time.perf_counter_ns() - t0
+        results[name] = {"frames": n, "us_per_frame": elapsed / n / 1000.0,
+                         "frames_per_s": n / (elapsed * 1e-9)}
+    return results
+
+
+def bench_multilateration(n):
+    solver = Multilaterator(DEFAULT_ANCHORS)
+    anchors = np.asarray(DEFAULT_ANCHORS, dtype=float)
+    points = np.array([lissajous(i * 0.01)[:2] for i in range(n)])
+    ranges = np.linalg.norm(points[:, None, :] - anchors[None, :, :], axis=2)
+    results = {"backend": solver.backend}
+    for batch in (1, 16, 256):
+        rows = [(ranges[i:i + batch],) for i in range(0, n - batch + 1, batch)]
+        samples = time_calls(solver.solve, rows)
+        results[f"batch_{batch}"] = {"us_per_fix": float(np.mean(samples)) / batch / 1000.0,
+                                     "call": summarize(samples)}
+    return results
+
+
+def bench_estimator(n):
+    estimator = KalmanEstimator()
+    return summarize(time_calls(estimator.update, trajectory_fixes(n)))
+
+
+def bench_rules(n, rule_count=3):
+    rules = [horizontal_line("p1", 565, direction=+1), horizontal_line("p2", 10, direction=-1),
+             vertical_line("wall", 285, direction=+1)]
+    rules += [horizontal_line(f"extra{i}", 20.0 * i) for i in range(rule_count - 3)]
+    engine = RulesEngine(rules)
+    return summarize(time_calls(engine.evaluate, trajectory_fixes(n)))
+
+
+# -----------------------------------------------------------------
+#   Qt benchmarks
+# -----------------------------------------------------------------
+def make_form():
+    from main_form import MainForm
+    form = MainForm(serial_port=None, radio_uri=None, crazyflie=FakeCrazyflie())
+    # Keep the rules from sending commands so the numbers measure the data path only.
+    tracker = form.drone_tracker
+    tracker.send_command = lambda value, drone=0: None
+    tracker.rules = tracker.build_rules(len(tracker.registry))
+    return form
+
+
+def bench_startup(app, drones=2, connect_delay=0.5):
+    """
+    Time from constructing MainForm to its first painted frame, and until
+    every background connection is up, with radio links that take
+    `connect_delay` seconds to connect.
+    """
+    from main_form import MainForm
+    entries = [{"name": f"drone{i + 1}", "uri": f"sim://{i}", "tag": i,
+                "crazyflie": FakeCrazyflie(seed=i, connect_delay=connect_delay)} for i in range(drones)]
+    t0 = time.perf_counter_ns()
+    form = MainForm(serial_port=None, drones=entries)
+    form.show()
+    app.processEvents()
+    first_frame = time.perf_counter_ns() - t0
+    deadline = time.monotonic() + 10.0
+    while not form.connections.all_connected() and time.monotonic() < deadline:
+        pump(app, 0.01)
+    result = {"first_frame_us": first_frame / 1000.0, "connections_ready_s": form.connections.time_to_ready(),
+              "connect_delay_s": connect_delay, "drones": drones}
+    form.engine.stop()
+    form.close()
+    return result
+
+
+def bench_telemetry_decode(form, n):
+    telemetry = form.cfTelemetry
+    cf = telemetry.cf
+    packets = [(cf.telemetry_packet(i * 0.01),) for i in range(n)]
+    return summarize(time_calls(telemetry.packet_callback, packets))
+
+
+def bench_telemetry_decode_v2(form, n):
+    """
+    Like bench_telemetry_decode, for v2 packets carrying several samples each.
+    """
+    from telemetry_protocol import V2_VERSION, V2Encoder
+    telemetry = form.cfTelemetry
+    cf = telemetry.cf
+    encoder = V2Encoder(10)
+    payloads = [p for i in range(n) for p in encoder.add(10 * i, cf.telemetry_sample(i * 0.01))]
+    packets = [(cf.telemetry_packet(0.0, payload),) for payload in payloads]
+    # As if the device had acknowledged v2 on connect.
+    link_version, telemetry.link_version = telemetry.link_version, V2_VERSION
+    try:
+        result = summarize(time_calls(telemetry.packet_callback, packets))
+    finally:
+        telemetry.link_version = link_version
+    result["samples_per_packet"] = n / max(len(packets), 1)
+    return result
+
+
+def bench_fix_to_plot(form, n):
+    """
+    DroneTracker.process_fix -> filter -> rules -> dronePositionUpdated
+    subscribers (the Qt bridge's queued emit included), in one thread.
+    """
+    from position_protocol import PositionFix
+    tracker = form.drone_tracker
+    fixes = [(t, PositionFix(0, i, 0, pos)) for i, (t, pos) in enumerate(trajectory_fixes(n))]
+    return summarize(time_calls(tracker.process_fix, fixes))
+
+
+def bench_serial_end_to_end(app, form, rate_hz, seconds):
+    """
+    Frames written to a pty at rate_hz, read by the SerialReader thread,
+    processed by the engine thread and delivered to the GUI thread through
+    the Qt bridge. Latency is stamped into each frame's t_us and measured
+    for the newest fix of every bridge frame, so it includes the wait for
+    the frame; delivered counts the fixes those frames covered.
+    """
+    import pty
+    import tty
+    import serial
+    from serial_reader import SerialReader
+
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    tracker = form.drone_tracker
+    ser = serial.Serial(os.ttyname(slave), 460800, timeout=0.2)
+    tracker.reader = SerialReader(ser, tracker.decoder, on_fixes=tracker.fixesAvailable.emit)
+    tracker.reader.start()
+
+    samples = []
+    delivered = [0]
+    form.bridge.flush()     # nothing left over from earlier stages
+
+    def on_position(drone, pos):
+        fix = tracker.last_fix
+        now_us = time.monotonic_ns() // 1000
+        samples.append(((now_us - fix.t_us) & 0xFFFFFFFF) * 1000)
+        # Frames are numbered from 0 as written; fix.seq + 1 of them are in.
+        delivered[0] += (fix.seq + 1 - delivered[0]) & 0xFFFF
+
+    form.bridge.positionUpdated.connect(on_position)
+    stop = threading.Event()
+    sent = [0]
+
+    def writer():
+        # Stops on its own after `seconds`, so `sent` is exact even when the
+        # GUI thread is too backlogged to come back to pump() in time.
+        period = 1.0 / rate_hz
+        t0 = time.monotonic()
+        while not stop.is_set() and time.monotonic() - t0 < seconds:
+            due = int((time.monotonic() - t0) / period) + 1 - sent[0]
+            if due > 0:
+                now_us = time.monotonic_ns() // 1000
+                chunk = b''.join(encode_position_frame(*lissajous(0.0), sent[0] + i, now_us)
+                                 for i in range(due))
+                os.write(master, chunk)
+                sent[0] += due
+            stop.wait(min(period, 0.002))
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    pump(app, seconds)
+    stop.set()
+    thread.join()
+    pump(app, 0.2)
+
+    form.bridge.positionUpdated.disconnect(on_position)
+    tracker.reader.stop()
+    tracker.reader.join(timeout=1.0)
+    ser.close()
+    os.close(master)
+    os.close(slave)
+
+    result = summarize(samples)
+    result.update({"rate_hz": rate_hz, "sent": sent[0], "delivered": delivered[0]})
+    return result
+
+
+def bench_telemetry_end_to_end(app, form, rate_hz, seconds):
+    """
+    FakeCrazyflie packet -> packet_callback -> telemetryReceived -> Qt
+    bridge -> GUI thread, measured from packet creation to the bridge
+    frame that delivers it.
+    """
+    telemetry = form.cfTelemetry
+    # v1 only: latency is matched to packets, one sample each.
+    cf = FakeCrazyflie(telemetry_rate_hz=rate_hz, versions=(1,))
+    created = deque()
+    make_packet = cf.telemetry_packet
+
+    def stamped_packet(t, data=None):
+        created.append(time.perf_counter_ns())
+        return make_packet(t, data)
+
+    cf.telemetry_packet = stamped_packet
+    cf.add_port_callback(0x0F, telemetry.packet_callback)
+
+    samples = []
+    form.bridge.flush()
+
+    def on_packet(drone, n, count):
+        now = time.perf_counter_ns()
+        for _ in range(min(count, len(created))):
+            samples.append(now - created.popleft())
+
+    form.bridge.telemetryReceived.connect(on_packet)
+    cf.open_link("sim://bench")
+    pump(app, seconds)
+    cf.close_link()
+    pump(app, 0.2)
+    form.bridge.telemetryReceived.disconnect(on_packet)
+
+    result = summarize(samples)
+    result.update({"rate_hz": rate_hz, "sent": cf.packets_delivered, "delivered": len(samples)})
+    return result
+
+
+# -----------------------------------------------------------------
+#   Closed-loop control
+# -----------------------------------------------------------------
+def busy_thread(stop_event):
+    # Pure-Python work competing for the GIL, as a busy GUI thread would.
+    while not stop_event.is_set():
+        sum(i * i for i in range(1000))
+
+
+def bench_control_loop(rate_hz, seconds, mode="center", load_threads=0, realtime=False):
+    """
+    control.ControlLoop on the simulated anchor and Crazyflie, no hardware
+    needed: the drone is put into DIRECTIONAL and steered for `seconds`.
+    The setpoints' send times, as the FakeCrazyflie recorded them, give
+    the achieved rate and the jitter of the intervals between them; the
+    loop counts its own deadline misses. `load_threads` pure-Python
+    threads compete for the GIL meanwhile, which only a realtime loop
+    (see ControlLoop) keeps up with.
+    """
+    from config import load_config
+    from arena import Arena
+    from engine import TrackingEngine
+    from program import start_simulation
+
+    config = load_config()
+    config["control"].update(enabled=True, rate_hz=rate_hz, realtime=realtime)
+    config["control"]["behavior"]["mode"] = mode
+    arena = Arena.from_config(config["arena"])
+    serial_port, drones, stand_ins = start_simulation(config, arena)
+    engine = TrackingEngine(drones, serial_port=serial_port, arena=arena, control=config["control"])
+    control = engine.control
+    cf = drones[0]["crazyflie"]
+    engine.start()
+    deadline = time.monotonic() + 10.0
+    while not engine.connections.all_connected() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    engine.send_command(0x14)
+    deadline = time.monotonic() + 5.0
+    while not control.active[0] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    stop_event = threading.Event()
+    loaders = [threading.Thread(target=busy_thread, args=(stop_event,), daemon=True) for _ in range(load_threads)]
+    for loader in loaders:
+        loader.start()
+    t0 = time.monotonic()
+    misses, ticks = control.deadline_misses, control.ticks
+    time.sleep(seconds)
+    stop_event.set()
+    for loader in loaders:
+        loader.join()
+    misses, ticks = control.deadline_misses - misses, control.ticks - ticks
+    late = np.asarray(control.jitter)[-ticks:] if ticks else np.zeros(0)
+    target = getattr(control.behavior, "target", None)
+    offset = None if target is None else float(np.hypot(*(engine.tracker.position_at()[:2] - target)))
+    engine.stop()
+    for stand_in in stand_ins:
+        stand_in.stop()
+
+    times = np.array([sp[0] for sp in cf.setpoints if sp[0] >= t0])
+    intervals = np.diff(times)
+    result = summarize(np.abs(intervals - 1.0 / rate_hz) * 1e9)
+    result.update({"rate_hz": rate_hz, "mode": mode, "load_threads": load_threads, "realtime": realtime,
+                   "ticks": ticks,
+                   "deadline_misses": misses, "setpoints": len(times),
+                   "achieved_hz": float(len(intervals) / (times[-1] - times[0])) if len(intervals) else 0.0,
+                   "wake_late_p99_us": float(np.percentile(late, 99) * 1e6) if late.size else 0.0})
+    if offset is not None:
+        result["final_offset"] = offset
+    return result
+
+
+def max_sustainable(results, latency_budget_us):
+    """
+    Highest tested rate that delivered at least 99% of its input with the
+    p99 latency inside the budget.
+    """
+    best = 0.0
+    for r in results:
+        if r["sent"] and r["delivered"] >= 0.99 * r["sent"] and r.get("p99_us", np.inf) <= latency_budget_us:
+            best = max(best, r["rate_hz"])
+    return best
+
+
+# -----------------------------------------------------------------
+#   Driver
+# -----------------------------------------------------------------
+def run(args):
+    results = {
+        "version": RESULTS_VERSION,
+        "commit": git_commit(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "stages": {},
+        "end_to_end": {},
+    }
+    stages = results["stages"]
+    n = args.samples
+
+    stages["parser"] = bench_parser(n)
+    stages["multilateration"] = bench_multilateration(n)
+    stages["estimator"] = bench_estimator(n)
+    stages["rules"] = bench_rules(n)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        stages["startup"] = bench_startup(app)
+        form = make_form()
+        stages["telemetry_decode"] = bench_telemetry_decode(form, n)
+        stages["telemetry_decode_v2"] = bench_telemetry_decode_v2(form, n)
+        stages["fix_to_plot"] = bench_fix_to_plot(form, n)
+
+        serial_runs = [bench_serial_end_to_end(app, form, rate, args.duration) for rate in args.fix_rates]
+        telemetry_runs = [bench_telemetry_end_to_end(app, form, rate, args.duration)
+                          for rate in args.packet_rates]
+        form.close()
+
+    e2e = results["end_to_end"]
+    e2e["serial_to_plot"] = serial_runs
+    e2e["packet_to_text"] = telemetry_runs
+    e2e["max_fixes_per_s"] = max_sustainable(serial_runs, args.latency_budget_us)
+    e2e["max_packets_per_s"] = max_sustainable(telemetry_runs, args.latency_budget_us)
+    e2e["control_loop"] = [bench_control_loop(rate, args.duration, args.control_mode, args.control_load,
+                                              args.control_realtime) for rate in args.control_rates]
+    return results
+
+
+def flatten(d, prefix=""):
+    out = {}
+    for key, value in d.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(flatten(value, name + "."))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and "rate_hz" in item:
+                    out.update(flatten(item, f"{name}@{item['rate_hz']:g}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def compare(current, baseline, threshold):
+    """
+    Prints every latency metric that got worse than the baseline by more
+    than `threshold` (fractional). Returns the number of regressions.
+    """
+    cur, base = flatten(current), flatten(baseline)
+    regressions = 0
+    for name in sorted(cur.keys() & base.keys()):
+        if not name.endswith('_us') and not name.endswith('us_per_frame') and not name.endswith('us_per_fix'):
+            continue
+        if base[name] > 0 and cur[name] > base[name] * (1.0 + threshold):
+            regressions += 1
+            print(f"REGRESSION {name}: {base[name]:.2f} -> {cur[name]:.2f} us "
+                  f"(+{100.0 * (cur[name] / base[name] - 1.0):.0f}%)")
+    return regressions
+
+
+def print_summary(results):
+    for name, value in flatten(results["stages"]).items():
+        if name.endswith(('p50_us', 'p99_us', 'us_per_frame', 'us_per_fix', 'first_frame_us')):
+            print(f"{name:55s} {value:10.2f}")
+    for key in ("serial_to_plot", "packet_to_text"):
+        for r in results["end_to_end"][key]:
+            print(f"{key}@{r['rate_hz']:g}/s  delivered {r['delivered']}/{r['sent']}  "
+                  f"p50 {r.get('p50_us', 0):.0f} us  p99 {r.get('p99_us', 0):.0f} us")
+    for r in results["end_to_end"]["control_loop"]:
+        print(f"control_loop@{r['rate_hz']:g}/s  achieved {r['achieved_hz']:.1f}/s  "
+              f"jitter p50 {r.get('p50_us', 0):.0f} us  p99 {r.get('p99_us', 0):.0f} us  "
+              f"deadline misses {r['deadline_misses']}/{r['ticks']}")
+    print(f"max sustainable fixes/s:   {results['end_to_end']['max_fixes_per_s']:g}")
+    print(f"max sustainable packets/s: {results['end_to_end']['max_packets_per_s']:g}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drone Pong pipeline benchmarks")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON results file")
+    parser.add_argument('--baseline', help="previous results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="fractional slowdown reported as a regression (default 0.2)")
+    parser.add_argument('--samples', type=int, default=5000, help="iterations per stage benchmark")
+    parser.add_argument('--duration', type=float, default=2.0, help="seconds per end-to-end run")
+    parser.add_argument('--fix-rates', type=float, nargs='+', default=[50, 500, 2000, 10000])
+    parser.add_argument('--packet-rates', type=float, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--control-rates', type=float, nargs='+', default=[50, 100],
+                        help="closed-loop control rates to run against the simulation")
+    parser.add_argument('--control-mode', default="center", choices=["center", "lane", "bounce"])
+    parser.add_argument('--control-load', type=int, default=0, metavar='N',
+                        help="pure-Python threads competing with the control loop")
+    parser.add_argument('--control-realtime', action='store_true',
+                        help="run the control loop with realtime=True")
+    parser.add_argument('--latency-budget-us', type=float, default=50000.0,
+                        help="p99 latency allowed when searching for the sustainable rate "
+                             "(the Qt bridge delivers once per 33 ms frame)")
+    args = parser.parse_args()
+
+    results = run(args)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print_summary(results)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            sys.exit(1 if compare(results, json.load(f), args.threshold) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+# command_dispatch.py
+
+import time
+import threading
+from collections import deque
+
+# Priority lanes, highest first. A lane is only served when every lane
+# above it has nothing that may be sent right now.
+PRIORITY_CRITICAL = 0  # LAND / emergency stop: preempt everything, never rate limited
+PRIORITY_CONTROL = 1   # state changes from the GUI (ARM, HOVER, rotations, ...)
+PRIORITY_GAME = 2      # game events from the rules engine
+LANES = 3
+
+# Default lane per command byte; anything else goes to PRIORITY_GAME.
+COMMAND_PRIORITIES = {
+    0x08: PRIORITY_CRITICAL,  # LAND
+    0x02: PRIORITY_CRITICAL,  # UNARM
+    0x01: PRIORITY_CONTROL,   # ARM
+    0x04: PRIORITY_CONTROL,   # HOVER
+    0x10: PRIORITY_CONTROL,   # ROTATE 180
+    0x12: PRIORITY_CONTROL,   # ROTATE 0
+    0x14: PRIORITY_CONTROL,   # DIRECTIONAL
+}
+
+# State commands the drone reports back in the low byte of its telemetry flags.
+ACKED_COMMANDS = frozenset({0x01, 0x02, 0x04, 0x08, 0x10, 0x12, 0x14})
+
+# What _next() returns when the latest velocity setpoint is due.
+SETPOINT = object()
+
+
+class CommandDispatcher(threading.Thread):
+    """
+    Sends command bytes from one worker thread, in priority order.
+
+    submit() only queues and returns. The same byte already waiting in its
+    lane is coalesced rather than queued twice, and a byte is not sent
+    again within `min_interval` seconds (per byte, overridable through
+    `rate_limits`) except in the critical lane; a rate-limited command waits
+    while lower lanes keep moving. Commands in ACKED_COMMANDS are tracked
+    until acknowledge() sees their value in the telemetry flags, and are
+    resent up to `retries` times after `ack_timeout` seconds; on_timeout,
+    if given, is called from the worker with the value when they give up.
+
+    Velocity setpoints (see control.py) share the worker through a single
+    slot, the latest replacing one not yet sent, and go out with
+    send_setpoint(payload) after the critical and control lanes. They are
+    refused while a critical command is queued or awaiting its ack, and
+    from halt_setpoints() until resume_setpoints(), so none can follow a
+    LAND before the drone has taken it.
+    """
+
+    def __init__(self, send, min_interval=0.1, rate_limits=None, priorities=None,
+                 ack_timeout=0.5, retries=0, acked_commands=ACKED_COMMANDS, on_timeout=None,
+                 send_setpoint=None):
+        super().__init__(daemon=True)
+        self.send = send
+        self.send_setpoint = send_setpoint
+        self.min_interval = min_interval
+        self.rate_limits = dict(rate_limits or {})
+        self.priorities = dict(COMMAND_PRIORITIES if priorities is None else priorities)
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.acked_commands = acked_commands
+        self.on_timeout = on_timeout
+
+        self.lanes = [deque() for _ in range(LANES)]
+        self.pending = {}     # value -> (lane, submit time) while queued
+        self.last_sent = {}   # value -> time of the last send
+        self.awaiting = {}    # value -> (deadline, send time, retries left)
+        self.expired = []     # values that gave up, for on_timeout outside the lock
+        self.setpoint = None  # latest setpoint payload not sent yet
+        self.setpoints_halted = False
+
+        self.submitted = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.superseded = 0
+        self.acked = 0
+        self.timed_out = 0
+        self.setpoints_sent = 0
+        self.setpoints_superseded = 0
+        self.setpoints_refused = 0
+        self.queue_latency = deque(maxlen=1024)  # submit -> send, seconds
+        self.ack_latency = deque(maxlen=1024)    # send -> ack, seconds
+
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def submit(self, value, priority=None):
+        """
+        Queues a command byte. Returns False if it was coalesced with an
+        identical command that is still waiting.
+        """
+        lane = self.priorities.get(value, PRIORITY_GAME) if priority is None else priority
+        with self._cond:
+            self.submitted += 1
+            queued = self.pending.get(value)
+            if queued is not None:
+                if lane < queued[0]:
+                    # Same command asked for more urgently: move it up.
+                    self.lanes[queued[0]].remove(value)
+                    self.lanes[lane].append(value)
+                    self.pending[value] = (lane, queued[1])
+                    if lane == PRIORITY_CRITICAL:
+                        self._drop_lanes_below(PRIORITY_CRITICAL)
+                        self.setpoint = None
+                    self._cond.notify()
+                self.coalesced += 1
+                return False
+            if lane == PRIORITY_CRITICAL:
+                # A critical command (LAND, UNARM) drops whatever less urgent
+                # command is still waiting, e.g. a queued ARM or HOVER.
+                self._drop_lanes_below(PRIORITY_CRITICAL)
+                self.setpoint = None
+            self.pending[value] = (lane, time.monotonic())
+            self.lanes[lane].append(value)
+            self._cond.notify()
+        return True
+
+    def submit_setpoint(self, payload):
+        """
+        Offers a setpoint payload for the next send, replacing one still
+        waiting. Returns False if setpoints are refused right now.
+        """
+        with self._cond:
+            if self._stopped or self.setpoints_halted or self.send_setpoint is None or self._critical_pending():
+                self.setpoints_refused += 1
+                return False
+            if self.setpoint is not None:
+                self.setpoints_superseded += 1
+            self.setpoint = payload
+            self._cond.notify()
+        return True
+
+    def halt_setpoints(self):
+        """
+        Refuses setpoints, and drops one waiting, until resume_setpoints().
+        """
+        with self._cond:
+            self.setpoints_halted = True
+            self.setpoint = None
+
+    def resume_setpoints(self):
+        with self._cond:
+            self.setpoints_halted = False
+
+    def _critical_pending(self):
+        return bool(self.lanes[PRIORITY_CRITICAL]) or \
+            any(self.priorities.get(value, PRIORITY_GAME) == PRIORITY_CRITICAL for value in self.awaiting)
+
+    def acknowledge(self, flags):
+        """
+        Called with each telemetry packet's flags; clears the matching ack.
+        """
+        if not self.awaiting:
+            return
+        value = flags & 0xFF
+        with self._cond:
+            entry = self.awaiting.pop(value, None)
+            if entry is not None:
+                self.acked += 1
+                self.ack_latency.append(time.monotonic() - entry[1])
+
+    def stats(self):
+        with self._cond:
+            return {"submitted": self.submitted, "sent": self.sent, "coalesced": self.coalesced,
+                    "superseded": self.superseded, "acked": self.acked, "timed_out": self.timed_out,
+                    "queued": [len(lane) for lane in self.lanes], "awaiting_ack": len(self.awaiting),
+                    "setpoints_sent": self.setpoints_sent, "setpoints_superseded": self.setpoints_superseded,
+                    "setpoints_refused": self.setpoints_refused}
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout=1.0)
+
+    # -----------------------------------------------------------------
+    #   Worker
+    # -----------------------------------------------------------------
+    def run(self):
+        while True:
+            with self._cond:
+                value, wait = self._next(time.monotonic())
+                expired, self.expired = self.expired, []
+                if self._stopped:
+                    return
+                if value is None and not expired:
+                    self._cond.wait(wait)
+                    continue
+                if value is SETPOINT:
+                    payload, self.setpoint = self.setpoint, None
+                elif value is not None:
+                    lane, submitted = self.pending.pop(value)
+                    self.lanes[lane].remove(value)
+
+            # Outside the lock, so a callback may submit() or read stats().
+            for timed_out in expired:
+                self.on_timeout(timed_out)
+            if value is None:
+                continue
+            if value is SETPOINT:
+                self.send_setpoint(payload)
+                with self._cond:
+                    self.setpoints_sent += 1
+                continue
+
+            # Send outside the lock so submit() never waits on the radio.
+            now = time.monotonic()
+            self.send(value)
+            with self._cond:
+                self.sent += 1
+                self.last_sent[value] = now
+                self.queue_latency.append(now - submitted)
+                if value in self.acked_commands and self.ack_timeout is not None:
+                    retries = self.awaiting.get(value, (0.0, 0.0, self.retries))[2]
+                    self.awaiting[value] = (now + self.ack_timeout, now, retries)
+
+    def _next(self, now):
+        """
+        The command to send now, or (None, seconds to wait before checking again).
+        """
+        wait = self._expire_acks(now)
+        for lane, queue in enumerate(self.lanes):
+            if lane == PRIORITY_GAME and self.setpoint is not None:
+                return SETPOINT, 0.0
+            for value in queue:
+                if lane == PRIORITY_CRITICAL:
+                    return value, 0.0
+                ready = self.last_sent.get(value, -float('inf')) + self.rate_limits.get(value, self.min_interval)
+                if ready <= now:
+                    return value, 0.0
+                wait = min(wait, ready - now) if wait is not None else ready - now
+        return None, wait
+
+    def _expire_acks(self, now):
+        wait = None
+        for value, (deadline, sent, retries) in list(self.awaiting.items()):
+            if deadline > now:
+                if deadline != float('inf'):
+                    wait = min(wait, deadline - now) if wait is not None else deadline - now
+                continue
+            del self.awaiting[value]
+            if retries > 0 and value not in self.pending:
+                self.awaiting[value] = (float('inf'), sent, retries - 1)
+                lane = self.priorities.get(value, PRIORITY_GAME)
+                self.pending[value] = (lane, now)
+                self.lanes[lane].append(value)
+            else:
+                self.timed_out += 1
+                if self.on_timeout is not None:
+                    self.expired.append(value)
+        return wait
+
+    def _drop_lanes_below(self, lane):
+        for queue in self.lanes[lane + 1:]:
+            for value in queue:
+                del self.pending[value]
+                self.superseded += 1
+            queue.clear()
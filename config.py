@@ -0,0 +1,170 @@
+# config.py
+
+import copy
+import json
+
+# Every key the application reads, with its default. A config file only
+# needs to list the keys it changes; nested sections are merged.
+DEFAULT_CONFIG = {
+    # "hardware" opens the real serial port and radio, "simulation" runs
+    # the stand-ins from simulation.py instead.
+    "backend": "hardware",
+    "serial_port": "COM26",
+    "baud_rate": 460800,
+    "radio_uri": "radio://0/78/2M/E7E7E7E7E5",
+
+    # One {"name", "uri", "tag"} entry per drone, tag being the UWB tag ID
+    # it carries. Empty means the single drone on radio_uri with tag 0.
+    "drones": [],
+    # cflib TOC cache shared by all links (speeds up reconnecting)
+    "toc_cache": "./cache",
+    # Telemetry payload version to ask the drones for: 2 packs several
+    # sequence-numbered samples per packet, 1 is the original format.
+    "telemetry_format": 2,
+    # "threads": a reader thread per serial port plus an engine thread;
+    # "asyncio": one event loop for the serial port and the radio links.
+    "io_backend": "threads",
+    # Run acquisition, estimation, rules and commands in a worker process
+    # that hands fixes and telemetry to the GUI through shared memory, so
+    # redraws and GC pauses in the window never delay them. GUI only.
+    "engine_process": False,
+
+    # Anchors, arena polygon, goal lines, walls and zones: a dict or the
+    # path of a JSON file, laid out as described in arena.py. None is
+    # arena.DEFAULT_ARENA; keys a dict leaves out keep their default.
+    "arena": None,
+
+    # Predictive scoring fires goal and wall commands ahead of the
+    # crossing, by the measured command delay plus uwb_latency (anchor
+    # delay the host cannot see) plus lead_time, all in seconds. An early
+    # firing the drone does not follow within confirm_margin of the
+    # forecast counts as a false trigger.
+    "scoring": {
+        "predictive": False,
+        "lead_time": 0.0,
+        "uwb_latency": 0.0,
+        "confirm_margin": 0.25,
+    },
+
+    # Solving raw range frames (see multilateration.py). An anchor whose
+    # range misses the solution by more than "max_residual" (cm) is
+    # dropped; a solution whose ranges still miss by more than "max_rms"
+    # (cm) RMS is rejected, as is one whose geometry is worse conditioned
+    # than "max_condition" (null: no limit). Gauss-Newton refinement is
+    # skipped when every range already fits within "linear_tolerance" (cm).
+    "multilateration": {
+        "max_residual": 30.0,
+        "max_rms": 20.0,
+        "max_condition": None,
+        "linear_tolerance": 5.0,
+    },
+
+    # Outlier rejection between parsing and the filter (see outliers.py).
+    # A fix is dropped when it lies more than "threshold" robust standard
+    # deviations from the median of the drone's last "window" fixes, or
+    # when reaching it would take more than "max_speed" (cm/s), counting
+    # fixes that arrive together as "min_interval" (s) apart.
+    # "min_deviation" (cm) is the noise both tests tolerate anyway; a new
+    # position the window agrees with is accepted as a jump after
+    # "jump_after" fixes in a row.
+    "outliers": {
+        "enabled": True,
+        "window": 7,
+        "threshold": 3.0,
+        "min_deviation": 5.0,
+        "max_speed": 1000.0,
+        "min_interval": 0.02,
+        "jump_after": 5,
+    },
+
+    # Fused state stream (see fusion.py): a UWB fix waits at most
+    # "max_latency" seconds for onboard telemetry to interpolate against,
+    # and not at all once a drone's telemetry is "stale_after" seconds old.
+    "fusion": {
+        "max_latency": 0.05,
+        "stale_after": 0.5,
+    },
+
+    # Sound effects for the arena lines' "sound" keys, decoded once at
+    # startup. "sink" is "device" (the sound card, null if there is none),
+    # "null" or the path of a .wav file to record the mix to. The sound
+    # card and MP3 effects, i.e. these defaults, need the miniaudio
+    # package (pip install miniaudio); without it startup fails unless
+    # audio is disabled or uses 16-bit WAV effects and another sink.
+    "audio": {
+        "enabled": True,
+        "sink": "device",
+        "volume": 1.0,
+        "effects": {"goal": "wining.mp3", "wall": "wall.mp3"},
+    },
+
+    # Host-side closed-loop control (see control.py): while a drone
+    # reports DIRECTIONAL, velocity setpoints (at most "max_speed" cm/s)
+    # go out "rate_hz" times a second. "behavior" picks the "mode":
+    # "center" returns to the middle of the play area at "gain" times the
+    # offset per second, "lane" holds x = "lane" (None: the middle) and
+    # cruises between the goals at "speed", "bounce" flies at "speed" and
+    # bounces off the walls; "margin" (cm) keeps it clear of the goal
+    # lines, the virtual wall and the boundary. A drone without a fix for
+    # "fix_timeout" s is held still. "realtime" asks the OS for real-time
+    # priority for the loop's thread.
+    "control": {
+        "enabled": False,
+        "rate_hz": 50.0,
+        "max_speed": 100.0,
+        "fix_timeout": 0.2,
+        "realtime": False,
+        "behavior": {
+            "mode": "center",
+            "gain": 1.5,
+            "speed": 60.0,
+            "lane": None,
+            "margin": 20.0,
+        },
+    },
+
+    # DEBUG, INFO, WARNING or ERROR; repeated messages are rate limited.
+    "log_level": "INFO",
+    # Prometheus text export of metrics.METRICS: rewritten to "file" every
+    # "interval" seconds and/or served on http://127.0.0.1:"port"/metrics.
+    "metrics": {
+        "file": None,
+        "port": None,
+        "interval": 5.0,
+    },
+
+    "simulation": {
+        "drones": 1,
+        "fix_rate_hz": 50.0,
+        # "binary", "text" or "ranges" (raw anchor ranges for the solver)
+        "frame_format": "binary",
+        "position_noise": 2.0,
+        "telemetry_rate_hz": 100.0,
+        # fraction of telemetry packets the simulated radio drops
+        "telemetry_loss": 0.0,
+        "seed": 0,
+    },
+}
+
+
+def merge(base, override):
+    """
+    Recursively merges override into a copy of base.
+    """
+    result = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = merge(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
+def load_config(path=None):
+    """
+    Returns the default configuration, overlaid with a JSON file if given.
+    """
+    if path is None:
+        return copy.deepcopy(DEFAULT_CONFIG)
+    with open(path, 'r', encoding='utf-8') as f:
+        return merge(DEFAULT_CONFIG, json.load(f))
@@ -0,0 +1,215 @@
+# connection_manager.py
+
+import time
+import logging
+import threading
+
+from events import Signal
+
+log = logging.getLogger(__name__)
+
+# Link states, as reported by stateChanged and status().
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+CONNECTED = "connected"
+RETRYING = "retrying"
+FAILED = "failed"
+
+
+class Backoff:
+    """
+    Exponential retry delays: initial, initial * factor, ... capped at maximum.
+    """
+
+    def __init__(self, initial=0.5, factor=2.0, maximum=10.0):
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+
+    def delay(self, failures):
+        return min(self.maximum, self.initial * self.factor ** max(failures - 1, 0))
+
+
+class ManagedLink:
+    """
+    One device the manager keeps connected: `open` blocks until the device
+    is up or raises, `close` (optional) releases it before a reconnect.
+    Links with retry=False are brought up once, e.g. the compute backend.
+    """
+
+    def __init__(self, name, open, close=None, retry=True):
+        self.name = name
+        self.open = open
+        self.close = close
+        self.retry = retry
+
+        self.state = DISCONNECTED
+        self.attempts = 0
+        self.failures = 0        # consecutive, reset by a successful open
+        self.connects = 0
+        self.last_error = None
+        self.connect_seconds = None  # duration of the last successful open
+        self.ready_at = None         # monotonic time it was first connected
+        self.retry_at = None
+
+        self._wake = threading.Event()
+        self._lost = False
+        self._thread = None
+
+
+class ConnectionManager:
+    """
+    Brings devices up in the background and keeps them up.
+
+    Every link gets its own supervisor thread, so the radio links, the
+    serial port and the compute backend all connect in parallel while the
+    window is already showing. When a link reports itself lost through
+    report_lost() it is closed and reopened; failed attempts are retried
+    after Backoff delays until one succeeds or stop() is called.
+    stateChanged(name, state) is emitted on every transition, from the
+    link's supervisor thread.
+    """
+
+    def __init__(self, backoff=None):
+        self.stateChanged = Signal()
+        self.backoff = backoff if backoff is not None else Backoff()
+        self.links = {}
+        self.started_at = None
+        self._stop_event = threading.Event()
+
+    def add(self, name, open, close=None, retry=True):
+        link = ManagedLink(name, open, close, retry)
+        self.links[name] = link
+        if self.started_at is not None:
+            self._start_link(link)
+        return link
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for link in self.links.values():
+            self._start_link(link)
+
+    def stop(self):
+        self._stop_event.set()
+        for link in self.links.values():
+            link._wake.set()
+        for link in self.links.values():
+            if link._thread is not None and link._thread is not threading.current_thread():
+                link._thread.join(timeout=1.0)
+
+    def report_lost(self, name, reason=None):
+        """
+        Marks a link as dropped; its supervisor reconnects it. Thread safe.
+        """
+        link = self.links.get(name)
+        if link is None or not link.retry:
+            return
+        link.last_error = reason
+        link._lost = True
+        link._wake.set()
+
+    def reconnect(self, name):
+        """
+        Closes and reopens a link now, e.g. from a Connect button.
+        """
+        link = self.links.get(name)
+        if link is not None:
+            link.failures = 0
+            link.last_error = "reconnect requested"
+            link._lost = True
+            link._wake.set()
+
+    def all_connected(self):
+        return all(link.state == CONNECTED for link in self.links.values())
+
+    def time_to_ready(self):
+        """
+        Seconds from start() until every link had connected once, or None.
+        """
+        ready = [link.ready_at for link in self.links.values()]
+        if self.started_at is None or None in ready:
+            return None
+        return max(ready, default=self.started_at) - self.started_at
+
+    def status(self):
+        now = time.monotonic()
+        return {name: {"state": link.state, "attempts": link.attempts, "connects": link.connects,
+                       "connect_seconds": link.connect_seconds, "last_error": link.last_error,
+                       "retry_in": max(0.0, link.retry_at - now) if link.state == RETRYING else None}
+                for name, link in self.links.items()}
+
+    def summary(self):
+        parts = []
+        for name, link in self.links.items():
+            if link.state == CONNECTED:
+                parts.append(f"{name}: {link.state} ({link.connect_seconds:.2f} s)")
+            elif link.state == RETRYING:
+                parts.append(f"{name}: retry in {max(0.0, link.retry_at - time.monotonic()):.1f} s")
+            else:
+                parts.append(f"{name}: {link.state}")
+        return " | ".join(parts)
+
+    # -----------------------------------------------------------------
+    #   Supervisors
+    # -----------------------------------------------------------------
+    def _start_link(self, link):
+        link._thread = threading.Thread(target=self._supervise, args=(link,), daemon=True,
+                                        name=f"connect-{link.name}")
+        link._thread.start()
+
+    def _set_state(self, link, state):
+        link.state = state
+        self.stateChanged.emit(link.name, state)
+
+    def _supervise(self, link):
+        while not self._stop_event.is_set():
+            link._lost = False
+            link._wake.clear()
+            if self._open(link):
+                # Sleep until the link is reported lost (or we are stopped).
+                while not link._lost and not self._stop_event.is_set():
+                    link._wake.wait()
+                if self._stop_event.is_set():
+                    return
+                log.warning("Connection lost: %s (%s)", link.name, link.last_error)
+                self._set_state(link, DISCONNECTED)
+                self._close(link)
+                continue
+
+            self._close(link)
+            if not link.retry:
+                self._set_state(link, FAILED)
+                return
+            # reconnect() and stop() cut the wait short.
+            delay = self.backoff.delay(link.failures)
+            link.retry_at = time.monotonic() + delay
+            self._set_state(link, RETRYING)
+            link._wake.wait(delay)
+
+    def _open(self, link):
+        self._set_state(link, CONNECTING)
+        link.attempts += 1
+        t0 = time.monotonic()
+        try:
+            link.open()
+        except Exception as e:
+            link.failures += 1
+            link.last_error = str(e)
+            log.warning("Connecting %s failed (attempt %d): %s", link.name, link.attempts, e)
+            return False
+        now = time.monotonic()
+        link.connect_seconds = now - t0
+        link.failures = 0
+        link.connects += 1
+        if link.ready_at is None:
+            link.ready_at = now
+        self._set_state(link, CONNECTED)
+        return True
+
+    def _close(self, link):
+        if link.close is None:
+            return
+        try:
+            link.close()
+        except Exception as e:
+            log.warning("Closing %s failed: %s", link.name, e)
@@ -0,0 +1,300 @@
+# control.py
+
+import os
+import sys
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+JITTER_SECONDS = METRICS.histogram("control_jitter_seconds", "How late control ticks start after their scheduled time")
+TICK_SECONDS = METRICS.stage("control")
+
+# The state byte a drone reports in the low byte of its telemetry flags
+# while it takes velocity setpoints from the host.
+DIRECTIONAL = 0x14
+MM_PER_UNIT = 10.0          # arena units (cm) -> setpoint mm/s
+SWITCH_INTERVAL = 0.001     # interpreter thread switch interval while realtime
+
+
+def play_area(arena, margin=20.0):
+    """
+    (xmin, ymin, xmax, ymax) a steered drone keeps to: the boundary's box,
+    closed in by the goal lines along y and the virtual wall along x, all
+    shrunk by margin.
+    """
+    (xmin, ymin), (xmax, ymax) = arena.boundary.min(axis=0), arena.boundary.max(axis=0)
+    goals = [line["y"] for line in arena.lines if "score" in line and "y" in line]
+    walls = [line["x"] for line in arena.lines if line.get("wall") and "x" in line]
+    if goals:
+        ymin, ymax = max(ymin, min(goals)), min(ymax, max(goals))
+    if walls:
+        xmax = min(xmax, max(walls))
+    return xmin + margin, ymin + margin, xmax - margin, ymax - margin
+
+
+# ------------------------------------------------------------------
+#   Behaviors: (drone, position, velocity) -> (vx, vy) in arena units
+#   per second, called from the control thread. reset() is called when
+#   a drone enters DIRECTIONAL.
+# ------------------------------------------------------------------
+class ReturnToCenter:
+    """
+    Flies to `target` and holds it, at `gain` times the offset per second.
+    """
+
+    def __init__(self, target, gain=1.5):
+        self.target = (float(target[0]), float(target[1]))
+        self.gain = gain
+
+    def reset(self, drone, pos):
+        pass
+
+    def __call__(self, drone, pos, vel):
+        return self.gain * (self.target[0] - pos[0]), self.gain * (self.target[1] - pos[1])
+
+
+class HoldLane:
+    """
+    Holds x on the lane and cruises along y at `speed`, turning round at
+    either end of y_range.
+    """
+
+    def __init__(self, x, y_range, speed=60.0, gain=1.5):
+        self.x = float(x)
+        self.y_range = y_range
+        self.speed = speed
+        self.gain = gain
+        self.heading = {}
+
+    def reset(self, drone, pos):
+        # Towards the far end first.
+        self.heading[drone] = 1.0 if pos[1] < sum(self.y_range) / 2.0 else -1.0
+
+    def __call__(self, drone, pos, vel):
+        heading = self.heading.get(drone, 1.0)
+        if pos[1] >= self.y_range[1]:
+            heading = -1.0
+        elif pos[1] <= self.y_range[0]:
+            heading = 1.0
+        self.heading[drone] = heading
+        return self.gain * (self.x - pos[0]), heading * self.speed
+
+
+class Bounce:
+    """
+    Flies straight at `speed` and is reflected by the sides of `area`
+    (xmin, ymin, xmax, ymax), the virtual wall being one of them. The
+    first leg starts `angle` degrees off the x axis.
+    """
+
+    def __init__(self, area, speed=60.0, angle=30.0):
+        self.area = area
+        self.initial = (speed * math.cos(math.radians(angle)), speed * math.sin(math.radians(angle)))
+        self.velocity = {}
+
+    def reset(self, drone, pos):
+        self.velocity[drone] = list(self.initial)
+
+    def __call__(self, drone, pos, vel):
+        v = self.velocity.setdefault(drone, list(self.initial))
+        xmin, ymin, xmax, ymax = self.area
+        for axis, lo, hi in ((0, xmin, xmax), (1, ymin, ymax)):
+            # Only ever turned back inwards, so a drone outside stays put.
+            if (pos[axis] >= hi and v[axis] > 0.0) or (pos[axis] <= lo and v[axis] < 0.0):
+                v[axis] = -v[axis]
+        return v[0], v[1]
+
+
+BEHAVIORS = ("center", "lane", "bounce")
+
+
+def make_behavior(arena, mode="center", gain=1.5, speed=60.0, lane=None, margin=20.0, angle=30.0):
+    """
+    One of BEHAVIORS laid out on the arena: "center" returns to the middle
+    of the play area, "lane" holds x = lane (default the middle) between
+    the goals, "bounce" flies straight and bounces off the walls.
+    """
+    area = play_area(arena, margin)
+    center = ((area[0] + area[2]) / 2.0, (area[1] + area[3]) / 2.0)
+    if mode == "center":
+        return ReturnToCenter(center, gain)
+    if mode == "lane":
+        return HoldLane(center[0] if lane is None else lane, (area[1], area[3]), speed, gain)
+    if mode == "bounce":
+        return Bounce(area, speed, angle)
+    raise ValueError(f"unknown control mode {mode!r}, expected one of {', '.join(BEHAVIORS)}")
+
+
+class ControlLoop:
+    """
+    Host-side closed-loop control of the drones that are in DIRECTIONAL.
+
+    A thread of its own ticks at a fixed rate_hz. On every tick each drone
+    whose newest telemetry reports DIRECTIONAL (in the low byte of the
+    flags) has its tracked position extrapolated to now, the behavior
+    turns that into a velocity, capped at max_speed, and goes to the radio
+    link's dispatcher as a VELOCITY_SETPOINT, which refuses it during an
+    emergency stop or a pending LAND. A drone without a fix for
+    fix_timeout seconds is told to hold still; one whose telemetry is
+    older than stale_after is left alone.
+
+    Ticks are due at absolute times, so delays never add up: the thread
+    sleeps until `spin` seconds before a tick and busy-waits the rest.
+    How late a tick starts is its jitter. A tick still running when the
+    next one is due is a deadline miss, and so is every tick skipped
+    because the thread woke up whole periods late; skipped ticks are not
+    made up. realtime=True asks for SCHED_FIFO priority (Linux, needs the
+    privilege) and shortens the interpreter's thread switch interval, so
+    other threads hand over the GIL soon after a tick is due.
+
+    The estimator is read without a lock while the engine thread updates
+    it; a tick may see a fix half applied, which costs one setpoint at
+    most.
+    """
+
+    def __init__(self, tracker, behavior, rate_hz=50.0, max_speed=100.0, fix_timeout=0.2, stale_after=0.5,
+                 spin=0.0005, realtime=False, priority=10, history=4096):
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be positive")
+        self.tracker = tracker
+        self.registry = tracker.registry
+        self.behavior = behavior
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.max_speed = max_speed      # arena units per second
+        self.fix_timeout = fix_timeout
+        self.stale_after = stale_after
+        self.spin = spin
+        self.realtime = realtime
+        self.priority = priority
+        self.clock = time.perf_counter  # tick schedule; positions use tracker.clock
+
+        n = len(self.registry)
+        self.active = np.zeros(n, dtype=bool)
+        self.setpoint = np.zeros((n, 2))   # last velocity sent, arena units per second
+        self.ticks = 0
+        self.deadline_misses = 0
+        self.setpoints = 0
+        self.refused = 0
+        self.send_errors = 0
+        self.jitter = deque(maxlen=history)      # seconds each tick started late
+        self.tick_times = deque(maxlen=history)  # seconds each tick took
+
+        self._switch_interval = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.realtime:
+            self._switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(self._switch_interval, SWITCH_INTERVAL))
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="control")
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        if self._switch_interval is not None:
+            sys.setswitchinterval(self._switch_interval)
+            self._switch_interval = None
+
+    def stats(self):
+        jitter = np.asarray(self.jitter)
+        p50, p99 = np.percentile(jitter, [50, 99]) if jitter.size else (0.0, 0.0)
+        return {"rate_hz": self.rate_hz, "ticks": self.ticks, "deadline_misses": self.deadline_misses,
+                "setpoints": self.setpoints, "refused": self.refused, "send_errors": self.send_errors,
+                "jitter_p50_s": float(p50), "jitter_p99_s": float(p99),
+                "jitter_max_s": float(jitter.max()) if jitter.size else 0.0}
+
+    def _run(self):
+        if self.realtime:
+            self._raise_priority()
+        clock = self.clock
+        period = self.period
+        due = clock() + period
+        while not self._stop_event.is_set():
+            delay = due - clock() - self.spin
+            if delay > 0.0 and self._stop_event.wait(delay):
+                break
+            while clock() < due:
+                pass
+            start = clock()
+            late = start - due
+            if late >= period:
+                # Woke up whole periods late (suspended, starved): skip them.
+                skipped = int(late / period)
+                self.deadline_misses += skipped
+                due += skipped * period
+                late -= skipped * period
+            JITTER_SECONDS.observe(late)
+            self.jitter.append(late)
+            self.tick()
+            end = clock()
+            TICK_SECONDS.observe(end - start)
+            self.tick_times.append(end - start)
+            self.ticks += 1
+            due += period
+            if end > due:
+                self.deadline_misses += 1
+
+    def _raise_priority(self):
+        # With pid 0 Linux changes the calling thread only.
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+        except (AttributeError, OSError) as e:
+            log.info("Control loop runs without real-time priority (%s)", e)
+
+    def tick(self):
+        """
+        One control step for every drone; called from the control thread.
+        """
+        tracker = self.tracker
+        now = tracker.clock()
+        drones = []
+        for d, link in enumerate(self.registry):
+            telemetry = link.telemetry
+            rec = telemetry.record(telemetry.count - 1) if telemetry is not None else None
+            if rec is not None and int(rec['flags']) & 0xFF == DIRECTIONAL and now - float(rec['t']) < self.stale_after:
+                drones.append(d)
+            else:
+                self.active[d] = False
+        if not drones:
+            return
+
+        positions = tracker.estimator.predict(drones, now)
+        velocities = tracker.estimator.velocities
+        for d, pos in zip(drones, positions):
+            if not self.active[d]:
+                self.active[d] = True
+                self.behavior.reset(d, pos)
+            if now - tracker.drone_fix_t[d] > self.fix_timeout:
+                vx = vy = 0.0
+            else:
+                vx, vy = self.behavior(d, pos, velocities[d])
+                speed = math.hypot(vx, vy)
+                if speed > self.max_speed:
+                    vx, vy = vx * self.max_speed / speed, vy * self.max_speed / speed
+            self.setpoint[d] = vx, vy
+            try:
+                sent = self.registry[d].telemetry.send_setpoint(vx * MM_PER_UNIT, vy * MM_PER_UNIT)
+            except Exception as e:
+                self.send_errors += 1
+                log.warning("Setpoint for %s not sent: %s", self.registry[d].name, e)
+                continue
+            if sent:
+                self.setpoints += 1
+            else:
+                self.refused += 1
@@ -1,109 +1,29 @@
 # crazyflie_telemetry.py
 
-from PyQt5.QtCore import QObject, pyqtSignal
-from cflib.crtp import init_drivers
-from cflib.crazyflie import Crazyflie
-from cflib.crtp.crtpstack import CRTPPacket
-
-TELEMETRY_PORT = 0x0F
-TELEMETRY_CHANNEL = 0x07
-
-class CrazyflieTelemetry(QObject):
-    # Signal that emits telemetry messages as strings.
-    telemetryUpdated = pyqtSignal(str)
-
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.cf = Crazyflie()
-
-        # Register connection callbacks.
-        self.cf.connected.add_callback(self.on_connect)
-        self.cf.disconnected.add_callback(self.on_disconnect)
-        
-        # Emit an initial message.
-        self.telemetryUpdated.emit("[INFO] Connecting ...\n")
-        
-        
-        # Open the Crazyflie link – change parameters as needed.
-        self.cf.open_link("radio://0/78/2M/E7E7E7E7E5")
-        
-
-    def on_connect(self, uri):
-        print("DEBUG: on_connect called with uri:", uri)
-        self.telemetryUpdated.emit(f"[Connected] {uri}\n")
-        self.cf.add_port_callback(TELEMETRY_PORT, self.packet_callback)
-
-    
-    def on_disconnect(self, uri):
-        print("DEBUG: on_disconnect called with uri:", uri)
-        self.telemetryUpdated.emit(f"[Disconnected] {uri}\n")
-
-    def send_command(self, value):
-        pk = CRTPPacket()
-        pk.port = TELEMETRY_PORT
-        pk.channel = TELEMETRY_CHANNEL
-        pk.data = bytes([value])
-        pk.size = 1
-        self.cf.send_packet(pk)
-        self.telemetryUpdated.emit(f"[Sent] 0x{value:02X}\n") 
-    """ def send_command(self, value):
-        
-        pk = CRTPPacket()
-        pk.port = TELEMETRY_PORT
-        pk.channel = TELEMETRY_CHANNEL
-        pk.data = bytes([value])
-        pk.size = 1
-        self.cf.send_packet(pk)
-        self.text.insert(tk.END, f"[Sent] State Command 0x{value:02X}\n") """
-
-    def packet_callback(self, pkt):
-        data = pkt.data
-        if len(data) >= 16:
-            def u16(h, l): 
-                return (h << 8) | l
-
-            def i16(h, l):
-                val = (h << 8) | l
-                return val - 0x10000 if val >= 0x8000 else val
-
-            droneFlags = u16(data[0], data[1])
-            front  = u16(data[2], data[3])
-            back   = u16(data[4], data[5])
-            left   = u16(data[6], data[7])
-            right  = u16(data[8], data[9])
-            up     = u16(data[10], data[11])
-            z      = u16(data[12], data[13])
-            iscaled_yaw = i16(data[14], data[15])
-            yaw_deg = (iscaled_yaw * 360.0) / 65536.0 % 360.0
-
-            msg = (
-                f"[Packet] Port: {pkt.port}, Channel: {pkt.channel}\n"
-                f"[Flags ] 0x{droneFlags:04X}\n"
-                f"[MultiR] F: {front} B: {back} L: {left} R: {right} U: {up}\n"
-                f"[FlowD ] Height: {z} mm\n"
-                f"[IMU   ] Yaw: {yaw_deg:.2f}°\n\n"
-            )
-            self.telemetryUpdated.emit(msg)
-
 import time
-import tkinter as tk
-from cflib.crtp import init_drivers
-from cflib.crazyflie import Crazyflie
-from cflib.crtp.crtpstack import CRTPPacket
+import struct
+import logging
+import threading
 
-TELEMETRY_PORT = 0x0F
-TELEMETRY_CHANNEL = 0x07
-DEFAULT_URI = "radio://0/78/2M/E7E7E7E7E5"# crazyflie_telemetry.py
-
-from PyQt5.QtCore import QObject, pyqtSignal
+import numpy as np
 from cflib.crtp import init_drivers
 from cflib.crazyflie import Crazyflie
 from cflib.crtp.crtpstack import CRTPPacket
 
+from events import Signal
+from metrics import METRICS
+from command_dispatch import CommandDispatcher, PRIORITY_CRITICAL
+from telemetry_protocol import (V1_SAMPLE, V2_VERSION, LinkStats, is_format_ack, v2_complete, decode_v2,
+                                format_request, encode_setpoint)
+
 TELEMETRY_PORT = 0x0F
 TELEMETRY_CHANNEL = 0x07
 DEFAULT_URI = "radio://0/78/2M/E7E7E7E7E5"
 
+log = logging.getLogger(__name__)
+
+DECODE_SECONDS = METRICS.stage("telemetry_decode")
+
 STATE_COMMANDS = [
     (0x01, "ARM"),
     (0x02, "UNARM"),
@@ -114,65 +34,297 @@ STATE_COMMANDS = [
     (0x14, "DIRECTIONAL")
 ]
 
-class CrazyflieTelemetry(QObject):
-    telemetryUpdated = pyqtSignal(str)
-
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.cf = Crazyflie()
-
+# ------------------------------------------------------------------
+#   Telemetry ring
+#
+#   A v1 payload (16 bytes, big-endian) is copied verbatim into the ring
+#   next to its arrival time, and the structured dtype below reads the
+#   fields straight out of it: flags u16, multiranger front/back/left/
+#   right/up u16 in mm, flow-deck height u16 in mm, yaw i16 scaled so
+#   that 65536 is a full turn. Samples from a v2 payload (see
+#   telemetry_protocol) are written back in the same layout, one ring
+#   entry per sample.
+# ------------------------------------------------------------------
+PAYLOAD_SIZE = 16
+TELEMETRY_DTYPE = np.dtype([
+    ('t', '<f8'),
+    ('flags', '>u2'),
+    ('multiranger', '>u2', (5,)),
+    ('height', '>u2'),
+    ('yaw', '>i2'),
+    ('port', 'u1'),
+    ('channel', 'u1'),
+])
+PAYLOAD_OFFSET = TELEMETRY_DTYPE.fields['flags'][1]
+PORT_OFFSET = TELEMETRY_DTYPE.fields['port'][1]
+ARRIVAL = struct.Struct('<d')
+HEIGHT_YAW = struct.Struct('>Hh')
+FLAGS = struct.Struct('>H')
+
+
+def yaw_degrees(raw_yaw):
+    """
+    Converts the scaled i16 yaw (scalar or array) to degrees in [0, 360).
+    """
+    return (raw_yaw * 360.0) / 65536.0 % 360.0
+
+
+def format_telemetry(rec):
+    """
+    The telemetry log text for one ring record.
+    """
+    front, back, left, right, up = (int(v) for v in rec['multiranger'])
+    return (
+        f"[Packet] Port: {rec['port']}, Channel: {rec['channel']}\n"
+        f"[Flags ] 0x{int(rec['flags']):04X}\n"
+        f"[MultiR] F: {front} B: {back} L: {left} R: {right} U: {up}\n"
+        f"[FlowD ] Height: {rec['height']} mm\n"
+        f"[IMU   ] Yaw: {yaw_degrees(int(rec['yaw'])):.2f}°\n\n"
+    )
+
+
+class TelemetryRing:
+    """
+    Read access to a ring of TELEMETRY_DTYPE records, where sample n lives
+    at ring[n % len(ring)] and `count` samples have been stored. Shared by
+    the radio link and its copy in another process (see process_engine).
+    """
+
+    def record(self, n):
+        """
+        Ring record of sample n, or None once it has been overwritten.
+        """
+        if n < 0 or n >= self.count or self.count - n > len(self.ring):
+            return None
+        return self.ring[n % len(self.ring)]
+
+    def recent(self, count=None):
+        """
+        Copy of the last `count` records (all stored ones by default),
+        oldest first.
+        """
+        size = len(self.ring)
+        count = min(self.count, size) if count is None else min(count, self.count, size)
+        return self.ring[np.arange(self.count - count, self.count) % size]
+
+    def format_packet(self, n):
+        """
+        Telemetry log text for sample n; formatting is left to whoever
+        displays it.
+        """
+        rec = self.record(n)
+        return None if rec is None else format_telemetry(rec)
+
+
+class CrazyflieTelemetry(TelemetryRing):
+    """
+    One Crazyflie's radio link: decodes its telemetry into a ring and sends
+    it commands. Signals are emitted from cflib's and the dispatcher's
+    threads.
+    """
+
+    def __init__(self, uri=DEFAULT_URI, recorder=None, crazyflie=None,
+                 ring_size=4096, format_version=V2_VERSION, autoconnect=True):
+        # Status text: connection changes and sent commands.
+        self.telemetryUpdated = Signal()
+        # Ring sequence number of the sample just stored; see record().
+        self.telemetryReceived = Signal()
+        # Arrival time (time.monotonic), flow-deck height in mm and IMU yaw in degrees.
+        self.flowDeckUpdated = Signal()
+        # Emitted with cflib's message when an established link drops.
+        self.connectionLost = Signal()
+
+        # Decoded telemetry, oldest entries overwritten first. Sample n lives
+        # at ring[n % ring_size]; `count` is the number of samples stored.
+        self.ring = np.zeros(ring_size, dtype=TELEMETRY_DTYPE)
+        self._ring_bytes = memoryview(self.ring.view(np.uint8))
+        self.count = 0
+        # Any object with the Crazyflie API, e.g. simulation.FakeCrazyflie.
+        self.cf = crazyflie if crazyflie is not None else Crazyflie()
+        # Optional session_log.SessionRecorder for raw telemetry payloads.
+        self.recorder = recorder
+        # Source of arrival timestamps; a replay swaps in the recording's clock.
+        self.clock = time.monotonic
+        # Payload version asked for on connect, the one the device last
+        # acknowledged (every packet is decoded as that) and link quality.
+        self.format_version = format_version
+        self.link_version = 1
+        self.link_stats = LinkStats()
+        # Commands are queued by priority and sent from the dispatcher's thread.
+        self._packets = {}
+        self.dispatcher = CommandDispatcher(self.send_now, send_setpoint=self.send_setpoint_now)
+        self.dispatcher.start()
+
+        self.uri = uri
+        # Registered for the telemetry port on connect; an event-loop backend
+        # swaps in a handler that hands packets over to its loop.
+        self.packet_handler = self.packet_callback
+        self._connected = threading.Event()
+        self._connect_error = None
         self.cf.connected.add_callback(self.on_connect)
         self.cf.disconnected.add_callback(self.on_disconnect)
-        
-        self.telemetryUpdated.emit("[INFO] Connecting ...\n")
-        self.cf.open_link("radio://0/78/2M/E7E7E7E7E5")
+        self.cf.connection_failed.add_callback(self.on_connection_failed)
+        self.cf.connection_lost.add_callback(self.on_connection_lost)
+
+        # uri=None leaves the link closed (replay); autoconnect=False leaves
+        # opening it to open_link(), e.g. from a ConnectionManager.
+        if uri is not None and autoconnect:
+            self.telemetryUpdated.emit("[INFO] Connecting ...\n")
+            self.cf.open_link(uri)
+
+    def open_link(self, timeout=10.0):
+        """
+        Opens the radio link and blocks until cflib reports it connected.
+        Raises ConnectionError if it fails or times out.
+        """
+        self._connected.clear()
+        self._connect_error = None
+        self.telemetryUpdated.emit(f"[INFO] Connecting to {self.uri} ...\n")
+        self.cf.open_link(self.uri)
+        if not self._connected.wait(timeout):
+            self.cf.close_link()
+            raise ConnectionError(f"{self.uri}: no connection after {timeout:.0f} s")
+        if self._connect_error is not None:
+            raise ConnectionError(f"{self.uri}: {self._connect_error}")
+
+    def close_link(self):
+        self.cf.close_link()
 
     def on_connect(self, uri):
-        print("DEBUG: on_connect called with uri:", uri)
+        log.debug("on_connect called with uri: %s", uri)
         self.telemetryUpdated.emit(f"[Connected] {uri}\n")
-        self.cf.add_port_callback(TELEMETRY_PORT, self.packet_callback)
+        # The device restarts its sequence numbers with every connection.
+        self.link_stats.restart()
+        self.link_version = 1
+        self.cf.add_port_callback(TELEMETRY_PORT, self.packet_handler)
+        if self.format_version != 1:
+            pk = CRTPPacket()
+            pk.port = TELEMETRY_PORT
+            pk.channel = TELEMETRY_CHANNEL
+            pk.data = format_request(self.format_version)
+            self.cf.send_packet(pk)
+        self._connected.set()
 
     def on_disconnect(self, uri):
-        print("DEBUG: on_disconnect called with uri:", uri)
+        log.debug("on_disconnect called with uri: %s", uri)
         self.telemetryUpdated.emit(f"[Disconnected] {uri}\n")
 
-    def send_command(self, value):
+    def on_connection_failed(self, uri, msg):
+        self.telemetryUpdated.emit(f"[Failed] {uri}: {msg}\n")
+        self._connect_error = msg
+        self._connected.set()
+
+    def on_connection_lost(self, uri, msg):
+        self.telemetryUpdated.emit(f"[Lost] {uri}: {msg}\n")
+        self.connectionLost.emit(msg)
+
+    def send_command(self, value, priority=None):
+        """
+        Queues a command byte; see command_dispatch for priorities, coalescing
+        and rate limits. Returns False if it merged with one already queued.
+        """
+        return self.dispatcher.submit(value, priority)
+
+    def emergency_stop(self):
+        """
+        LAND ahead of anything else that is queued. Setpoints stay refused
+        until resume_setpoints().
+        """
+        self.dispatcher.halt_setpoints()
+        self.send_command(0x08, PRIORITY_CRITICAL)
+
+    def resume_setpoints(self):
+        self.dispatcher.resume_setpoints()
+
+    def send_now(self, value):
+        # One packet per command byte, built once.
+        pk = self._packets.get(value)
+        if pk is None:
+            pk = CRTPPacket()
+            pk.port = TELEMETRY_PORT
+            pk.channel = TELEMETRY_CHANNEL
+            pk.data = bytes([value])
+            pk.size = 1
+            self._packets[value] = pk
+        self.cf.send_packet(pk)
+        self.telemetryUpdated.emit(f"[Sent] 0x{value:02X}\n")
+
+    def send_setpoint(self, vx, vy, vz=0.0, yaw_rate=0.0):
+        """
+        Hands a velocity setpoint (mm/s, deg/s) to the dispatcher. Setpoints
+        are a stream the latest of which wins: they take its single
+        setpoint slot rather than a lane, and post no status messages.
+        Returns False if it refused the setpoint (stopped, emergency stop,
+        LAND or UNARM pending).
+        """
+        return self.dispatcher.submit_setpoint(encode_setpoint(vx, vy, vz, yaw_rate))
+
+    def send_setpoint_now(self, payload):
         pk = CRTPPacket()
         pk.port = TELEMETRY_PORT
         pk.channel = TELEMETRY_CHANNEL
-        pk.data = bytes([value])
-        pk.size = 1
+        pk.data = payload
         self.cf.send_packet(pk)
-        self.telemetryUpdated.emit(f"[Sent] 0x{value:02X}\n")
+
+    def close(self):
+        self.dispatcher.stop()
+        self.cf.close_link()
 
     def packet_callback(self, pkt):
+        t0 = time.perf_counter()
+        t = self.clock()
         data = pkt.data
-        if len(data) >= 16:
-            def u16(h, l): 
-                return (h << 8) | l
-
-            def i16(h, l):
-                val = (h << 8) | l
-                return val - 0x10000 if val >= 0x8000 else val
-
-            droneFlags = u16(data[0], data[1])
-            front  = u16(data[2], data[3])
-            back   = u16(data[4], data[5])
-            left   = u16(data[6], data[7])
-            right  = u16(data[8], data[9])
-            up     = u16(data[10], data[11])
-            z      = u16(data[12], data[13])
-            iscaled_yaw = i16(data[14], data[15])
-            yaw_deg = (iscaled_yaw * 360.0) / 65536.0 % 360.0
-
-            msg = (
-                f"[Packet] Port: {pkt.port}, Channel: {pkt.channel}\n"
-                f"[Flags ] 0x{droneFlags:04X}\n"
-                f"[MultiR] F: {front} B: {back} L: {left} R: {right} U: {up}\n"
-                f"[FlowD ] Height: {z} mm\n"
-                f"[IMU   ] Yaw: {yaw_deg:.2f}°\n\n"
-            )
-            self.telemetryUpdated.emit(msg)
+        if self.recorder is not None:
+            self.recorder.write_crtp(time.monotonic_ns(), pkt.port, pkt.channel, bytes(data))
+        if is_format_ack(data):
+            self.link_version = data[1]
+            self.telemetryUpdated.emit(f"[INFO] Telemetry format v{data[1]}\n")
+        elif self.link_version == V2_VERSION:
+            if v2_complete(data):
+                self._store_v2(t, pkt)
+            else:
+                self.link_stats.malformed += 1
+        elif len(data) >= PAYLOAD_SIZE:
+            # Copy the raw payload into the ring; no per-field decoding here.
+            n = self.count
+            offset = (n % len(self.ring)) * TELEMETRY_DTYPE.itemsize
+            raw = self._ring_bytes
+            ARRIVAL.pack_into(raw, offset, t)
+            raw[offset + PAYLOAD_OFFSET:offset + PAYLOAD_OFFSET + PAYLOAD_SIZE] = data[:PAYLOAD_SIZE]
+            raw[offset + PORT_OFFSET] = pkt.port
+            raw[offset + PORT_OFFSET + 1] = pkt.channel
+            self.count = n + 1
+            self.link_stats.update_v1()
+
+            if self.dispatcher.awaiting:
+                self.dispatcher.acknowledge(FLAGS.unpack_from(data)[0])
+            z, iscaled_yaw = HEIGHT_YAW.unpack_from(data, 12)
+            self.flowDeckUpdated.emit(t, z, yaw_degrees(iscaled_yaw))
+            self.telemetryReceived.emit(n)
+        DECODE_SECONDS.observe(time.perf_counter() - t0)
+
+    def _store_v2(self, t, pkt):
+        seq, t_ms, period_ms, samples = decode_v2(pkt.data)
+        count = len(samples)
+        self.link_stats.update(t, seq, t_ms, period_ms, count)
+        if self.dispatcher.awaiting:
+            self.dispatcher.acknowledge(samples[0][0])
+
+        raw = self._ring_bytes
+        size = len(self.ring)
+        for k, sample in enumerate(samples):
+            # Earlier samples in the packet are older by whole periods.
+            t_k = t - (count - 1 - k) * period_ms * 1e-3
+            n = self.count
+            offset = (n % size) * TELEMETRY_DTYPE.itemsize
+            ARRIVAL.pack_into(raw, offset, t_k)
+            V1_SAMPLE.pack_into(raw, offset + PAYLOAD_OFFSET, *sample)
+            raw[offset + PORT_OFFSET] = pkt.port
+            raw[offset + PORT_OFFSET + 1] = pkt.channel
+            self.count = n + 1
+
+            self.flowDeckUpdated.emit(t_k, sample[6], yaw_degrees(sample[7]))
+            self.telemetryReceived.emit(n)
 
 # The following block is only executed when running this module directly.
 if __name__ == '__main__':
@@ -0,0 +1,53 @@
+# diagnostics.py
+
+import sys
+import logging
+
+from metrics import METRICS
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `burst` records per call site through every `interval`
+    seconds. The rest are dropped before they are formatted or written,
+    counted, and reported with the next record from that site that gets
+    through, so a message logged per fix costs a dict lookup, not I/O.
+    """
+
+    def __init__(self, interval=1.0, burst=5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.suppressed = METRICS.counter("log_records_suppressed_total",
+                                          "Log records dropped by the rate limit")
+        self._sites = {}  # (path, line) -> [window start, passed, suppressed]
+
+    def filter(self, record):
+        key = (record.pathname, record.lineno)
+        site = self._sites.get(key)
+        if site is None or record.created - site[0] >= self.interval:
+            if site is not None and site[2]:
+                record.msg = f"{record.msg} [{site[2]} similar suppressed]"
+            site = self._sites[key] = [record.created, 0, 0]
+        if site[1] < self.burst:
+            site[1] += 1
+            return True
+        site[2] += 1
+        self.suppressed.inc()
+        return False
+
+
+def setup_logging(level="INFO", stream=None, interval=1.0, burst=5):
+    """
+    Sends the application's log records to stream (default stderr) at
+    `level`, rate limited per call site. Returns the handler.
+    """
+    handler = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(RateLimitFilter(interval, burst))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    return handler
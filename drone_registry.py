@@ -0,0 +1,99 @@
+# drone_registry.py
+
+import numpy as np
+
+from telemetry_protocol import V2_VERSION
+
+# Crazyflie TOC cache shared by all links, as cflib's swarm CachedCfFactory
+# uses it: after the first connection the log/param TOCs load from disk.
+DEFAULT_TOC_CACHE = './cache'
+
+
+class DroneLink:
+    """
+    One drone in the game: display name, radio URI, the UWB tag it carries
+    and its CrazyflieTelemetry (None when there is no radio link).
+    """
+
+    def __init__(self, name, uri=None, tag=0, telemetry=None):
+        self.name = name
+        self.uri = uri
+        self.tag = tag
+        self.telemetry = telemetry
+
+
+class DroneRegistry:
+    """
+    The drones being tracked, in index order.
+
+    The index is what every per-drone array in the tracker, estimator and
+    rules engine is keyed by; tags from the shared serial feed are mapped
+    to it through tag_indices().
+    """
+
+    def __init__(self, links=()):
+        self.links = list(links)
+        self._by_tag = {}
+        for i, link in enumerate(self.links):
+            if link.tag in self._by_tag:
+                raise ValueError(f"UWB tag {link.tag} is assigned to more than one drone")
+            self._by_tag[link.tag] = i
+
+    @classmethod
+    def from_config(cls, drones, recorder=None, toc_cache=DEFAULT_TOC_CACHE, telemetry_format=V2_VERSION,
+                    connect=True):
+        """
+        Builds the registry from a list of {"name", "uri", "tag"} entries with
+        one telemetry link per drone. Links are opened asynchronously, so they
+        all come up in parallel on the shared radio; connect=False leaves them
+        closed for a ConnectionManager to open. An entry may carry a ready
+        "crazyflie" object (e.g. simulation.FakeCrazyflie). telemetry_format
+        is the payload version each link asks for.
+        """
+        from crazyflie_telemetry import CrazyflieTelemetry
+
+        links = []
+        for i, entry in enumerate(drones):
+            crazyflie = entry.get("crazyflie")
+            if crazyflie is None and entry.get("uri") is not None:
+                from cflib.crazyflie import Crazyflie
+                crazyflie = Crazyflie(rw_cache=toc_cache)
+            telemetry = CrazyflieTelemetry(uri=entry.get("uri"), recorder=recorder, crazyflie=crazyflie,
+                                           format_version=telemetry_format, autoconnect=connect)
+            links.append(DroneLink(entry.get("name", f"drone{i + 1}"), entry.get("uri"),
+                                   entry.get("tag", i), telemetry))
+        return cls(links)
+
+    def __len__(self):
+        return len(self.links)
+
+    def __iter__(self):
+        return iter(self.links)
+
+    def __getitem__(self, i):
+        return self.links[i]
+
+    @property
+    def names(self):
+        return [link.name for link in self.links]
+
+    def close(self):
+        """
+        Stops every command dispatcher and closes every radio link.
+        """
+        for link in self.links:
+            if link.telemetry is not None:
+                link.telemetry.close()
+
+    def index_of(self, tag):
+        """
+        Drone index carrying UWB tag `tag`, or -1 if it is not registered.
+        """
+        return self._by_tag.get(tag, -1)
+
+    def tag_indices(self, tags):
+        """
+        Drone indices for a sequence of tags as an int array, -1 for unknown tags.
+        """
+        lookup = self._by_tag
+        return np.fromiter((lookup.get(tag, -1) for tag in tags), dtype=int, count=len(tags))
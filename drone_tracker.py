@@ -1,55 +1,138 @@
 # drone_tracker.py
 
 import time
+import logging
 import serial
-import cupy as cp
 import numpy as np
-from scipy.optimize import least_squares
 
-from PyQt5.QtCore import QObject, QTimer, pyqtSignal
-from playsound import playsound
 import threading
+
+from events import Signal
+from metrics import METRICS
+from serial_reader import SerialReader
+from position_protocol import PositionStreamDecoder
+from multilateration import Multilaterator
+from arena import Arena
+from estimator import KalmanBank
+from outliers import OutlierGate
+from drone_registry import DroneRegistry, DroneLink
+from game_rules import RulesEngine, LatencyBudget, command_action, sound_action
+
+log = logging.getLogger(__name__)
+
+GATE_SECONDS = METRICS.stage("outliers")
+FILTER_SECONDS = METRICS.stage("filter")
+RULES_SECONDS = METRICS.stage("rules")
+EMIT_SECONDS = METRICS.stage("emit")
+FIX_AGE = METRICS.histogram("fix_age_seconds", "Time from reading a fix to publishing its position")
 # Import if needed for type hinting or references:
 # from crazyflie_telemetry import CrazyflieTelemetry
 
-def play_sound_non_blocking(sound_file):
-    threading.Thread(target=playsound, args=(sound_file,), daemon=True).start()
+class DroneTracker:
+    """
+    Position pipeline: serial fixes -> multilateration -> filter -> rules ->
+    commands. Nothing here needs Qt; update() runs in whichever thread the
+    owner drives it from, normally the engine thread (see engine.py).
+    """
 
-class DroneTracker(QObject):
-    # Signal that emits the filtered drone position (a NumPy array [x, y, z]).
-    dronePositionUpdated = pyqtSignal(object)
-    
-    def __init__(self, parent=None, cfTelemetry=None):
-        super().__init__(parent)
-        
-        # Store a reference to the CrazyflieTelemetry object
-        self.cfTelemetry = cfTelemetry
-        
-        # Initialize game parameters
-        self.player1_line_y = 565
-        self.player2_line_y = 10
-        self.virtual_wall_x = 285
+    def __init__(self, cfTelemetry=None, use_gpu=False, estimator=None,
+                 serial_port='COM26', baud_rate=460800, recorder=None, registry=None,
+                 autoconnect=True, predictive=False, lead_time=0.0, uwb_latency=0.0,
+                 confirm_margin=0.25, arena=None, outlier_gate=None, audio=None, multilateration=None):
+        # A drone's index and its filtered position (a NumPy array [x, y, z]).
+        self.dronePositionUpdated = Signal()
+        # (rule name, t, position, drone) whenever a goal or the wall fires.
+        self.ruleFired = Signal()
+        # Raised by the reader thread whenever new fixes are queued.
+        self.fixesAvailable = Signal()
+        # Raised by the reader thread with the error when the serial port fails.
+        self.serialLost = Signal()
+        # (zone name, inside, t, drone) when a drone enters or leaves a zone.
+        self.zoneChanged = Signal()
+
+        # The drones to track; a single cfTelemetry is wrapped as drone 0 on tag 0.
+        self.registry = registry if registry is not None else \
+            DroneRegistry([DroneLink("drone1", tag=0, telemetry=cfTelemetry)])
+        n_drones = len(self.registry)
+
+        # Anchors, goal lines, walls and zones; see arena.py
+        self.arena = arena if arena is not None else Arena.from_config()
+        self.zone_state = np.zeros((n_drones, len(self.arena.zone_names)), dtype=bool)
         self.virtual_wall = False
         
         # Initialize score
         self.player1_score = 0
         self.player2_score = 0
 
-        # These will get set from outside (main_form.py)
-        self.player1_score_label = None  
-        self.player2_score_label = None  
-        self.virtual_wall_label = None
-        
+        # Plays the lines' sound effects (see audio.AudioEngine); None is silent.
+        self.audio = audio
+
+        # Goal lines and wall, checked for every drone on every fix without
+        # blocking. Predictive scoring fires them ahead of the crossing by
+        # the latency budget; see game_rules.RulesEngine.
+        self.latency_budget = LatencyBudget(uwb_latency, lead_time) if predictive else None
+        self.rules = self.build_rules(n_drones)
+        self.rules.budget = self.latency_budget
+        self.rules.confirm_margin = confirm_margin
+        self._budget_refresh_at = 0.0
+
         # -------------------------- Serial Port Configuration --------------------------
-        try:
-            self.ser.close()  # Attempt to close previously open connection (if any)
-        except Exception:
-            pass
+        self.SERIAL_PORT = serial_port  # None: no port, bytes are fed in (replay)
+        self.BAUD_RATE = baud_rate      # Change to match your device's baud rate
+        self.ser = None
+
+        # Source of fix timestamps; a replay swaps in the recording's clock.
+        # With clock_follows_fixes (maximum-speed replay) process_fixes()
+        # sets it to the newest fix of each round, as if it had just arrived.
+        self.clock = time.monotonic
+        self.clock_follows_fixes = False
+
+        # ---------------------- Multilateration (raw range frames) ----------------------
+        # Starts on the CPU; init_compute() moves it to the GPU when asked to
+        # and CuPy finds a device. multilateration holds Multilaterator's
+        # keyword arguments (residual limits and the like).
+        self.use_gpu = use_gpu
+        self.solver_settings = dict(multilateration or {})
+        self.multilaterator = Multilaterator(self.arena.anchors, **self.solver_settings)
 
-        self.SERIAL_PORT = 'COM26'  # Change as necessary
-        self.BAUD_RATE = 460800     # Change to match your device's baud rate
+        # -------------------------- State Estimator --------------------------
+        # One row per drone; any object with KalmanBank's interface (including
+        # row()) will do.
+        self.estimator = estimator if estimator is not None else KalmanBank(n_drones)
+        # Multipath and NLOS spikes are dropped before they reach it; pass
+        # an OutlierGate to change its limits, False to let every fix through.
+        self.outlier_gate = OutlierGate(n_drones) if outlier_gate is None else outlier_gate
+        self.drone_pos_filtered = np.zeros((n_drones, 3))
+        self.drone_fix_t = np.zeros(n_drones)  # arrival time of the fix behind drone_pos_filtered
+        self.drone_pos_predicted = np.zeros((n_drones, 3))
+        self.last_fix = None
+        self.unknown_tag_fixes = 0  # fixes from tags no drone is registered for
+        self.height_scale = 0.1  # flow-deck mm -> arena units (cm)
+
+        # -------------------------- Serial Reader Thread --------------------------
+        # The reader thread queues fixes and raises fixesAvailable; whoever
+        # drives the tracker calls update() in its own thread to drain them.
+        self.distance_read_check = True
+        self.decoder = PositionStreamDecoder()
+        self.recorder = recorder
+        self.reader = SerialReader(None, self.decoder, on_fixes=self.fixesAvailable.emit,
+                                   recorder=recorder)
 
-        self.ser = serial.Serial(
+        # autoconnect=False leaves the port and the GPU to a ConnectionManager,
+        # which calls open_serial() and init_compute() in the background.
+        if autoconnect:
+            if self.SERIAL_PORT is not None:
+                self.open_serial()
+            self.init_compute()
+
+    def open_serial(self, start_reader=True):
+        """
+        Opens the UWB serial port and starts a reader thread on it, unless
+        start_reader is False and an event loop reads it instead (see
+        async_io). Blocks for the port's settle time; raises
+        serial.SerialException on failure.
+        """
+        ser = serial.Serial(
             port=self.SERIAL_PORT,
             baudrate=self.BAUD_RATE,
             parity=serial.PARITY_NONE,
@@ -57,110 +140,297 @@ class DroneTracker(QObject):
             bytesize=serial.EIGHTBITS,
             timeout=1
         )
-
-        self.ser.flushInput()
-        self.ser.flushOutput()
+        ser.flushInput()
+        ser.flushOutput()
         time.sleep(0.2)
 
-        # ---------------------- CuPy Warm-up (Avoid Delays) ----------------------------
-        cp.cuda.Device(0).use()
-        cp.linalg.norm(cp.array([[1, 2, 3], [4, 5, 6]]), axis=1)
+        # A fresh reader per connection; the decoder carries over.
+        self.ser = ser
+        self.reader = SerialReader(ser, self.decoder, on_fixes=self.fixesAvailable.emit,
+                                   recorder=self.recorder,
+                                   on_error=lambda e: self.serialLost.emit(str(e)))
+        if start_reader:
+            self.reader.start()
 
-        # -------------------------- Low-Pass Filter Setup --------------------------
-        self.alpha = 0.50
-        self.drone_pos_filtered = np.array([0.0, 0.0, 0.0])
+    def close_serial(self):
+        self.reader.stop()
+        if self.reader.is_alive() and self.reader is not threading.current_thread():
+            self.reader.join(timeout=2.0)
+        if self.ser is not None and self.ser.is_open:
+            self.ser.close()
 
-        # -------------------------- Serial Read Buffer --------------------------
-        self.line_buffer = bytearray()
-        self.distance_read_check = True
+    def init_compute(self):
+        """
+        Moves multilateration to the GPU if use_gpu is set. Probing CUDA can
+        take seconds, so this may run in a background thread; the CPU solver
+        keeps working until the swap.
+        """
+        if self.use_gpu:
+            self.multilaterator = Multilaterator(self.arena.anchors, use_gpu=True, **self.solver_settings)
+        return self.multilaterator.backend
 
-        # -------------------------- Timer for Updates --------------------------
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update)
-        self.timer.start(50)  # 50 ms interval
-
-
-    def check_score(self):
-        if self.drone_pos[1] >= self.player1_line_y:
-            self.player1_score += 1
-            if self.player1_score_label is not None:
-                self.player1_score_label.setText(f"Player 1 Score: {self.player1_score}")
-            self.send_command(0x4A)
-            time.sleep(1)
-            
-            print("Player 1 Score")
-            # play_sound_non_blocking("wining.mp3")
-                
-        if self.drone_pos[1] <= self.player2_line_y:
-            self.player2_score += 1
-            if self.player2_score_label is not None:
-                self.player2_score_label.setText(f"Player 2 Score: {self.player2_score}")
-            self.send_command(0x4B)
-            print("Player 2 Score")
-            time.sleep(1)
-            # play_sound_non_blocking("wining.mp3")
-                
-        if self.drone_pos[0] >= self.virtual_wall_x:
-            self.virtual_wall = True
-            if self.virtual_wall_label is not None:
-                self.virtual_wall_label.setText(f"Virtual wall hit: {self.virtual_wall}")
-            
-            self.send_command(0xFF)  # Now calls the method below
-            print("Virtual wall hit")
-            time.sleep(3)
-            # play_sound_non_blocking("wining.mp3")
 
+    def build_rules(self, n_drones=1):
+        """
+        The arena's goal lines and walls as non-blocking line-crossing rules.
+        The cooldowns replace the old sleeps after each event; subscribers
+        (score labels, event streams) hear about them through ruleFired.
+        """
+        return RulesEngine(self.arena.line_rules(self.line_actions), n_drones=n_drones)
+
+    def line_actions(self, line):
+        """
+        Actions for one arena line: its score or wall effect, the ruleFired
+        event, its command byte and its sound.
+        """
+        actions = []
+        if line.get("score") == "player1":
+            actions.append(self.on_player1_goal)
+        elif line.get("score") == "player2":
+            actions.append(self.on_player2_goal)
+        if line.get("wall"):
+            actions.append(self.on_virtual_wall)
+        actions.append(self.publish_rule)
+        if line.get("command") is not None:
+            actions.append(command_action(self.send_command, line["command"]))
+        if line.get("sound") is not None and self.audio is not None:
+            actions.append(sound_action(self.audio.play, line["sound"]))
+        return actions
+
+    def on_player1_goal(self, rule, t, pos, drone):
+        self.player1_score += 1
+        log.info("Player 1 Score %s", self.registry[drone].name)
+
+    def on_player2_goal(self, rule, t, pos, drone):
+        self.player2_score += 1
+        log.info("Player 2 Score %s", self.registry[drone].name)
+
+    def on_virtual_wall(self, rule, t, pos, drone):
+        self.virtual_wall = True
+        log.info("Virtual wall hit %s", self.registry[drone].name)
+
+    def publish_rule(self, rule, t, pos, drone):
+        self.ruleFired.emit(rule.name, t, pos, drone)
+
+    def check_score(self, t, drone=0):
+        return self.rules.evaluate(t, self.drone_pos_predicted[drone], drone,
+                                   self.estimator.row(drone).v)
+
+    def refresh_latency_budget(self):
+        """
+        Feeds the command delays the dispatchers measured into the latency
+        budget: median time in the queue plus half the median ARM/HOVER/...
+        acknowledgement round trip for the radio, slowest drone first.
+        """
+        delays = []
+        for link in self.registry:
+            if link.telemetry is None:
+                continue
+            dispatcher = link.telemetry.dispatcher
+            queued = list(dispatcher.queue_latency)
+            acked = list(dispatcher.ack_latency)
+            if queued or acked:
+                delays.append((np.median(queued) if queued else 0.0) + (np.median(acked) / 2 if acked else 0.0))
+        if delays:
+            self.latency_budget.observe_command_latency(max(delays))
 
     def update(self):
-        # Process available data from the serial port.
-        while self.ser.in_waiting > 0:
-            char = self.ser.read(1)
-            if not char:
+        self.process_batch(self.take_fixes())
+
+    def take_fixes(self):
+        """
+        Drains the fixes queued so far; anything the reader adds meanwhile
+        comes with its own wake-up, so a fast feed cannot starve the caller.
+        """
+        fixes = self.reader.fixes
+        batch = []
+        # Popped until empty rather than len() times: the reader's appends
+        # evict the oldest entries when the queue is full.
+        for _ in range(len(fixes)):
+            try:
+                batch.append(fixes.popleft())
+            except IndexError:
                 break
+        return batch
+
+    def process_batch(self, batch):
+        """
+        Solves, filters, scores and publishes a batch of queued (t, fix) entries.
+        """
+        if not batch or not self.distance_read_check:
+            return
+
+        self.solve_ranges(batch)
+        self.process_fixes([(t, fix) for t, fix in batch if fix.pos is not None])
+
+    def solve_ranges(self, batch):
+        """
+        Solves every raw ranges frame in the batch with one vectorized call
+        and fills in its position. Unsolvable fixes keep pos set to None.
+        """
+        rows = [i for i, (t, fix) in enumerate(batch) if fix.pos is None and fix.ranges is not None]
+        if not rows:
+            return
+
+        n = self.multilaterator.n_anchors
+        ranges = np.full((len(rows), n), np.nan)
+        for row, i in enumerate(rows):
+            r = batch[i][1].ranges[:n]
+            ranges[row, :len(r)] = r
+
+        tags = [batch[i][1].tag for i in rows]
+        positions, rms, used = self.multilaterator.solve(ranges, tags)
+        # 2D solutions take the height from the drone's own estimate.
+        drones = self.registry.tag_indices(tags)
+        heights = np.where(drones >= 0, self.estimator.x[drones, 2], 0.0)
+        for i, xy, z in zip(rows, positions, heights):
+            if np.all(np.isfinite(xy)):
+                t, fix = batch[i]
+                pos = np.array([xy[0], xy[1], xy[2] if len(xy) > 2 else z])
+                batch[i] = (t, fix._replace(pos=pos))
+
+    def process_fix(self, t, fix):
+        self.process_fixes([(t, fix)])
+
+    def process_fixes(self, batch):
+        """
+        Filters, scores and publishes a batch of (t, fix) position fixes.
+
+        Fixes are demultiplexed by tag and handled in rounds in which every
+        drone appears at most once, oldest first, so each round is one
+        vectorized estimator update and one rules evaluation for all the
+        drones in it.
+        """
+        if not batch:
+            return
+        drones = self.registry.tag_indices([fix.tag for _, fix in batch])
+        known = np.flatnonzero(drones >= 0)
+        self.unknown_tag_fixes += len(batch) - len(known)
+        if not len(known):
+            return
 
-            if char == b'\n':
-                if self.distance_read_check:
-                    line_str = self.line_buffer.decode('utf-8').strip()
-                    self.line_buffer.clear()
-                    self.ser.flushInput()
-                    self.ser.flushOutput()
-
-                    if line_str:
-                        try:
-                            coords = eval(line_str)  # For safety, consider using json.loads instead.
-                            self.drone_pos = np.array(coords, dtype=float)
-                            self.drone_pos_filtered = (
-                                self.alpha * self.drone_pos_filtered + 
-                                (1 - self.alpha) * self.drone_pos
-                            )
-
-                            print("Drone Position (filtered):", self.drone_pos_filtered)
-                            self.check_score()
-                            
-                            # Emit the updated position via signal.
-                            self.dronePositionUpdated.emit(self.drone_pos_filtered)
-
-                        except Exception as e:
-                            print("Error parsing line:", e, "| Line was:", line_str)
-
-                else:
-                    self.line_buffer.clear()
+        # Round r holds each drone's r-th fix of the batch.
+        seen = {}
+        rank = np.empty(len(known), dtype=int)
+        for j, drone in enumerate(drones[known].tolist()):
+            rank[j] = seen[drone] = seen.get(drone, -1) + 1
+
+        if self.latency_budget is not None and self.clock() >= self._budget_refresh_at:
+            self._budget_refresh_at = self.clock() + 1.0
+            self.refresh_latency_budget()
+
+        for r in range(rank.max() + 1):
+            rows = known[rank == r]
+            if self.outlier_gate:
+                rows = self.reject_outliers(batch, rows, drones[rows])
+                if not len(rows):
+                    continue
+            idx = drones[rows]
+            if self.clock_follows_fixes:
+                self.clock.now = max(batch[i][0] for i in rows)
+            now = self.clock()
+            if len(rows) == 1:
+                # One drone: its own row filter is cheaper than the vectorized path.
+                drone = int(idx[0])
+                t, fix = batch[rows[0]]
+                t0 = time.perf_counter()
+                row = self.estimator.row(drone)
+                filtered = row.update(t, fix.pos)[None]
+                self.drone_pos_filtered[drone] = filtered[0]
+                self.drone_fix_t[drone] = t
+                # Score against where the drone is now, not where it was when the fix left the anchors.
+                self.drone_pos_predicted[drone] = row.predict(now)
+                t1 = time.perf_counter()
+                self.check_score(t, drone)
             else:
-                self.line_buffer.append(char[0])
+                t = np.array([batch[i][0] for i in rows])
+                pos = np.array([batch[i][1].pos for i in rows], dtype=float)
+                t0 = time.perf_counter()
+                filtered = self.estimator.update(idx, t, pos)
+                self.drone_pos_filtered[idx] = filtered
+                self.drone_fix_t[idx] = t
+                predicted = self.estimator.predict(idx, now)
+                self.drone_pos_predicted[idx] = predicted
+                t1 = time.perf_counter()
+                self.rules.evaluate_many(idx, t, predicted, self.estimator.v[idx])
+            self.update_zones(idx, t, filtered)
+            t2 = time.perf_counter()
+            FILTER_SECONDS.observe(t1 - t0)
+            RULES_SECONDS.observe(t2 - t1)
+
+            for drone, i, position in zip(idx.tolist(), rows, filtered):
+                self.last_fix = batch[i][1]
+                log.debug("%s position (filtered): %s", self.registry[drone].name, position)
+                FIX_AGE.observe(now - batch[i][0])
+                # Emit the updated position via signal.
+                self.dronePositionUpdated.emit(drone, position)
+            EMIT_SECONDS.observe(time.perf_counter() - t2)
+
+    def reject_outliers(self, batch, rows, idx):
+        """
+        The batch rows whose fixes pass the outlier gate; idx are their
+        drones, each at most once.
+        """
+        t0 = time.perf_counter()
+        if len(rows) == 1:
+            t, fix = batch[rows[0]]
+            accept = np.array([self.outlier_gate.check_one(int(idx[0]), t, fix.pos)])
+        else:
+            t = np.array([batch[i][0] for i in rows])
+            pos = np.array([batch[i][1].pos for i in rows], dtype=float)
+            accept = self.outlier_gate.check(idx, t, pos)
+        GATE_SECONDS.observe(time.perf_counter() - t0)
+        if accept.all():
+            return rows
+        for i, drone in zip(rows[~accept].tolist(), idx[~accept].tolist()):
+            log.debug("%s fix rejected as an outlier: %s", self.registry[drone].name, batch[i][1].pos)
+        return rows[accept]
+
+    def update_zones(self, idx, t, positions):
+        """
+        Looks the drones' positions up in the arena's zone index and reports
+        every zone entered or left, sending a zone's command on entry.
+        """
+        inside = self.arena.contains(positions)
+        changed = inside != self.zone_state[idx]
+        if not changed.any():
+            return
+        self.zone_state[idx] = inside
+        times = np.broadcast_to(t, (len(idx),))
+        names = self.arena.zone_names
+        for row, zone in zip(*np.nonzero(changed)):
+            drone, entered = int(idx[row]), bool(inside[row, zone])
+            self.zoneChanged.emit(names[zone], entered, float(times[row]), drone)
+            command = self.arena.zone_commands[zone]
+            if entered and command is not None:
+                self.send_command(command, drone)
+
+    def on_flow_deck(self, t, height_mm, yaw_deg, drone=0):
+        """
+        Receives a drone's onboard flow-deck height and IMU yaw from its CrazyflieTelemetry.
+        """
+        row = self.estimator.row(drone)
+        row.update_height(t, height_mm * self.height_scale)
+        row.update_yaw(t, yaw_deg)
+
+    def position_at(self, t=None, drone=0):
+        """
+        Estimated position of a drone at time t (default: now), for display and control.
+        """
+        return self.estimator.row(drone).predict(self.clock() if t is None else t)
 
     def stop(self):
-        self.timer.stop()
-        if self.ser.is_open:
-            self.ser.close()
+        self.close_serial()
 
     # -----------------------------------------------------------------
     #   This method calls the CrazyflieTelemetry object's send_command
     # -----------------------------------------------------------------
-    def send_command(self, value):
+    def send_command(self, value, drone=0):
         """
-        Forward commands to the CrazyflieTelemetry object if available.
+        Forward commands to the drone's CrazyflieTelemetry object if available.
         """
-        if self.cfTelemetry is not None:
-            self.cfTelemetry.send_command(value)
+        telemetry = self.registry[drone].telemetry
+        if telemetry is not None:
+            telemetry.send_command(value)
         else:
-            print("No CrazyflieTelemetry instance available to handle the command.")
+            log.warning("No CrazyflieTelemetry instance available to handle the command.")
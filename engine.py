@@ -0,0 +1,401 @@
+# engine.py
+
+import json
+import queue
+import threading
+from collections import deque
+
+from events import Signal
+from metrics import METRICS
+from drone_registry import DroneRegistry, DEFAULT_TOC_CACHE
+from drone_tracker import DroneTracker
+from connection_manager import ConnectionManager, CONNECTED
+from telemetry_protocol import V2_VERSION
+from crazyflie_telemetry import yaw_degrees
+from outliers import OutlierGate
+from fusion import StateFusion
+from audio import AudioEngine
+from control import ControlLoop, make_behavior
+
+# Event types an EventQueue can subscribe to.
+EVENT_KINDS = ("position", "rule", "zone", "connection", "message", "telemetry", "state")
+DEFAULT_EVENT_KINDS = ("position", "rule", "zone", "connection", "message")
+
+
+class TrackingEngine:
+    """
+    The game without the GUI: acquisition -> parse -> estimate -> rules -> command.
+
+    Serial fixes and flow-deck samples are queued by the reader and radio
+    threads and applied in arrival order by one engine thread, so the
+    tracker's state is only ever touched from that thread and no Qt event
+    loop sits on the hot path. Results go out through plain callbacks:
+
+        positionUpdated(drone, pos)         filtered position, engine thread
+        ruleFired(rule name, t, pos, drone) goal / wall events, engine thread
+        zoneChanged(zone, inside, t, drone) arena zone entered or left
+        telemetryReceived(drone, n)         ring sample n stored, radio thread
+        stateFused(state)                   fusion.FusedState: UWB x, y with onboard
+                                            height, yaw and nearest obstacle
+        telemetryMessage(drone, text)       link status and sent commands
+        connectionChanged(name, state)      see connection_manager
+
+    subscribe() turns them into a queue for consumers in other threads.
+    MainForm is one subscriber; `program.py --headless` runs the engine on
+    its own and streams the events as JSON lines.
+
+    With control settings, a control.ControlLoop steers every drone the
+    GUI puts into DIRECTIONAL from its tracked position, in a thread of
+    its own at a fixed rate.
+    """
+
+    def __init__(self, drones, serial_port=None, baud_rate=460800, recorder=None,
+                 toc_cache=DEFAULT_TOC_CACHE, telemetry_format=V2_VERSION, use_gpu=False, scoring=None,
+                 arena=None, outliers=None, fusion=None, audio=None, control=None, multilateration=None):
+        self.registry = DroneRegistry.from_config(drones, recorder=recorder, toc_cache=toc_cache,
+                                                  telemetry_format=telemetry_format, connect=False)
+        # Effects are decoded here, once; None plays nothing.
+        self.audio = None
+        if audio is not None:
+            settings = dict(audio)
+            if settings.pop("enabled", True):
+                self.audio = AudioEngine(**settings)
+        gate = None
+        if outliers is not None:
+            settings = dict(outliers)
+            gate = OutlierGate(len(self.registry), **settings) if settings.pop("enabled", True) else False
+        self.tracker = DroneTracker(serial_port=serial_port, baud_rate=baud_rate, recorder=recorder,
+                                    registry=self.registry, use_gpu=use_gpu, autoconnect=False,
+                                    arena=arena, outlier_gate=gate, audio=self.audio,
+                                    multilateration=multilateration, **(scoring or {}))
+        self.connections = ConnectionManager()
+        self.fusion = StateFusion(self.registry, height_scale=self.tracker.height_scale, **(fusion or {}))
+        # Velocity setpoints for drones in DIRECTIONAL; None leaves them be.
+        self.control = None
+        if control is not None:
+            settings = dict(control)
+            behavior = settings.pop("behavior", {})
+            if settings.pop("enabled", True):
+                self.control = ControlLoop(self.tracker, make_behavior(self.tracker.arena, **behavior), **settings)
+
+        self.positionUpdated = self.tracker.dronePositionUpdated
+        self.ruleFired = self.tracker.ruleFired
+        self.zoneChanged = self.tracker.zoneChanged
+        self.connectionChanged = self.connections.stateChanged
+        self.telemetryReceived = Signal()
+        self.telemetryMessage = Signal()
+        self.stateFused = self.fusion.stateFused
+        # EventQueues handed out by subscribe(), exported as one queue.
+        self.subscriptions = []
+
+        # (drone, t, height_mm, yaw_deg) from the radio threads
+        self._flow = deque()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._started = False
+
+        self.tracker.fixesAvailable.connect(self._wake.set)
+        tracker = self.tracker
+        self.positionUpdated.connect(lambda drone, pos: self.fusion.add_position(
+            drone, float(tracker.drone_fix_t[drone]), pos))
+        for i, link in enumerate(self.registry):
+            telemetry = link.telemetry
+            telemetry.flowDeckUpdated.connect(lambda t, h, yaw, drone=i: self.queue_flow_deck(drone, t, h, yaw))
+            telemetry.telemetryReceived.connect(lambda n, drone=i: self.telemetryReceived.emit(drone, n))
+            telemetry.telemetryUpdated.connect(lambda text, drone=i: self.telemetryMessage.emit(drone, text))
+
+        # Radio links, the serial port and the GPU come up in parallel in the
+        # background; dropped links reconnect with exponential backoff.
+        for link in self.registry:
+            if link.uri is None:
+                continue
+            name = f"radio:{link.name}"
+            self.connections.add(name, link.telemetry.open_link, link.telemetry.close_link)
+            link.telemetry.connectionLost.connect(lambda msg, name=name: self.connections.report_lost(name, msg))
+        if serial_port is not None:
+            self.connections.add("serial", self.tracker.open_serial, self.tracker.close_serial)
+            self.tracker.serialLost.connect(lambda msg: self.connections.report_lost("serial", msg))
+        self.connections.add("compute", self.tracker.init_compute, retry=False)
+        self.register_metrics()
+
+    def register_metrics(self, metrics=METRICS):
+        """
+        Exports the counters the reader, decoder, tracker and radio links
+        already keep. They are read at export time, so none of this costs
+        anything on the hot path.
+        """
+        tracker = self.tracker
+        decoder = tracker.decoder
+        metrics.counter("fixes_total", "Position fixes decoded from the serial feed",
+                        fn=lambda: decoder.frames + decoder.text_lines)
+        metrics.counter("serial_bytes_total", "Bytes read from the serial port",
+                        fn=lambda: tracker.reader.bytes_read)
+        metrics.counter("parse_errors_total", "Corrupted frames and lines", {"kind": "crc"},
+                        fn=lambda: decoder.crc_errors)
+        metrics.counter("parse_errors_total", "Corrupted frames and lines", {"kind": "text"},
+                        fn=lambda: decoder.text_errors)
+        metrics.counter("skipped_bytes_total", "Bytes discarded while resynchronizing",
+                        fn=lambda: decoder.skipped_bytes)
+        metrics.counter("frames_lost_total", "Fixes missing from the per-tag sequence numbers",
+                        fn=lambda: decoder.sequence.lost)
+        metrics.counter("frames_dropped_total", "Fixes dropped by a full reader queue",
+                        fn=lambda: tracker.reader.dropped_fixes)
+        metrics.counter("unknown_tag_fixes_total", "Fixes from tags no drone is registered for",
+                        fn=lambda: tracker.unknown_tag_fixes)
+        metrics.counter("fixes_rejected_total", "Fixes dropped as outliers", {"reason": "residual"},
+                        fn=lambda: tracker.multilaterator.rejected)
+        gate = tracker.outlier_gate
+        if gate:
+            metrics.counter("fixes_rejected_total", "Fixes dropped as outliers", {"reason": "hampel"},
+                            fn=lambda: gate.rejected_hampel)
+            metrics.counter("fixes_rejected_total", "Fixes dropped as outliers", {"reason": "speed"},
+                            fn=lambda: gate.rejected_speed)
+            metrics.counter("position_jumps_total", "Sustained position jumps accepted by the outlier gate",
+                            fn=lambda: gate.jumps)
+        rules = tracker.rules
+        metrics.counter("rule_triggers_total", "Rules fired", {"mode": "reactive"}, fn=lambda: rules.reactive)
+        metrics.counter("rule_triggers_total", "Rules fired", {"mode": "predicted"}, fn=lambda: rules.predicted)
+        metrics.counter("rule_predictions_confirmed_total", "Early firings followed by the crossing",
+                        fn=lambda: rules.confirmed)
+        metrics.counter("rule_false_triggers_total", "Early firings without a crossing",
+                        fn=lambda: rules.false_triggers)
+        metrics.gauge("rule_false_trigger_rate", "Share of settled early firings that were false",
+                      fn=lambda: rules.false_trigger_rate)
+        if tracker.latency_budget is not None:
+            budget = tracker.latency_budget
+            metrics.gauge("latency_budget_seconds", "How far ahead of a crossing rules fire",
+                          fn=lambda: budget.horizon)
+        metrics.gauge("queue_depth", "Items waiting in a hand-over queue", {"queue": "fixes"},
+                      fn=lambda: len(tracker.reader.fixes))
+        metrics.gauge("queue_depth", "Items waiting in a hand-over queue", {"queue": "flow"},
+                      fn=lambda: len(self._flow))
+        for link in self.registry:
+            telemetry = link.telemetry
+            labels = {"drone": link.name}
+            metrics.counter("telemetry_packets_total", "Telemetry packets received", labels,
+                            fn=lambda t=telemetry: t.link_stats.packets + t.link_stats.v1_packets)
+            metrics.counter("telemetry_samples_lost_total", "Telemetry samples missing from v2 sequence numbers",
+                            labels, fn=lambda t=telemetry: t.link_stats.lost)
+            metrics.counter("commands_sent_total", "Command packets sent", labels,
+                            fn=lambda t=telemetry: t.dispatcher.sent)
+            metrics.gauge("queue_depth", "Items waiting in a hand-over queue", {"queue": f"commands:{link.name}"},
+                          fn=lambda t=telemetry: sum(len(lane) for lane in t.dispatcher.lanes))
+        if self.audio is not None:
+            audio = self.audio
+            metrics.counter("sounds_played_total", "Sound effects started", fn=lambda: audio.played)
+            metrics.counter("sounds_dropped_total", "Sound triggers dropped by a full queue",
+                            fn=lambda: audio.dropped)
+        if self.control is not None:
+            control = self.control
+            metrics.counter("control_ticks_total", "Closed-loop control ticks run", fn=lambda: control.ticks)
+            metrics.counter("control_deadline_misses_total", "Control ticks that overran or were skipped",
+                            fn=lambda: control.deadline_misses)
+            metrics.counter("control_setpoints_total", "Velocity setpoints sent", fn=lambda: control.setpoints)
+        fusion = self.fusion
+        metrics.counter("fused_states_held_total", "Fused states published without telemetry up to their fix",
+                        fn=lambda: fusion.held)
+        links = self.connections.links
+        for name in links:
+            metrics.gauge("connected", "1 while a link is connected", {"link": name},
+                          fn=lambda name=name: int(links[name].state == CONNECTED))
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread=True):
+        """
+        Starts the engine thread and the connection manager; does nothing
+        if the engine was already started. thread=False leaves calling
+        process_pending() to someone else, e.g. async_io.AsyncEngine.
+        """
+        if self._started:
+            return
+        self._started = True
+        self._stop_event.clear()
+        if thread:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="engine")
+            self._thread.start()
+        if self.audio is not None:
+            self.audio.start()
+        if self.control is not None:
+            self.control.start()
+        self.connections.start()
+
+    def stop(self):
+        if self.control is not None:
+            self.control.stop()
+        self.connections.stop()
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        self._started = False
+        # Whatever arrived after the thread's last pass, e.g. the end of a replay.
+        self.process_pending()
+        self.tracker.stop()
+        self.registry.close()
+        if self.audio is not None:
+            self.audio.stop()
+
+    def emergency_stop(self):
+        """
+        Lands every drone and stops reading fixes. Closed-loop control is
+        stopped first and each link refuses setpoints from then on, so
+        none can follow the LAND.
+        """
+        if self.control is not None:
+            self.control.stop()
+        for link in self.registry:
+            link.telemetry.emergency_stop()
+        self.tracker.stop()
+
+    def send_command(self, value, drone=0):
+        self.tracker.send_command(value, drone)
+
+    def queue_flow_deck(self, drone, t, height_mm, yaw_deg):
+        self._flow.append((drone, t, height_mm, yaw_deg))
+        self._wake.set()
+
+    def process_pending(self):
+        """
+        Applies the queued flow-deck samples and fixes in time order, so the
+        filter never sees a measurement older than one it already has. Runs
+        in the engine thread; call it directly only while that is not running.
+        """
+        tracker = self.tracker
+        flow = self._flow
+        samples = [flow.popleft() for _ in range(len(flow))]
+        batch = tracker.take_fixes()
+        start = 0
+        for drone, t, height_mm, yaw_deg in samples:
+            end = start
+            while end < len(batch) and batch[end][0] <= t:
+                end += 1
+            if end > start:
+                tracker.process_batch(batch[start:end])
+                start = end
+            tracker.on_flow_deck(t, height_mm, yaw_deg, drone)
+        tracker.process_batch(batch[start:])
+        self.fusion.flush()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            # Woken by new data, or when a fused state is due regardless.
+            self._wake.wait(self.fusion.timeout())
+            # Clear before draining so data queued meanwhile wakes us again.
+            self._wake.clear()
+            self.process_pending()
+
+    def subscribe(self, kinds=DEFAULT_EVENT_KINDS, maxsize=10000):
+        """
+        An EventQueue receiving the given kinds of events as dicts.
+        """
+        events = EventQueue(maxsize)
+        subscriptions = self.subscriptions
+        subscriptions.append(events)
+        # Summed over every subscription, so registering again for a
+        # second one keeps counting the first.
+        METRICS.gauge("queue_depth", "Items waiting in a hand-over queue", {"queue": "events"},
+                      fn=lambda: sum(q.qsize() for q in subscriptions))
+        METRICS.counter("events_dropped_total", "Events dropped by a full subscriber queue",
+                        fn=lambda: sum(q.dropped for q in subscriptions))
+        names = self.registry.names
+        if "position" in kinds:
+            self.positionUpdated.connect(lambda drone, pos: events.offer(
+                {"type": "position", "t": self.tracker.clock(), "drone": names[drone], "pos": pos.tolist()}))
+        if "rule" in kinds:
+            self.ruleFired.connect(lambda rule, t, pos, drone: events.offer(
+                {"type": "rule", "t": t, "drone": names[drone], "rule": rule, "pos": pos.tolist(),
+                 "score": [self.tracker.player1_score, self.tracker.player2_score]}))
+        if "zone" in kinds:
+            self.zoneChanged.connect(lambda zone, inside, t, drone: events.offer(
+                {"type": "zone", "t": t, "drone": names[drone], "zone": zone, "inside": inside}))
+        if "connection" in kinds:
+            self.connectionChanged.connect(lambda name, state: events.offer(
+                {"type": "connection", "t": self.tracker.clock(), "link": name, "state": state}))
+        if "message" in kinds:
+            self.telemetryMessage.connect(lambda drone, text: events.offer(
+                {"type": "message", "t": self.tracker.clock(), "drone": names[drone], "text": text.strip()}))
+        if "telemetry" in kinds:
+            self.telemetryReceived.connect(lambda drone, n: events.offer(
+                {"type": "telemetry", "drone": drone, "sample": n}))
+        if "state" in kinds:
+            self.stateFused.connect(lambda state: events.offer(
+                {"type": "state", "t": state.t, "drone": names[state.drone], "pos": [state.x, state.y, state.z],
+                 "yaw": state.yaw, "obstacle": state.obstacle, "obstacle_direction": state.obstacle_direction,
+                 "telemetry_age": state.telemetry_age}))
+        return events
+
+
+class EventQueue(queue.Queue):
+    """
+    Bounded event queue filled from engine and radio threads. offer() never
+    blocks the producer: when the consumer falls behind, new events are
+    dropped and counted.
+    """
+
+    def __init__(self, maxsize=10000):
+        super().__init__(maxsize)
+        self.dropped = 0
+
+    def offer(self, event):
+        try:
+            self.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonLinesWriter(threading.Thread):
+    """
+    Writes events from an EventQueue to a file object, one JSON object per
+    line, from its own thread so slow output never stalls the engine.
+    Telemetry events are expanded from the drone's ring here, off the
+    radio thread.
+    """
+
+    def __init__(self, events, out, registry=None):
+        super().__init__(daemon=True)
+        self.events = events
+        self.out = out
+        self.registry = registry
+        self.written = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                event = self.events.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    break
+                continue
+            if event["type"] == "telemetry":
+                event = self.expand_telemetry(event)
+                if event is None:
+                    continue
+            self.out.write(json.dumps(event) + "\n")
+            self.written += 1
+            if self.events.empty():
+                self.out.flush()
+        self.out.flush()
+
+    def expand_telemetry(self, event):
+        link = self.registry[event["drone"]]
+        rec = link.telemetry.record(event["sample"])
+        if rec is None:
+            return None
+        event.update(drone=link.name, t=float(rec['t']), flags=int(rec['flags']),
+                     multiranger=rec['multiranger'].tolist(), height=int(rec['height']),
+                     yaw=round(float(yaw_degrees(int(rec['yaw']))), 2))
+        return event
+
+    def stop(self):
+        """
+        Writes out what is still queued, then ends the thread.
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout=2.0)
@@ -0,0 +1,296 @@
+# estimator.py
+
+import numpy as np
+
+# Rows of the Kalman state: three position axes plus the heading.
+AXIS_X, AXIS_Y, AXIS_Z, AXIS_YAW = range(4)
+
+
+class LowPassEstimator:
+    """
+    Fixed-alpha exponential average, the tracker's original filter.
+    It has no motion model, so prediction just returns the last estimate.
+    """
+
+    def __init__(self, alpha=0.50):
+        self.alpha = alpha
+        self.position = np.zeros(3)
+        self.velocity = np.zeros(3)
+        self.yaw = 0.0
+
+    def update(self, t, pos):
+        self.position = self.alpha * self.position + (1 - self.alpha) * pos
+        return self.position
+
+    def update_height(self, t, z):
+        pass
+
+    def update_yaw(self, t, yaw):
+        self.yaw = yaw
+
+    def predict(self, t):
+        return self.position
+
+
+class KalmanEstimator:
+    """
+    Constant-velocity Kalman filter over x, y, z and yaw.
+
+    The axes are independent under this model, so each one is a two-state
+    (value, rate) filter and all four run side by side as NumPy vectors. The
+    symmetric 2x2 covariances are kept as three preallocated component arrays
+    (p00, p01, p11) and updated in place. Every measurement carries its own
+    timestamp; the state is propagated to it before the correction, so UWB
+    fixes, flow-deck heights and IMU yaw can arrive interleaved and at
+    different rates. predict() extrapolates the position to any later time
+    without touching the state, capped at max_horizon seconds.
+
+    Given a KalmanBank and a row, the filter works on views of that row of
+    the bank's arrays (and takes the bank's noise settings), so one drone
+    can be updated on its own without the cost of fancy indexing.
+    """
+
+    def __init__(self, accel_noise=200.0, position_noise=10.0, height_noise=1.0,
+                 yaw_accel_noise=360.0, yaw_noise=2.0, max_horizon=0.2, bank=None, row=0):
+        if bank is None:
+            bank = KalmanBank(1, accel_noise, position_noise, height_noise,
+                              yaw_accel_noise, yaw_noise, max_horizon)
+        # Process noise (acceleration std dev) and measurement std devs per axis.
+        self.accel_var = bank.accel_var
+        self.position_var = bank.position_var
+        self.height_var = bank.height_var
+        self.yaw_var = bank.yaw_var
+        self.max_horizon = bank.max_horizon
+
+        # -------------------------- State / Covariance --------------------------
+        self.x = bank.x[row]
+        self.v = bank.v[row]
+        self.p00 = bank.p00[row]
+        self.p01 = bank.p01[row]
+        self.p11 = bank.p11[row]
+        self.initialized = bank.initialized[row]
+        self._t = bank.t[row:row + 1]  # NaN until the first measurement
+
+        # Scratch buffer reused by every step.
+        self._tmp = np.zeros(4)
+        self._pos_axes = slice(AXIS_X, AXIS_Z + 1)
+
+    @property
+    def position(self):
+        return self.x[:3].copy()
+
+    @property
+    def velocity(self):
+        return self.v[:3].copy()
+
+    @property
+    def yaw(self):
+        return self.x[AXIS_YAW] % 360.0
+
+    @property
+    def t(self):
+        t = self._t[0]
+        return None if t != t else float(t)
+
+    def update(self, t, pos):
+        """
+        Fuses a UWB position fix taken at time t.
+        """
+        self._propagate(t)
+        self._correct(self._pos_axes, np.asarray(pos, dtype=float)[:3], self.position_var)
+        return self.position
+
+    def update_height(self, t, z):
+        """
+        Fuses a flow-deck height, already scaled to position units.
+        """
+        self._propagate(t)
+        self._correct(AXIS_Z, z, self.height_var)
+
+    def update_yaw(self, t, yaw):
+        """
+        Fuses an IMU heading in degrees; the innovation is wrapped to +-180.
+        """
+        self._propagate(t)
+        if self.initialized[AXIS_YAW]:
+            yaw = self.x[AXIS_YAW] + (yaw - self.x[AXIS_YAW] + 180.0) % 360.0 - 180.0
+        self._correct(AXIS_YAW, yaw, self.yaw_var)
+
+    def predict(self, t):
+        """
+        Position extrapolated to time t along the current velocity.
+        """
+        last = self._t[0]
+        if last != last:
+            return self.position
+        dt = min(max(t - last, 0.0), self.max_horizon)
+        return self.x[:3] + self.v[:3] * dt
+
+    def _propagate(self, t):
+        last = self._t[0]
+        if last != last:
+            self._t[0] = t
+            return
+        dt = t - last
+        if dt <= 0.0:
+            return
+        self._t[0] = t
+
+        # x <- F x,  P <- F P F^T + Q  with F = [[1, dt], [0, 1]]
+        q = self.accel_var
+        self.x += self.v * dt
+        np.multiply(self.p11, dt * dt, out=self._tmp)
+        self.p00 += 2.0 * dt * self.p01 + self._tmp + q * (dt ** 4 / 4.0)
+        self.p01 += dt * self.p11 + q * (dt ** 3 / 2.0)
+        self.p11 += q * (dt * dt)
+
+    def _correct(self, axes, z, r):
+        # Axes seen for the first time start at the measurement with zero velocity.
+        fresh = ~self.initialized[axes]
+        if np.any(fresh):
+            self.x[axes] = np.where(fresh, z, self.x[axes])
+            self.v[axes] = np.where(fresh, 0.0, self.v[axes])
+            self.p00[axes] = np.where(fresh, r, self.p00[axes])
+            self.p01[axes] = np.where(fresh, 0.0, self.p01[axes])
+            self.p11[axes] = np.where(fresh, self.accel_var[axes], self.p11[axes])
+            self.initialized[axes] = True
+
+        # Scalar measurement H = [1, 0] on each axis.
+        s = self.p00[axes] + r
+        k0 = self.p00[axes] / s
+        k1 = self.p01[axes] / s
+        innovation = z - self.x[axes]
+        self.x[axes] += k0 * innovation
+        self.v[axes] += k1 * innovation
+        self.p11[axes] -= k1 * self.p01[axes]
+        self.p01[axes] *= 1.0 - k0
+        self.p00[axes] *= 1.0 - k0
+
+
+class KalmanBank:
+    """
+    KalmanEstimator's filter for n drones at once.
+
+    Each drone is one row of (n, 4) state and covariance arrays, so a set
+    of fixes for different drones is propagated and corrected with the
+    same handful of NumPy operations whatever n is. Every call takes an
+    array of distinct drone indices with matching timestamps and
+    measurements; a drone may appear only once per call. row(i) is a
+    KalmanEstimator on drone i's row, the cheaper way to update one drone.
+    """
+
+    def __init__(self, n, accel_noise=200.0, position_noise=10.0, height_noise=1.0,
+                 yaw_accel_noise=360.0, yaw_noise=2.0, max_horizon=0.2):
+        self.accel_var = np.array([accel_noise, accel_noise, accel_noise, yaw_accel_noise]) ** 2
+        self.position_var = position_noise ** 2
+        self.height_var = height_noise ** 2
+        self.yaw_var = yaw_noise ** 2
+        self.max_horizon = max_horizon
+
+        # -------------------------- State / Covariance --------------------------
+        self.x = np.zeros((n, 4))
+        self.v = np.zeros((n, 4))
+        self.p00 = np.zeros((n, 4))
+        self.p01 = np.zeros((n, 4))
+        self.p11 = np.zeros((n, 4))
+        self.initialized = np.zeros((n, 4), dtype=bool)
+        self.t = np.full(n, np.nan)
+        self._pos_axes = slice(AXIS_X, AXIS_Z + 1)
+        self.rows = [KalmanEstimator(bank=self, row=i) for i in range(n)]
+
+    def __len__(self):
+        return len(self.x)
+
+    def row(self, i):
+        return self.rows[i]
+
+    @property
+    def positions(self):
+        return self.x[:, :3].copy()
+
+    @property
+    def velocities(self):
+        return self.v[:, :3].copy()
+
+    @property
+    def yaws(self):
+        return self.x[:, AXIS_YAW] % 360.0
+
+    def update(self, drones, t, pos):
+        """
+        Fuses one UWB fix (k, 3) per drone; returns the (k, 3) estimates.
+        """
+        drones = np.asarray(drones, dtype=int)
+        self._propagate(drones, t)
+        self._correct(drones, self._pos_axes, np.asarray(pos, dtype=float)[:, :3], self.position_var)
+        return self.x[drones, :3]
+
+    def update_height(self, drones, t, z):
+        drones = np.asarray(drones, dtype=int)
+        self._propagate(drones, t)
+        self._correct(drones, AXIS_Z, np.asarray(z, dtype=float), self.height_var)
+
+    def update_yaw(self, drones, t, yaw):
+        """
+        Fuses IMU headings in degrees; innovations are wrapped to +-180.
+        """
+        drones = np.asarray(drones, dtype=int)
+        self._propagate(drones, t)
+        yaw = np.asarray(yaw, dtype=float)
+        current = self.x[drones, AXIS_YAW]
+        yaw = np.where(self.initialized[drones, AXIS_YAW],
+                       current + (yaw - current + 180.0) % 360.0 - 180.0, yaw)
+        self._correct(drones, AXIS_YAW, yaw, self.yaw_var)
+
+    def predict(self, drones, t):
+        """
+        Positions of the given drones extrapolated to time(s) t.
+        """
+        drones = np.asarray(drones, dtype=int)
+        dt = np.asarray(t, dtype=float) - self.t[drones]
+        dt = np.clip(np.nan_to_num(dt), 0.0, self.max_horizon)
+        return self.x[drones, :3] + self.v[drones, :3] * dt[..., None]
+
+    def _propagate(self, drones, t):
+        prev = self.t[drones]
+        first = np.isnan(prev)
+        dt = np.where(first, 0.0, np.asarray(t, dtype=float) - prev)
+        dt = np.maximum(dt, 0.0)
+        self.t[drones] = np.where(first | (dt > 0.0), t, prev)
+
+        # x <- F x,  P <- F P F^T + Q  with F = [[1, dt], [0, 1]], per row
+        d = dt[:, None]
+        q = self.accel_var
+        p01 = self.p01[drones]
+        p11 = self.p11[drones]
+        self.x[drones] += self.v[drones] * d
+        self.p00[drones] += 2.0 * d * p01 + p11 * d * d + q * (d ** 4 / 4.0)
+        self.p01[drones] = p01 + d * p11 + q * (d ** 3 / 2.0)
+        self.p11[drones] = p11 + q * (d * d)
+
+    def _correct(self, drones, axes, z, r):
+        x = self.x[drones, axes]
+        v = self.v[drones, axes]
+        p00 = self.p00[drones, axes]
+        p01 = self.p01[drones, axes]
+        p11 = self.p11[drones, axes]
+
+        # Axes seen for the first time start at the measurement with zero velocity.
+        fresh = ~self.initialized[drones, axes]
+        if np.any(fresh):
+            x = np.where(fresh, z, x)
+            v = np.where(fresh, 0.0, v)
+            p00 = np.where(fresh, r, p00)
+            p01 = np.where(fresh, 0.0, p01)
+            p11 = np.where(fresh, self.accel_var[axes], p11)
+            self.initialized[drones, axes] = True
+
+        s = p00 + r
+        k0 = p00 / s
+        k1 = p01 / s
+        innovation = z - x
+        self.x[drones, axes] = x + k0 * innovation
+        self.v[drones, axes] = v + k1 * innovation
+        self.p11[drones, axes] = p11 - k1 * p01
+        self.p01[drones, axes] = p01 * (1.0 - k0)
+        self.p00[drones, axes] = p00 * (1.0 - k0)
@@ -0,0 +1,39 @@
+# events.py
+
+import threading
+
+
+class Signal:
+    """
+    Plain callback list with the connect/disconnect/emit names of a Qt
+    signal, so the core modules run without a Qt event loop.
+
+    emit() calls every callback synchronously in the emitting thread, which
+    may be a reader, radio or engine thread. A subscriber that needs another
+    thread (e.g. the GUI) forwards the call itself; see qt_bridge.
+    """
+
+    def __init__(self):
+        self._callbacks = ()
+        self._lock = threading.Lock()
+
+    def connect(self, callback):
+        with self._lock:
+            self._callbacks = self._callbacks + (callback,)
+
+    def disconnect(self, callback=None):
+        """
+        Removes one callback, or all of them when called without one.
+        """
+        with self._lock:
+            if callback is None:
+                self._callbacks = ()
+            else:
+                callbacks = list(self._callbacks)
+                callbacks.remove(callback)
+                self._callbacks = tuple(callbacks)
+
+    def emit(self, *args):
+        # The tuple is replaced, never mutated, so no lock on the hot path.
+        for callback in self._callbacks:
+            callback(*args)
@@ -0,0 +1,144 @@
+# fusion.py
+
+import math
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+from events import Signal
+from metrics import METRICS
+from crazyflie_telemetry import yaw_degrees
+
+ALIGNMENT_SECONDS = METRICS.histogram("fusion_alignment_seconds",
+                                      "Time from a UWB fix to its fused state being published")
+
+# Multiranger readings in ring order, and the distance (mm) at or beyond
+# which a sensor sees nothing.
+RANGE_DIRECTIONS = ("front", "back", "left", "right", "up")
+MAX_RANGE_MM = 4000
+
+# One drone's state at the time t of a UWB fix: x, y from UWB (filtered),
+# z from the flow deck and yaw (degrees) from the IMU, both interpolated
+# to t, and the nearest multiranger obstacle (mm, NaN if none) with its
+# direction. telemetry_age is how far t lies past the newest telemetry
+# sample used (0 when it was interpolated, inf when there was none);
+# z falls back to the UWB height when there is no telemetry.
+FusedState = namedtuple('FusedState', ['t', 'drone', 'x', 'y', 'z', 'yaw', 'obstacle', 'obstacle_direction',
+                                       'telemetry_age'])
+
+
+class StateFusion:
+    """
+    Joins each drone's UWB positions with its onboard telemetry into one
+    stream of FusedStates, emitted through stateFused(state).
+
+    Both streams are stamped with the monotonic clock on arrival: fixes by
+    the serial reader, telemetry samples in CrazyflieTelemetry's ring,
+    which already is a time-indexed ring buffer per drone. A fix waits
+    until a telemetry sample at or after its time has arrived, so the
+    onboard values can be interpolated to it, but never longer than
+    max_latency: then it goes out with the newest values held. When a
+    drone's telemetry is older than stale_after, nothing is waited for.
+
+    Runs in the engine thread; flush() must be called whenever telemetry
+    arrives and at least every timeout() seconds.
+    """
+
+    def __init__(self, registry, max_latency=0.05, stale_after=0.5, height_scale=0.1, window=64,
+                 clock=time.monotonic):
+        self.registry = registry
+        self.max_latency = max_latency
+        self.stale_after = stale_after
+        self.height_scale = height_scale  # flow-deck mm -> arena units (cm)
+        self.window = window              # telemetry samples searched per join
+        self.clock = clock
+        self.stateFused = Signal()
+        self.pending = [deque() for _ in range(len(registry))]
+        self.latest = [None] * len(registry)
+        self.held = 0  # states published without telemetry after their fix
+
+    def add_position(self, drone, t, pos):
+        self.pending[drone].append((t, pos))
+        self.flush(drone)
+
+    def flush(self, drone=None, now=None):
+        """
+        Publishes every pending fix whose telemetry has arrived or whose
+        deadline has passed, for one drone or all of them.
+        """
+        now = self.clock() if now is None else now
+        for d in range(len(self.pending)) if drone is None else (drone,):
+            pending = self.pending[d]
+            if not pending:
+                continue
+            newest = self.newest_telemetry(d)
+            while pending:
+                t, pos = pending[0]
+                if newest is not None and newest < t and t - newest < self.stale_after \
+                        and now - t < self.max_latency:
+                    break
+                pending.popleft()
+                self.publish(d, t, pos, now)
+
+    def timeout(self):
+        """
+        Seconds until the oldest pending fix is due, or None.
+        """
+        due = [pending[0][0] + self.max_latency for pending in self.pending if pending]
+        if not due:
+            return None
+        return max(0.0, min(due) - self.clock())
+
+    def newest_telemetry(self, drone):
+        telemetry = self.registry[drone].telemetry
+        if telemetry is None or not telemetry.count:
+            return None
+        return float(telemetry.record(telemetry.count - 1)['t'])
+
+    def publish(self, drone, t, pos, now):
+        state = self.join(drone, t, pos)
+        if state.telemetry_age > 0.0:
+            self.held += 1
+        self.latest[drone] = state
+        ALIGNMENT_SECONDS.observe(now - t)
+        self.stateFused.emit(state)
+
+    def join(self, drone, t, pos):
+        """
+        The FusedState of a drone at fix time t.
+        """
+        telemetry = self.registry[drone].telemetry
+        rec = telemetry.recent(self.window) if telemetry is not None else ()
+        if not len(rec):
+            return FusedState(t, drone, float(pos[0]), float(pos[1]), float(pos[2]), math.nan, math.nan, None,
+                              math.inf)
+
+        ts = rec['t']
+        i = int(np.searchsorted(ts, t))
+        if i == 0 or i == len(ts):
+            # Before the window or past the newest sample: hold the nearest.
+            k = min(i, len(ts) - 1)
+            height = float(rec['height'][k])
+            yaw = float(yaw_degrees(int(rec['yaw'][k])))
+            ranges = rec['multiranger'][k]
+            age = max(0.0, t - float(ts[k]))
+        else:
+            a, b = rec[i - 1], rec[i]
+            span = float(b['t'] - a['t'])
+            w = (t - float(a['t'])) / span if span > 0.0 else 1.0
+            height = float(a['height']) + (float(b['height']) - float(a['height'])) * w
+            yaw_a = float(yaw_degrees(int(a['yaw'])))
+            yaw_b = float(yaw_degrees(int(b['yaw'])))
+            yaw = (yaw_a + ((yaw_b - yaw_a + 180.0) % 360.0 - 180.0) * w) % 360.0
+            ranges = a['multiranger'] if w < 0.5 else b['multiranger']
+            age = 0.0
+
+        nearest = int(np.argmin(ranges))
+        distance = float(ranges[nearest])
+        if distance >= MAX_RANGE_MM:
+            obstacle, direction = math.nan, None
+        else:
+            obstacle, direction = distance, RANGE_DIRECTIONS[nearest]
+        return FusedState(t, drone, float(pos[0]), float(pos[1]), height * self.height_scale, yaw,
+                          obstacle, direction, age)
@@ -0,0 +1,276 @@
+# game_rules.py
+
+import numpy as np
+
+from metrics import METRICS
+
+# Long enough that a line behaves like the old infinite x/y thresholds.
+LINE_EXTENT = 10000.0
+
+LEAD_SECONDS = METRICS.histogram("rule_lead_seconds", "Forecast time to crossing when a rule fired early")
+
+
+class LineCrossingRule:
+    """
+    Fires its actions when the drone crosses the segment start -> end.
+
+    direction picks which crossings count: +1 only into the left-hand side
+    of start -> end, -1 only into the right-hand side, 0 either way. The
+    drone has to get at least `hysteresis` away from the line on the far
+    side before a crossing is confirmed, and after firing the rule stays
+    quiet for `cooldown` seconds, per drone. Each action is called as
+    action(rule, t, pos, drone) with the index of the drone that crossed.
+    """
+
+    def __init__(self, name, start, end, actions=(), direction=0, cooldown=1.0, hysteresis=2.0):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.actions = list(actions)
+        self.direction = direction
+        self.cooldown = cooldown
+        self.hysteresis = hysteresis
+
+
+def horizontal_line(name, y, actions=(), direction=0, **kwargs):
+    """
+    A rule on the line y = const. direction +1 fires moving towards +y.
+    """
+    return LineCrossingRule(name, (-LINE_EXTENT, y), (LINE_EXTENT, y), actions, direction, **kwargs)
+
+
+def vertical_line(name, x, actions=(), direction=0, **kwargs):
+    """
+    A rule on the line x = const. direction +1 fires moving towards +x.
+    """
+    return LineCrossingRule(name, (x, LINE_EXTENT), (x, -LINE_EXTENT), actions, direction, **kwargs)
+
+
+# -----------------------------------------------------------------
+#   Actions
+# -----------------------------------------------------------------
+def command_action(send_command, value):
+    """
+    Sends a command byte to the drone that fired the rule, e.g. through
+    DroneTracker.send_command.
+    """
+    return lambda rule, t, pos, drone: send_command(value, drone)
+
+
+def label_action(get_label, text):
+    """
+    Sets a label's text. get_label is called each time so labels attached
+    after the rules were built still work; text may be a callable.
+    """
+    def action(rule, t, pos, drone):
+        label = get_label()
+        if label is not None:
+            label.setText(text() if callable(text) else text)
+    return action
+
+
+def sound_action(play, sound):
+    """
+    Plays a sound through the given non-blocking player, e.g.
+    audio.AudioEngine.play with an effect name.
+    """
+    return lambda rule, t, pos, drone: play(sound)
+
+
+class LatencyBudget:
+    """
+    How long before a crossing a boundary command has to leave for the
+    drone to get it in time: the anchors' delay before a fix reaches the
+    serial port (uwb_latency, configured, as the host cannot measure it),
+    the measured command delay from submit to the drone, and a tunable
+    extra lead_time. The fix's age on the host is not part of it, since
+    rules already see positions extrapolated to the present.
+    """
+
+    def __init__(self, uwb_latency=0.0, lead_time=0.0, command_latency=0.0, smoothing=0.2):
+        self.uwb_latency = uwb_latency
+        self.lead_time = lead_time
+        self.command_latency = command_latency
+        self.smoothing = smoothing
+
+    def observe_command_latency(self, seconds):
+        """
+        Folds a measured command delay into an exponential average.
+        """
+        self.command_latency += self.smoothing * (seconds - self.command_latency)
+
+    @property
+    def horizon(self):
+        return self.uwb_latency + self.command_latency + self.lead_time
+
+
+class RulesEngine:
+    """
+    Evaluates every line-crossing rule against new fixes at once.
+
+    The rule segments live in (R, 2) arrays and the per-drone state in
+    (D, R) arrays, so a set of fixes from different drones costs a handful
+    of NumPy operations however many rules and drones there are. For each
+    drone and rule the engine remembers the last fix that was clearly on
+    one side of the line; a crossing is the segment from that point to the
+    new fix intersecting the rule segment. Nothing here blocks: cooldowns
+    are timestamps compared against the fix time.
+
+    With a LatencyBudget the engine is predictive: given the drones'
+    velocities it forecasts when each will cross each line and fires as
+    soon as that is within budget.horizon seconds, so the command reaches
+    the drone at the line rather than past it. An early firing is
+    confirmed when the drone then actually crosses; if it has not crossed
+    within confirm_margin seconds after the forecast time, it counts as a
+    false trigger. Crossings nobody forecast still fire when they happen.
+    """
+
+    def __init__(self, rules=(), n_drones=1, budget=None, confirm_margin=0.25):
+        self.rules = []
+        self.n_drones = n_drones
+        self.budget = budget
+        self.confirm_margin = confirm_margin
+        for rule in rules:
+            self.rules.append(rule)
+
+        self.reactive = 0          # fired on an actual crossing
+        self.predicted = 0         # fired ahead of a forecast crossing
+        self.confirmed = 0         # forecasts the drone then followed
+        self.false_triggers = 0    # forecasts it did not
+        self._compile()
+
+    def add_rule(self, rule):
+        self.rules.append(rule)
+        self._compile()
+
+    def reset(self):
+        """
+        Forgets which side of each line every drone was on and all cooldowns.
+        """
+        shape = (self.n_drones, len(self.rules))
+        self.anchor = np.full(shape + (2,), np.nan)
+        self.anchor_side = np.zeros(shape)
+        self.last_fired = np.full(shape, -np.inf)
+        # Until when an early firing waits for its crossing, -inf if none.
+        self.pending_until = np.full(shape, -np.inf)
+
+    @property
+    def false_trigger_rate(self):
+        """
+        Share of settled early firings that were false triggers.
+        """
+        settled = self.confirmed + self.false_triggers
+        return self.false_triggers / settled if settled else 0.0
+
+    def _compile(self):
+        rules = self.rules
+        self.start = np.array([r.start for r in rules], dtype=float).reshape(-1, 2)
+        self.end = np.array([r.end for r in rules], dtype=float).reshape(-1, 2)
+        self.edge = self.end - self.start
+        self.edge_len = np.hypot(self.edge[:, 0], self.edge[:, 1])
+        self.direction = np.array([r.direction for r in rules], dtype=float)
+        self.cooldown = np.array([r.cooldown for r in rules], dtype=float)
+        self.hysteresis = np.array([r.hysteresis for r in rules], dtype=float)
+        self.reset()
+
+    def evaluate(self, t, pos, drone=0, vel=None):
+        """
+        Checks one drone's fix at time t against every rule and runs the
+        actions of those that fire. Returns the list of rules that fired.
+        vel, the drone's velocity, enables firing ahead of a crossing.
+        """
+        # A one-row slice keeps the state lookups as cheap views.
+        fired = self._evaluate(slice(drone, drone + 1), [drone], [t], [pos],
+                               None if vel is None else [vel])
+        return [rule for _, rule in fired]
+
+    def evaluate_many(self, drones, t, pos, vel=None):
+        """
+        Checks fixes (k, >=2) of k distinct drones taken at times t (k,),
+        with their velocities (k, >=2) if given. Returns (drone, rule) for
+        every rule that fired, after running its actions.
+        """
+        drones = np.asarray(drones, dtype=int)
+        return self._evaluate(drones, drones, t, pos, vel)
+
+    def _evaluate(self, rows, drones, t, pos, vel=None):
+        t = np.asarray(t, dtype=float)[:, None]
+        pos = np.asarray(pos, dtype=float)
+        x, y = pos[:, 0:1], pos[:, 1:2]
+        start, end, edge = self.start, self.end, self.edge
+
+        # Signed distance from each line; positive is the left-hand side.
+        dist = (edge[:, 0] * (y - start[:, 1]) - edge[:, 1] * (x - start[:, 0])) / self.edge_len
+        side = np.sign(dist)
+        clear = np.abs(dist) >= self.hysteresis
+
+        # Does the segment anchor -> pos separate the two ends of the rule segment?
+        anchor = self.anchor[rows]
+        ax, ay = anchor[..., 0], anchor[..., 1]
+        dx = x - ax
+        dy = y - ay
+        o_start = dx * (start[:, 1] - ay) - dy * (start[:, 0] - ax)
+        o_end = dx * (end[:, 1] - ay) - dy * (end[:, 0] - ax)
+
+        anchor_side = self.anchor_side[rows]
+        last_fired = self.last_fired[rows]
+        crossed = clear & (anchor_side != 0) & (side != anchor_side) & (o_start * o_end <= 0)
+        crossed &= (self.direction == 0) | (side == self.direction)
+        ready = t - last_fired >= self.cooldown
+        fired = crossed & ready
+        early = None
+
+        if self.budget is not None and vel is not None:
+            # Settle earlier forecasts: crossed means confirmed, running out
+            # of time without crossing means a false trigger.
+            pending_until = self.pending_until[rows]
+            waiting = pending_until > -np.inf
+            confirmed = crossed & waiting
+            missed = waiting & ~crossed & (pending_until < t)
+            self.confirmed += int(np.count_nonzero(confirmed))
+            self.false_triggers += int(np.count_nonzero(missed))
+            fired &= ~waiting
+            waiting &= ~(confirmed | missed)
+
+            # Time until the drone reaches each line at its current velocity.
+            vel = np.asarray(vel, dtype=float)
+            vx, vy = vel[:, 0:1], vel[:, 1:2]
+            rate = (edge[:, 0] * vy - edge[:, 1] * vx) / self.edge_len
+            with np.errstate(divide='ignore', invalid='ignore'):
+                to_cross = -dist / rate
+                # The forecast crossing point has to lie on the rule segment.
+                fx = x + vx * to_cross
+                fy = y + vy * to_cross
+                along = ((fx - start[:, 0]) * edge[:, 0] + (fy - start[:, 1]) * edge[:, 1]) / self.edge_len ** 2
+                early = (anchor_side != 0) & (side == anchor_side) & (rate * anchor_side < 0)
+                early &= to_cross <= self.budget.horizon
+                early &= (along >= 0.0) & (along <= 1.0)
+            early &= (self.direction == 0) | (-anchor_side == self.direction)
+            early &= ready & ~waiting & ~fired
+
+            self.pending_until[rows] = np.where(early, t + to_cross + self.confirm_margin,
+                                                np.where(waiting, pending_until, -np.inf))
+
+        self.anchor[rows] = np.where(clear[..., None], pos[:, None, :2], anchor)
+        self.anchor_side[rows] = np.where(clear, side, anchor_side)
+        self.last_fired[rows] = np.where(fired if early is None else fired | early, t, last_fired)
+
+        fired_rules = []
+        for row, col in zip(*np.nonzero(fired)):
+            self.reactive += 1
+            fired_rules.append(self._fire(col, drones[row], t[row, 0], pos[row]))
+        if early is not None:
+            for row, col in zip(*np.nonzero(early)):
+                self.predicted += 1
+                LEAD_SECONDS.observe(to_cross[row, col])
+                # Actions see the forecast crossing point.
+                point = pos[row].copy()
+                point[:2] = fx[row, col], fy[row, col]
+                fired_rules.append(self._fire(col, drones[row], t[row, 0], point))
+        return fired_rules
+
+    def _fire(self, col, drone, t, pos):
+        rule, drone = self.rules[col], int(drone)
+        for action in rule.actions:
+            action(rule, t, pos, drone)
+        return drone, rule
@@ -0,0 +1,126 @@
+# log_view.py
+
+from collections import deque
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QCheckBox
+
+# Message types shown as filter check boxes, in display order.
+LOG_KINDS = (
+    ("packet", "Packets"),
+    ("command", "Commands"),
+    ("status", "Status"),
+)
+
+
+class LogView(QWidget):
+    """
+    Read-only message log with bounded memory and a fixed redraw rate.
+
+    Entries go into a ring of the last `capacity` messages and are drawn at
+    most once per `frame_ms`, in a single append, however fast they arrive.
+    An entry is either a string or a key handed to the formatter registered
+    for its kind, so e.g. telemetry packets are only turned into text when
+    they are actually drawn. The text document is capped at `max_lines`.
+    Pausing stops redraws but keeps collecting; the view catches up from
+    the ring on resume, and toggling a filter redraws from the ring too.
+    """
+
+    def __init__(self, parent=None, capacity=1000, max_lines=5000, frame_ms=33, formatters=None):
+        super().__init__(parent)
+        self.entries = deque(maxlen=capacity)
+        self.pending = deque(maxlen=capacity)
+        self.formatters = dict(formatters or {})
+        self.shown = {kind for kind, _ in LOG_KINDS}
+        self.paused = False
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+        controls = QHBoxLayout()
+        layout.addLayout(controls)
+        self.chkPause = QCheckBox("Pause")
+        self.chkPause.toggled.connect(self.set_paused)
+        controls.addWidget(self.chkPause)
+        self.filter_boxes = {}
+        for kind, label in LOG_KINDS:
+            box = QCheckBox(label)
+            box.setChecked(True)
+            box.toggled.connect(lambda checked, k=kind: self.set_kind_shown(k, checked))
+            controls.addWidget(box)
+            self.filter_boxes[kind] = box
+        controls.addStretch()
+
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setMaximumBlockCount(max_lines)
+        layout.addWidget(self.text)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(frame_ms)
+        self._timer.timeout.connect(self.flush)
+
+    def setPlaceholderText(self, text):
+        self.text.setPlaceholderText(text)
+
+    def append(self, kind, entry):
+        """
+        Queues one message; it is drawn with the next frame.
+        """
+        item = (kind, entry)
+        self.entries.append(item)
+        self.pending.append(item)
+        if not self.paused and not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        """
+        Draws everything queued since the last frame in one go.
+        """
+        if self.paused or not self.pending:
+            return
+        lines = self._render(self.pending)
+        self.pending.clear()
+        if lines:
+            self.text.appendPlainText("\n".join(lines))
+
+    def _render(self, items):
+        lines = []
+        for kind, entry in items:
+            if kind not in self.shown:
+                continue
+            if not isinstance(entry, str):
+                entry = self.formatters[kind](entry)
+                if entry is None:
+                    continue
+            lines.append(entry[:-1] if entry.endswith("\n") else entry)
+        return lines
+
+    def redraw(self):
+        """
+        Rebuilds the text from the ring, e.g. after a filter change.
+        """
+        self.pending.clear()
+        self.text.setPlainText("\n".join(self._render(self.entries)))
+        self.text.moveCursor(QTextCursor.End)
+
+    def set_paused(self, paused):
+        self.paused = paused
+        if not paused:
+            self.redraw()
+
+    def set_kind_shown(self, kind, shown):
+        if shown:
+            self.shown.add(kind)
+        else:
+            self.shown.discard(kind)
+        if not self.paused:
+            self.redraw()
+
+    def clear(self):
+        self.entries.clear()
+        self.pending.clear()
+        self.text.clear()
@@ -1,18 +1,35 @@
 # main_form.py
 
+import time
+import logging
+
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QPushButton, QMessageBox, QTextEdit
+    QLabel, QPushButton, QMessageBox, QComboBox, QDockWidget
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 
 import pyqtgraph as pg
 
-from drone_tracker import DroneTracker
-from crazyflie_telemetry import CrazyflieTelemetry, STATE_COMMANDS
+from engine import TrackingEngine
+from qt_bridge import EngineBridge
+from crazyflie_telemetry import STATE_COMMANDS, DEFAULT_URI
+from drone_registry import DEFAULT_TOC_CACHE
+from connection_manager import CONNECTED
+from telemetry_protocol import V2_VERSION
+from log_view import LogView
+from plots import TrailPlot, TelemetryCharts, draw_arena
+from stats_panel import StatsPanel
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+PLOT_SECONDS = METRICS.stage("plot")
 
 class MainForm(QMainWindow):
-    def __init__(self):
+    def __init__(self, serial_port='COM26', radio_uri=DEFAULT_URI, recorder=None,
+                 baud_rate=460800, crazyflie=None, drones=None, toc_cache=DEFAULT_TOC_CACHE,
+                 telemetry_format=V2_VERSION, engine=None):
         super().__init__()
         self.setWindowTitle('Real-Time Drone Tracking and Telemetry')
         self.resize(900, 700)
@@ -38,34 +55,44 @@ class MainForm(QMainWindow):
         score_layout.addWidget(self.lblVirtualWall)
         main_layout.addLayout(score_layout)
 
+        # Radio link quality of the selected drone, and the state of every connection
+        self.lblLinkStats = QLabel("Link: no telemetry")
+        main_layout.addWidget(self.lblLinkStats)
+        self.lblConnections = QLabel("Connections: starting")
+        main_layout.addWidget(self.lblConnections)
+
         # --------------------- Plot Widget ---------------------
         self.plot_widget = pg.PlotWidget(title='Drone X-Y Position')
         self.plot_widget.setLabel('left', 'Y Position')
         self.plot_widget.setLabel('bottom', 'X Position')
         self.plot_widget.showGrid(x=True, y=True)
-        main_layout.addWidget(self.plot_widget)
-
-        # Example anchors (adjust to your actual anchor positions if needed)
-        anchors = [
-            [452, 190],
-            [0,   80],
-            [2,   287],
-            [4,   493],
-            [295, 570],
-            [289, 0]
-        ]
-        anchor_x = [p[0] for p in anchors]
-        anchor_y = [p[1] for p in anchors]
-        self.plot_widget.plot(anchor_x, anchor_y, pen=None, symbol='x', symbolSize=12)
-
-        # Example boundary rectangle
-        rectangle_x = [0,   5,   295, 289, 0]
-        rectangle_y = [0, 573, 570,   0,   0]
-        rect_item = pg.PlotDataItem(rectangle_x, rectangle_y, connect='all', pen=pg.mkPen(color='g', width=1))
-        self.plot_widget.addItem(rect_item)
-
-        # Drone position plot
-        self.drone_curve = self.plot_widget.plot([], [], pen=None, symbol='o', symbolSize=10)
+        plots_layout = QHBoxLayout()
+        plots_layout.addWidget(self.plot_widget, 3)
+        main_layout.addLayout(plots_layout)
+
+        # --------------------- Tracking Engine ---------------------
+        # The window only subscribes to the engine; tracking, scoring and
+        # telemetry run without it (see engine.py). Without an engine one is
+        # built for `drones`: {"name", "uri", "tag"} entries, by default the
+        # single drone on radio_uri carrying tag 0.
+        if engine is None:
+            if drones is None:
+                drones = [{"name": "drone1", "uri": radio_uri, "tag": 0, "crazyflie": crazyflie}]
+            engine = TrackingEngine(drones, serial_port=serial_port, baud_rate=baud_rate, recorder=recorder,
+                                    toc_cache=toc_cache, telemetry_format=telemetry_format)
+        self.engine = engine
+        self.registry = engine.registry
+        self.drone_tracker = engine.tracker
+        self.connections = engine.connections
+        self.cfTelemetry = self.registry[0].telemetry
+        self.selected_drone = 0
+
+        # Anchors, boundary, lines and zones from the arena the tracker scores against
+        draw_arena(self.plot_widget, self.drone_tracker.arena)
+
+        # Each drone's position and its recent trail
+        self.trails = [TrailPlot(self.plot_widget, color=pg.intColor(i, hues=max(len(self.registry), 6)))
+                       for i in range(len(self.registry))]
 
         # --------------------- Buttons and Layouts ---------------------
         # Emergency Stop
@@ -77,6 +104,12 @@ class MainForm(QMainWindow):
         self.cfButtonsLayout = QHBoxLayout()
         main_layout.addLayout(self.cfButtonsLayout)
 
+        # Drone the buttons and strip charts apply to
+        self.cmbDrone = QComboBox()
+        self.cmbDrone.addItems(self.registry.names)
+        self.cmbDrone.currentIndexChanged.connect(self.on_drone_selected)
+        self.cfButtonsLayout.addWidget(self.cmbDrone)
+
         # Connect button (optional – see notes below)
         self.btnCfConnect = QPushButton("Connect")
         self.btnCfConnect.clicked.connect(self.on_cf_connect)
@@ -88,70 +121,141 @@ class MainForm(QMainWindow):
             btn.clicked.connect(lambda checked, v=val: self.on_cf_command(v))
             self.cfButtonsLayout.addWidget(btn)
 
+        # --------------------- Stats Panel ---------------------
+        # Stage latencies, rates and queue depths from metrics.METRICS
+        self.statsPanel = StatsPanel()
+        self.statsDock = QDockWidget("Stats", self)
+        self.statsDock.setWidget(self.statsPanel)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.statsDock)
+        self.statsDock.hide()
+        self.btnStats = QPushButton("Stats")
+        self.btnStats.setCheckable(True)
+        self.btnStats.toggled.connect(self.statsDock.setVisible)
+        self.statsDock.visibilityChanged.connect(self.btnStats.setChecked)
+        self.cfButtonsLayout.addWidget(self.btnStats)
+
         # --------------------- Telemetry Text Box ---------------------
-        self.telemetryText = QTextEdit()
-        self.telemetryText.setReadOnly(True)
-        self.telemetryText.setPlaceholderText("Crazyflie telemetry messages appear here...")
-        main_layout.addWidget(self.telemetryText)
-
-        # --------------------- Crazyflie Telemetry ---------------------
-        # 1) Create the CrazyflieTelemetry object
-        self.cfTelemetry = CrazyflieTelemetry()
-        self.cfTelemetry.telemetryUpdated.connect(self.append_telemetry_text)
-
-        # --------------------- DroneTracker Setup ----------------------
-        # 2) Pass it to DroneTracker so send_command() calls will work
-        self.drone_tracker = DroneTracker(cfTelemetry=self.cfTelemetry)
-        self.drone_tracker.player1_score_label = self.lblPlayer1Score
-        self.drone_tracker.player2_score_label = self.lblPlayer2Score
-        self.drone_tracker.virtual_wall_label  = self.lblVirtualWall
-
-        # Connect the drone tracker’s position update signal to our plot
-        self.drone_tracker.dronePositionUpdated.connect(self.update_drone_position)
+        self.telemetryLog = LogView()
+        self.telemetryLog.setPlaceholderText("Crazyflie telemetry messages appear here...")
+        main_layout.addWidget(self.telemetryLog)
+
+        # Strip charts read the selected drone's telemetry ring directly
+        self.telemetryCharts = TelemetryCharts(self.cfTelemetry)
+        plots_layout.addWidget(self.telemetryCharts, 2)
+
+        # --------------------- Engine Events ---------------------
+        # Delivered in the GUI thread through the bridge's queued signals;
+        # positions and telemetry once per frame
+        self.bridge = EngineBridge(engine, self)
+        self.bridge.positionUpdated.connect(self.update_drone_position)
+        self.bridge.ruleFired.connect(self.on_rule_fired)
+        self.bridge.telemetryReceived.connect(self.on_telemetry_packet)
+        self.bridge.telemetryMessage.connect(self.append_telemetry_text)
+        self.bridge.connectionChanged.connect(self.on_connection_state)
+        self.telemetryLog.formatters["packet"] = self.format_packet
+
+        # Plots are redrawn at a capped frame rate, not per sample
+        self.plot_timer = QTimer(self)
+        self.plot_timer.timeout.connect(self.refresh_plots)
+        self.plot_timer.start(33)
+
+        # Link statistics change slowly; a couple of updates a second is plenty
+        self.link_timer = QTimer(self)
+        self.link_timer.timeout.connect(self.refresh_link_stats)
+        self.link_timer.start(500)
+
+        # Devices connect in the background, so the window shows at once
+        self.connections_ready = False
+        self.engine.start()
 
     # -----------------------------------------------------------------
     #                           Callbacks
     # -----------------------------------------------------------------
     def on_emergency_stop(self):
         """
-        Stop the drone tracker updates and show an alert.
+        Land every drone, stop the drone tracker updates and show an alert.
         """
-        self.drone_tracker.stop()
+        self.engine.emergency_stop()
         QMessageBox.warning(self, "Emergency", "Emergency stop activated. Drone tracking halted!")
 
     def on_cf_connect(self):
         """
-        Optional: If your CrazyflieTelemetry class implements a 'connect()' method,
-        you can call it here to re-initialize the link or handle reconnection logic.
+        Closes and reopens the selected drone's radio link.
         """
-        # For example, if you created a method inside CrazyflieTelemetry:
-        #    def connect(self):
-        #        self.cf.open_link("radio://...")
-        #
-        # Then here you could do:
-        #    self.cfTelemetry.connect()
-        #
-        # If not, you can remove or repurpose this button.
-        pass
+        self.connections.reconnect(f"radio:{self.registry[self.selected_drone].name}")
+
+    def on_connection_state(self, name, state):
+        self.lblConnections.setText(f"Connections: {self.connections.summary()}")
+        if state == CONNECTED and not self.connections_ready and self.connections.all_connected():
+            self.connections_ready = True
+            log.info("All connections up %.2f s after start", self.connections.time_to_ready())
 
     def on_cf_command(self, command):
         """
-        Sends a state command to the Crazyflie (ARM, UNARM, etc.).
+        Sends a state command to the selected Crazyflie (ARM, UNARM, etc.).
+        """
+        self.engine.send_command(command, self.selected_drone)
+
+    def on_drone_selected(self, index):
+        """
+        Points the command buttons and strip charts at another drone.
         """
-        self.cfTelemetry.send_command(command)
+        self.selected_drone = index
+        self.telemetryCharts.set_telemetry(self.registry[index].telemetry)
 
     # -----------------------------------------------------------------
     #                          Utilities
     # -----------------------------------------------------------------
-    def update_drone_position(self, pos):
+    def update_drone_position(self, drone, pos):
+        """
+        Receives a drone's newest filtered position, once per bridge frame;
+        drawn on the next plot frame.
+        """
+        self.trails[drone].add(self.drone_tracker.clock(), pos)
+
+    def refresh_plots(self):
+        t0 = time.perf_counter()
+        for trail in self.trails:
+            trail.refresh()
+        self.telemetryCharts.refresh()
+        PLOT_SECONDS.observe(time.perf_counter() - t0)
+
+    def refresh_link_stats(self):
+        link = self.registry[self.selected_drone]
+        self.lblLinkStats.setText(f"Link ({link.name}): {link.telemetry.link_stats.summary()}")
+
+    def on_telemetry_packet(self, drone, n, count):
+        """
+        Queues the drone's telemetry samples up to n for the log, at most as
+        many as it keeps; they are formatted from the ring only when the log
+        draws them.
+        """
+        log_view = self.telemetryLog
+        for k in range(max(n - count, n - log_view.entries.maxlen) + 1, n + 1):
+            log_view.append("packet", (drone, k))
+
+    def format_packet(self, key):
+        drone, n = key
+        text = self.registry[drone].telemetry.format_packet(n)
+        if text is not None and len(self.registry) > 1:
+            text = f"[Drone ] {self.registry[drone].name}\n" + text
+        return text
+
+    def on_rule_fired(self, rule, drone):
         """
-        Receives filtered position from DroneTracker and updates the plot.
+        Updates the scoreboard after a goal or wall event.
         """
-        x_val, y_val = pos[0], pos[1]
-        self.drone_curve.setData([x_val], [y_val])
+        tracker = self.drone_tracker
+        if rule == "player1_goal":
+            self.lblPlayer1Score.setText(f"Player 1 Score: {tracker.player1_score}")
+        elif rule == "player2_goal":
+            self.lblPlayer2Score.setText(f"Player 2 Score: {tracker.player2_score}")
+        elif rule == "virtual_wall":
+            self.lblVirtualWall.setText(f"Virtual wall hit: {tracker.virtual_wall}")
 
-    def append_telemetry_text(self, text):
+    def append_telemetry_text(self, drone, text):
         """
-        Appends messages from CrazyflieTelemetry to the QTextEdit.
+        Appends messages from CrazyflieTelemetry to the telemetry log.
         """
-        self.telemetryText.append(text)
+        kind = "command" if text.startswith("[Sent]") else "status"
+        self.telemetryLog.append(kind, text)
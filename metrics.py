@@ -0,0 +1,296 @@
+# metrics.py
+
+import os
+import bisect
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Stage latency buckets in seconds: 10 us .. 5 s in 1-2.5-5 steps.
+LATENCY_BUCKETS = tuple(m * 10.0 ** e for e in range(-5, 1) for m in (1.0, 2.5, 5.0))
+
+PREFIX = "dronepong_"
+
+
+class Counter:
+    """
+    Monotonic count. With fn the value is read from fn() at export time,
+    which lets existing counters (e.g. SerialReader.fixes_read) be
+    exported without touching the hot path at all.
+    """
+
+    kind = "counter"
+
+    def __init__(self, fn=None):
+        self.fn = fn
+        self._value = 0
+
+    def inc(self, n=1):
+        self._value += n
+
+    @property
+    def value(self):
+        return self.fn() if self.fn is not None else self._value
+
+
+class Gauge(Counter):
+    """
+    A value that goes up and down, e.g. a queue depth.
+    """
+
+    kind = "gauge"
+
+    def set(self, value):
+        self._value = value
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. observe() is one bisect and two additions, no
+    lock: a value recorded concurrently from two threads may very rarely
+    be lost, which is fine for monitoring.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """
+        Estimated q-quantile, interpolated within its bucket as Prometheus'
+        histogram_quantile() does; None when nothing was observed.
+        """
+        counts = list(self.counts)
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """
+    Named metrics, optionally labelled, exported in the Prometheus text
+    format. Asking for an existing name and labels returns the same
+    metric; passing fn replaces the callback, so an object rebuilt on
+    reconnect simply re-registers.
+    """
+
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self.help = {}
+        self.metrics = {}   # (name, labels) -> metric
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, fn=None, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            metric = self.metrics.get(key)
+            if metric is None:
+                metric = self.metrics[key] = cls(**kwargs) if cls is Histogram else cls(fn)
+                self.help.setdefault(name, help)
+            elif fn is not None:
+                metric.fn = fn
+        return metric
+
+    def counter(self, name, help="", labels=None, fn=None):
+        return self._get(Counter, name, help, labels, fn)
+
+    def gauge(self, name, help="", labels=None, fn=None):
+        return self._get(Gauge, name, help, labels, fn)
+
+    def histogram(self, name, help="", labels=None, buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def stage(self, stage):
+        """
+        The latency histogram of one hot-path stage.
+        """
+        return self.histogram("stage_seconds", "Time spent per call in a hot-path stage",
+                              {"stage": stage})
+
+    def remove(self, name, labels=None):
+        with self._lock:
+            self.metrics.pop((name, tuple(sorted((labels or {}).items()))), None)
+
+    def collect(self):
+        """
+        (name, labels, metric) for every metric, sorted by name.
+        """
+        with self._lock:
+            items = sorted(self.metrics.items(), key=lambda item: item[0])
+        return [(name, dict(labels), metric) for (name, labels), metric in items]
+
+    def prometheus_text(self):
+        lines = []
+        last = None
+        for name, labels, metric in self.collect():
+            full = self.prefix + name
+            if name != last:
+                if self.help.get(name):
+                    lines.append(f"# HELP {full} {self.help[name]}")
+                lines.append(f"# TYPE {full} {metric.kind}")
+                last = name
+            try:
+                if metric.kind == "histogram":
+                    lines.extend(self._histogram_lines(full, labels, metric))
+                else:
+                    lines.append(f"{full}{_labels(labels)} {_number(metric.value)}")
+            except Exception:
+                # A callback whose object has gone away; skip it.
+                continue
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _histogram_lines(full, labels, metric):
+        counts = list(metric.counts)
+        cumulative = 0
+        for bound, n in zip(metric.buckets, counts):
+            cumulative += n
+            yield f"{full}_bucket{_labels(labels, le=_number(bound))} {cumulative}"
+        cumulative += counts[-1]
+        yield f"{full}_bucket{_labels(labels, le='+Inf')} {cumulative}"
+        yield f"{full}_sum{_labels(labels)} {_number(metric.sum)}"
+        yield f"{full}_count{_labels(labels)} {cumulative}"
+
+
+def _labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    text = ",".join(f'{k}="{_escape(v)}"' for k, v in items)
+    return "{" + text + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Shared by every module, like a logging root logger.
+METRICS = MetricsRegistry()
+
+
+def write_prometheus(path, registry=METRICS):
+    """
+    Writes the registry to a file atomically, e.g. for node_exporter's
+    textfile collector.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(registry.prometheus_text())
+    os.replace(tmp, path)
+
+
+class MetricsFileWriter(threading.Thread):
+    """
+    Rewrites a Prometheus text file every `interval` seconds, and once
+    more on stop().
+    """
+
+    def __init__(self, path, interval=5.0, registry=METRICS):
+        super().__init__(daemon=True, name="metrics-file")
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            write_prometheus(self.path, self.registry)
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout=2.0)
+        write_prometheus(self.path, self.registry)
+
+
+class MetricsServer:
+    """
+    Serves the registry at http://host:port/metrics from a daemon thread.
+    Binds to localhost unless told otherwise.
+    """
+
+    def __init__(self, port=9108, host="127.0.0.1", registry=METRICS):
+        registry_ = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry_.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="metrics-http")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class RateMeter:
+    """
+    Per-second rates of counters between two calls of rates(); for
+    displays. A counter that went backwards (its object was rebuilt)
+    counts from zero.
+    """
+
+    def __init__(self):
+        self._last = {}
+        self._last_t = None
+
+    def rates(self, registry=METRICS):
+        now = time.monotonic()
+        dt = now - self._last_t if self._last_t is not None else None
+        self._last_t = now
+        rates = {}
+        for name, labels, metric in registry.collect():
+            if metric.kind != "counter":
+                continue
+            key = (name, tuple(sorted(labels.items())))
+            try:
+                value = metric.value
+            except Exception:
+                continue
+            previous = self._last.get(key)
+            self._last[key] = value
+            if dt and previous is not None:
+                rates[key] = (value - previous if value >= previous else value) / dt
+        return rates
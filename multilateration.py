@@ -0,0 +1,204 @@
+# multilateration.py
+
+import numpy as np
+
+try:
+    import cupy as cp
+except ImportError:
+    cp = None
+
+# Anchor positions in arena units (x, y). Shared by the solver and the plot.
+DEFAULT_ANCHORS = [
+    [452, 190],
+    [0,   80],
+    [2,   287],
+    [4,   493],
+    [295, 570],
+    [289, 0]
+]
+
+
+def gpu_available():
+    """
+    True when CuPy is installed and can see at least one CUDA device.
+    """
+    if cp is None:
+        return False
+    try:
+        return cp.cuda.runtime.getDeviceCount() > 0
+    except Exception:
+        return False
+
+
+class Multilaterator:
+    """
+    Solves tag positions from raw anchor ranges, vectorized over batches.
+
+    Each fix is one row of ranges, one column per anchor, with NaN for an
+    anchor that did not answer. A closed-form linear least-squares solution
+    seeds a few Gauss-Newton iterations on the true range residuals, which
+    are skipped when every range already fits within linear_tolerance.
+    Rows with too few anchors for the closed form are seeded with the tag's
+    last solution instead. Anchors whose residual exceeds max_residual are
+    dropped one at a time while enough anchors remain.
+
+    A fix is rejected (NaN, counted in `rejected`) when the RMS residual of
+    the anchors kept exceeds max_rms, e.g. three anchors with one bad range,
+    or, with max_condition set, when the anchors' geometry around it is
+    that badly conditioned.
+
+    Anchors may be 2D or 3D. With 2D anchors the solve is planar and the
+    ranges are first projected using height_offset, the vertical distance
+    between the tag and the anchor plane.
+    """
+
+    def __init__(self, anchors=DEFAULT_ANCHORS, height_offset=0.0, iterations=2,
+                 max_residual=30.0, max_rms=20.0, max_condition=None, linear_tolerance=5.0, use_gpu=False):
+        self.xp = cp if use_gpu and gpu_available() else np
+        xp = self.xp
+
+        self.anchors = xp.asarray(anchors, dtype=float)
+        self.n_anchors, self.dims = self.anchors.shape
+        self.height_offset = height_offset
+        self.iterations = iterations
+        self.max_residual = max_residual
+        self.max_rms = max_rms
+        self.max_condition = max_condition
+        self.linear_tolerance = linear_tolerance
+        self.rejected = 0
+
+        # Rows of the linear system  -2 a_i . p + |p|^2 = r_i^2 - |a_i|^2
+        self._A = xp.concatenate([-2.0 * self.anchors, xp.ones((self.n_anchors, 1))], axis=1)
+        self._anchor_sq = xp.sum(self.anchors ** 2, axis=1)
+        self._eye = xp.eye(self.dims + 1)
+
+        # Last solution per tag, used to warm-start under-determined fixes.
+        self.last = {}
+
+        if xp is not np:
+            # Compile the kernels now rather than on the first fix.
+            self.solve(np.zeros((1, self.n_anchors)))
+            self.last.clear()
+
+    @property
+    def backend(self):
+        return 'cupy' if self.xp is not np else 'numpy'
+
+    def solve(self, ranges, tags=None):
+        """
+        Solves a (M, n_anchors) array of ranges. Returns (positions, rms, used)
+        as NumPy arrays: positions (M, dims), NaN where no solution was
+        possible, the RMS range residual per fix and a (M, n_anchors) mask of
+        the anchors that were kept.
+        """
+        xp = self.xp
+        r = xp.asarray(ranges, dtype=float)
+        if r.ndim == 1:
+            r = r[None, :]
+        if self.dims == 2 and self.height_offset:
+            r = xp.sqrt(xp.maximum(r * r - self.height_offset ** 2, 0.0))
+
+        used = xp.isfinite(r)
+        r = xp.where(used, r, 0.0)
+        tags = [0] * r.shape[0] if tags is None else tags
+
+        p = self._initial_guess(r, used, tags)
+        solved = xp.all(xp.isfinite(p), axis=1)
+        p = xp.where(solved[:, None], p, 0.0)
+
+        for _ in range(self.n_anchors - self.dims - 1):
+            p, residual = self._fit(p, r, used)
+            worst = xp.argmax(residual, axis=1)
+            rows = xp.arange(r.shape[0])
+            reject = ((residual[rows, worst] > self.max_residual) &
+                      (xp.sum(used, axis=1) > self.dims + 1))
+            if not bool(xp.any(reject)):
+                break
+            used[rows[reject], worst[reject]] = False
+            p, residual = self._fit(p, r, used)
+        else:
+            p, residual = self._fit(p, r, used)
+
+        count = xp.sum(used, axis=1)
+        rms = xp.sqrt(xp.sum(residual ** 2, axis=1) / xp.maximum(count, 1))
+        solved &= count >= self.dims
+        plausible = rms <= self.max_rms
+        if self.max_condition is not None:
+            plausible &= self._condition(p, used) <= self.max_condition
+        self.rejected += int(xp.sum(solved & ~plausible))
+        solved &= plausible
+        p = xp.where(solved[:, None], p, xp.nan)
+
+        if xp is not np:
+            p, rms, used = cp.asnumpy(p), cp.asnumpy(rms), cp.asnumpy(used)
+        for tag, pos, ok in zip(tags, p, solved.tolist()):
+            if ok:
+                self.last[tag] = pos.copy()
+        return p, rms, used
+
+    def _initial_guess(self, r, used, tags):
+        """
+        Closed-form weighted linear least squares, falling back to the last
+        solution for rows with fewer than dims + 1 anchors.
+        """
+        xp = self.xp
+        w = used.astype(float)
+        b = r * r - self._anchor_sq
+        AtW = self._A.T[None, :, :] * w[:, None, :]
+        AtWA = AtW @ self._A
+        AtWb = AtW @ b[..., None]
+
+        enough = xp.sum(used, axis=1) >= self.dims + 1
+        # Keep singular rows solvable; they are replaced below anyway.
+        AtWA = AtWA + xp.where(enough, 1e-9, 1.0)[:, None, None] * self._eye
+        theta = xp.linalg.solve(AtWA, AtWb)[..., 0]
+        p = theta[:, :self.dims]
+
+        if not bool(xp.all(enough)):
+            fallback = xp.asarray([self.last.get(tag, [xp.nan] * self.dims) for tag in tags], dtype=float)
+            p = xp.where(enough[:, None], p, fallback)
+        return p
+
+    def _fit(self, p, r, used):
+        """
+        p refined unless every used range already fits within
+        linear_tolerance, and the absolute residuals (zero where unused).
+        """
+        xp = self.xp
+        residual = xp.abs(self._distances(p) - r) * used
+        if bool(xp.all(residual <= self.linear_tolerance)):
+            return p, residual
+        p = self._refine(p, r, used)
+        return p, xp.abs(self._distances(p) - r) * used
+
+    def _condition(self, p, used):
+        """
+        Condition number of the range Jacobian's normal matrix at p over the
+        used anchors; large where the anchors lie nearly in a line with the tag.
+        """
+        xp = self.xp
+        diff = p[:, None, :] - self.anchors[None, :, :]
+        J = diff / xp.maximum(xp.sqrt(xp.sum(diff * diff, axis=2)), 1e-9)[..., None]
+        JtJ = (J * used[..., None]).transpose(0, 2, 1) @ J
+        eig = xp.linalg.eigvalsh(JtJ)
+        return eig[:, -1] / xp.maximum(eig[:, 0], 1e-12)
+
+    def _refine(self, p, r, used):
+        """
+        Gauss-Newton iterations on |p - a_i| - r_i over the used anchors.
+        """
+        xp = self.xp
+        w = used.astype(float)
+        for _ in range(self.iterations):
+            diff = p[:, None, :] - self.anchors[None, :, :]
+            dist = xp.maximum(xp.sqrt(xp.sum(diff * diff, axis=2)), 1e-9)
+            J = diff / dist[..., None]
+            JtW = (J * w[..., None]).transpose(0, 2, 1)
+            JtJ = JtW @ J + 1e-9 * self._eye[:self.dims, :self.dims]
+            Jte = JtW @ (dist - r)[..., None]
+            p = p - xp.linalg.solve(JtJ, Jte)[..., 0]
+        return p
+
+    def _distances(self, p):
+        diff = p[:, None, :] - self.anchors[None, :, :]
+        return self.xp.sqrt(self.xp.sum(diff * diff, axis=2))
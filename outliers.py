@@ -0,0 +1,198 @@
+# outliers.py
+
+import numpy as np
+
+# MAD -> standard deviation for normally distributed noise.
+MAD_SCALE = 1.4826
+
+
+def window_median(a):
+    """
+    Median over axis 1 by sorting, far cheaper than np.median for the few
+    samples of a window.
+    """
+    s = np.sort(a, axis=1)
+    n = a.shape[1]
+    return (s[:, (n - 1) // 2] + s[:, n // 2]) * 0.5
+
+
+def list_median(values):
+    s = sorted(values)
+    n = len(s)
+    return (s[(n - 1) // 2] + s[n // 2]) * 0.5
+
+
+class OutlierGate:
+    """
+    Streaming outlier rejection for UWB fixes, between parsing and the
+    state estimator.
+
+    Two tests per fix, both on fixed-size per-drone state, so a fix costs
+    the same however long the game runs:
+
+      Hampel   the fix is further than threshold robust standard
+               deviations (MAD-based, never below min_deviation) from
+               where the drone's last `window` fixes put it, on any axis.
+               The window is detrended by its median pairwise step first,
+               so a drone moving fast is not mistaken for a spike, and the
+               limit is widened by how uncertain that extrapolation is;
+      speed    reaching it from the last accepted fix would take more
+               than max_speed (arena units per second), with min_deviation
+               allowed on top for measurement noise. Fixes are stamped on
+               arrival and a serial read can deliver several at once, so
+               the time between them counts as at least min_interval.
+
+    Every fix goes into the median window, rejected or not, so a position
+    that persists soon becomes the median. When the window agrees with a
+    fix that only the speed gate refuses, and that has happened
+    jump_after times in a row, the drone really moved (e.g. it was picked
+    up and put down): the fix is accepted and counted as a jump.
+
+    Like KalmanBank, check() takes one fix per drone for any number of
+    distinct drones and handles them with the same few NumPy operations.
+    check_one() is the same test for a single fix in plain Python, which
+    is several times cheaper than NumPy on arrays this small.
+    """
+
+    def __init__(self, n, window=7, threshold=3.0, min_deviation=5.0, max_speed=1000.0, min_interval=0.02,
+                 jump_after=5):
+        self.window = window
+        self.threshold = threshold
+        self.min_deviation = min_deviation
+        self.max_speed = max_speed
+        self.min_interval = min_interval
+        self.jump_after = jump_after
+
+        # Each drone's last `window` fixes, oldest first; the Hampel test
+        # starts once a drone has that many.
+        self.history = np.zeros((n, window, 3))
+        self.seen = np.zeros(n, dtype=int)
+        # Steps from the middle of the window, where the detrended median
+        # sits, and how far past it the next fix lies.
+        self._steps = (np.arange(window) - (window - 1) / 2.0)[:, None]
+        self.lead = (window + 1) / 2.0
+        # Every pair of fixes in the window, for the Theil-Sen step.
+        self._pairs = np.triu_indices(window, 1)
+        self._pair_steps = (self._pairs[1] - self._pairs[0]).astype(float)[:, None]
+        # The expected position is off by the noise of the new fix, of the
+        # middle position and of the step times lead; limits are widened
+        # by that much (median estimators taken as pi/2 times less efficient
+        # than means, the step as a least-squares slope).
+        self.spread = np.sqrt(1.0 + np.pi / 2.0 * (1.0 / window + self.lead ** 2 * 12.0 / (window ** 3 - window)))
+        self.last_pos = np.full((n, 3), np.nan)
+        self.last_t = np.full(n, np.nan)
+        self.streak = np.zeros(n, dtype=int)
+
+        self.rejected_hampel = 0
+        self.rejected_speed = 0
+        self.jumps = 0
+
+    @property
+    def rejected(self):
+        return self.rejected_hampel + self.rejected_speed
+
+    def check(self, drones, t, pos):
+        """
+        Accept mask for one fix (k, 3) per drone taken at times t (k,).
+        """
+        drones = np.asarray(drones, dtype=int)
+        t = np.asarray(t, dtype=float)
+        pos = np.asarray(pos, dtype=float)[:, :3]
+
+        # The window oldest first, less its median step per fix counted
+        # from the middle: the median of what is left is a robust position
+        # for the middle fix, the spread around it the MAD, and the next
+        # fix is expected `lead` steps further on. The step is the median
+        # slope over all pairs of fixes (Theil-Sen), far steadier than the
+        # median of consecutive differences.
+        history = self.history[drones]
+        i, j = self._pairs
+        step = window_median((history[:, j] - history[:, i]) / self._pair_steps)
+        detrended = history - step[:, None] * self._steps
+        center = window_median(detrended)
+        mad = window_median(np.abs(detrended - center[:, None]))
+        expected = center + step * self.lead
+        limit = self.threshold * self.spread * np.maximum(MAD_SCALE * mad, self.min_deviation)
+        hampel = (np.abs(pos - expected) > limit).any(axis=1) & (self.seen[drones] >= self.window)
+
+        dt = np.maximum(t - self.last_t[drones], self.min_interval)
+        step = np.sqrt(((pos - self.last_pos[drones]) ** 2).sum(axis=1))
+        speeding = step > self.max_speed * dt + self.min_deviation
+
+        history[:, :-1] = history[:, 1:]
+        history[:, -1] = pos
+        self.history[drones] = history
+        self.seen[drones] += 1
+
+        reject = hampel | speeding
+        streak = np.where(reject, self.streak[drones] + 1, 0)
+        jump = speeding & ~hampel & (streak >= self.jump_after)
+        reject &= ~jump
+        self.streak[drones] = np.where(reject, streak, 0)
+
+        accept = ~reject
+        self.last_pos[drones[accept]] = pos[accept]
+        self.last_t[drones[accept]] = t[accept]
+        self.rejected_hampel += int(np.count_nonzero(hampel & reject))
+        self.rejected_speed += int(np.count_nonzero(speeding & ~hampel & reject))
+        self.jumps += int(np.count_nonzero(jump))
+        return accept
+
+    def check_one(self, drone, t, pos):
+        """
+        check() for one drone's fix; True if it is accepted.
+        """
+        x = [float(v) for v in pos[:3]]
+        rows = self.history[drone].tolist()
+        hampel = False
+        if self.seen[drone] >= self.window:
+            offsets = self._steps[:, 0].tolist()
+            pairs = list(zip(*(p.tolist() for p in self._pairs)))
+            for axis in range(3):
+                col = [row[axis] for row in rows]
+                step = list_median([(col[j] - col[i]) / (j - i) for i, j in pairs])
+                detrended = [v - step * k for k, v in zip(offsets, col)]
+                center = list_median(detrended)
+                mad = list_median([abs(v - center) for v in detrended])
+                limit = self.threshold * self.spread * max(MAD_SCALE * mad, self.min_deviation)
+                if abs(x[axis] - (center + step * self.lead)) > limit:
+                    hampel = True
+                    break
+
+        speeding = False
+        last_t = float(self.last_t[drone])
+        if last_t == last_t:
+            dt = max(t - last_t, self.min_interval)
+            distance = sum((a - b) ** 2 for a, b in zip(x, self.last_pos[drone].tolist())) ** 0.5
+            speeding = distance > self.max_speed * dt + self.min_deviation
+
+        self.history[drone] = rows[1:] + [x]
+        self.seen[drone] += 1
+
+        reject = hampel or speeding
+        streak = self.streak[drone] + 1 if reject else 0
+        if speeding and not hampel and streak >= self.jump_after:
+            reject = False
+            self.jumps += 1
+        if reject:
+            self.streak[drone] = streak
+            if hampel:
+                self.rejected_hampel += 1
+            else:
+                self.rejected_speed += 1
+            return False
+        self.streak[drone] = 0
+        self.last_pos[drone] = x
+        self.last_t[drone] = t
+        return True
+
+    def reset(self, drones=None):
+        """
+        Forgets the given drones' history (all by default), e.g. after a
+        drone was relocated on purpose.
+        """
+        drones = slice(None) if drones is None else np.asarray(drones, dtype=int)
+        self.seen[drones] = 0
+        self.last_pos[drones] = np.nan
+        self.last_t[drones] = np.nan
+        self.streak[drones] = 0
@@ -0,0 +1,172 @@
+# plots.py
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QWidget, QVBoxLayout
+
+from crazyflie_telemetry import yaw_degrees
+
+RANGE_NAMES = ("F", "B", "L", "R", "U")
+RANGE_COLORS = ("r", "g", "b", "c", "m")
+
+
+class SampleRing:
+    """
+    Fixed-capacity ring of timestamped samples with `width` values each.
+
+    Every sample is written twice, `capacity` apart, so the newest
+    `capacity` samples are always one contiguous slice: reading a window
+    never copies or reorders anything.
+    """
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.t = np.zeros(2 * capacity)
+        self.values = np.zeros((2 * capacity, width))
+        self.count = 0
+
+    def append(self, t, values):
+        i = self.count % self.capacity
+        self.t[i] = self.t[i + self.capacity] = t
+        self.values[i] = self.values[i + self.capacity] = values
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def latest(self):
+        """
+        (t, values) views of the stored samples, oldest first.
+        """
+        n = len(self)
+        end = self.count % self.capacity + (self.capacity if self.count >= self.capacity else 0)
+        return self.t[end - n:end], self.values[end - n:end]
+
+    def window(self, seconds):
+        """
+        Like latest(), limited to the last `seconds` before the newest sample.
+        """
+        t, values = self.latest()
+        if not len(t):
+            return t, values
+        start = np.searchsorted(t, t[-1] - seconds)
+        return t[start:], values[start:]
+
+    def clear(self):
+        self.count = 0
+
+
+def bounded_curve(plot, **kwargs):
+    """
+    A curve that pyqtgraph downsamples and clips to the visible range, so
+    its drawing cost does not grow with the number of samples.
+    """
+    curve = plot.plot([], [], **kwargs)
+    curve.setDownsampling(auto=True, method='peak')
+    curve.setClipToView(True)
+    return curve
+
+
+class TrailPlot:
+    """
+    Draws the current drone position plus its trail over the last
+    `trail_seconds` on an existing PlotWidget.
+    """
+
+    def __init__(self, plot_widget, trail_seconds=5.0, capacity=4096, color=(100, 150, 255)):
+        self.trail_seconds = trail_seconds
+        self.ring = SampleRing(capacity, 2)
+        self.trail = plot_widget.plot([], [], pen=pg.mkPen(color=color, width=1))
+        self.head = plot_widget.plot([], [], pen=None, symbol='o', symbolSize=10, symbolBrush=color)
+        self.dirty = False
+
+    def add(self, t, pos):
+        self.ring.append(t, (pos[0], pos[1]))
+        self.dirty = True
+
+    def refresh(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        _, xy = self.ring.window(self.trail_seconds)
+        self.trail.setData(xy[:, 0], xy[:, 1])
+        self.head.setData(xy[-1:, 0], xy[-1:, 1])
+
+
+def draw_arena(plot_widget, arena):
+    """
+    Draws an arena.Arena: anchors, boundary polygon, goal lines and walls,
+    and the named zones.
+    """
+    plot_widget.plot(arena.anchors[:, 0], arena.anchors[:, 1], pen=None, symbol='x', symbolSize=12)
+    if len(arena.boundary):
+        outline = np.vstack([arena.boundary, arena.boundary[:1]])
+        plot_widget.plot(outline[:, 0], outline[:, 1], pen=pg.mkPen(color='g', width=1))
+    for line in arena.lines:
+        (x0, y0), (x1, y1) = arena.line_segment(line)
+        color = 'r' if line.get("wall") else 'y'
+        plot_widget.plot([x0, x1], [y0, y1], pen=pg.mkPen(color=color, width=1, style=Qt.DashLine))
+    for zone in arena.zones:
+        polygon = np.asarray(zone["polygon"], dtype=float)
+        outline = np.vstack([polygon, polygon[:1]])
+        plot_widget.plot(outline[:, 0], outline[:, 1], pen=pg.mkPen(color='c', width=1, style=Qt.DotLine))
+        label = pg.TextItem(zone["name"], color='c', anchor=(0.5, 0.5))
+        label.setPos(*polygon.mean(axis=0))
+        plot_widget.addItem(label)
+
+
+class TelemetryCharts(QWidget):
+    """
+    Strip charts of the multiranger distances, flow-deck height and yaw
+    over the last `seconds`, read straight from CrazyflieTelemetry's ring.
+    The time axis is seconds relative to the newest packet.
+    """
+
+    def __init__(self, telemetry, parent=None, seconds=10.0):
+        super().__init__(parent)
+        self.telemetry = telemetry
+        self.seconds = seconds
+        self._drawn = -1
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+        self.graphics = pg.GraphicsLayoutWidget()
+        layout.addWidget(self.graphics)
+
+        self.range_plot = self.graphics.addPlot(row=0, col=0, title='Multiranger (mm)')
+        self.range_plot.addLegend(offset=(5, 5))
+        self.range_curves = [bounded_curve(self.range_plot, pen=color, name=name)
+                             for name, color in zip(RANGE_NAMES, RANGE_COLORS)]
+        self.height_plot = self.graphics.addPlot(row=1, col=0, title='Height (mm)')
+        self.height_curve = bounded_curve(self.height_plot, pen='y')
+        self.yaw_plot = self.graphics.addPlot(row=2, col=0, title='Yaw (deg)')
+        self.yaw_plot.setYRange(0, 360)
+        self.yaw_curve = bounded_curve(self.yaw_plot, pen='w')
+        for plot in (self.range_plot, self.height_plot, self.yaw_plot):
+            plot.setXRange(-seconds, 0)
+            plot.showGrid(x=True, y=True)
+        self.height_plot.setXLink(self.range_plot)
+        self.yaw_plot.setXLink(self.range_plot)
+
+    def set_telemetry(self, telemetry):
+        self.telemetry = telemetry
+        self._drawn = -1
+
+    def refresh(self):
+        count = self.telemetry.count
+        if count == self._drawn:
+            return
+        self._drawn = count
+        rec = self.telemetry.recent()
+        if not len(rec):
+            return
+        t = rec['t'] - rec['t'][-1]
+        keep = t >= -self.seconds
+        t, rec = t[keep], rec[keep]
+        ranges = rec['multiranger'].astype(float)
+        for i, curve in enumerate(self.range_curves):
+            curve.setData(t, ranges[:, i])
+        self.height_curve.setData(t, rec['height'].astype(float))
+        self.yaw_curve.setData(t, yaw_degrees(rec['yaw'].astype(float)))
@@ -0,0 +1,270 @@
+# position_protocol.py
+
+import re
+import struct
+import logging
+import binascii
+from collections import namedtuple
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+#   Binary frame layout (little-endian)
+#
+#   sync   u16   0x55AA (bytes AA 55 on the wire)
+#   type   u8    FRAME_POSITION: float32 x, y, z
+#                FRAME_RANGES:   float32 range per anchor, NaN if missing
+#   length u8    payload length in bytes
+#   tag    u8    UWB tag id
+#   seq    u16   per-tag sequence number, wraps at 65536
+#   t_us   u32   device timestamp in microseconds, wraps
+#   payload      `length` bytes
+#   crc    u16   CRC-16/CCITT-FALSE over type .. end of payload
+# ------------------------------------------------------------------
+SYNC_WORD = 0x55AA
+SYNC_BYTES = struct.pack('<H', SYNC_WORD)
+
+FRAME_POSITION = 0x01
+FRAME_RANGES = 0x02
+
+MAX_ANCHORS = 16
+
+HEADER = struct.Struct('<HBBBHI')
+CRC = struct.Struct('<H')
+POSITION_PAYLOAD = struct.Struct('<3f')
+POSITION_FRAME_SIZE = HEADER.size + POSITION_PAYLOAD.size + CRC.size
+
+# NumPy view of a run of back-to-back position frames.
+POSITION_FRAME_DTYPE = np.dtype([
+    ('sync', '<u2'),
+    ('type', 'u1'),
+    ('length', 'u1'),
+    ('tag', 'u1'),
+    ('seq', '<u2'),
+    ('t_us', '<u4'),
+    ('pos', '<f4', (3,)),
+    ('crc', '<u2'),
+])
+
+# One decoded fix. seq and t_us are None for legacy text lines; pos is None
+# for a ranges frame until the host has solved it.
+PositionFix = namedtuple('PositionFix', ['tag', 'seq', 't_us', 'pos', 'ranges'], defaults=(None,))
+
+_TEXT_STRIP = b' \t\r[]()'
+
+# Trailing "[x, y, z]" of a line that starts with leftovers of a corrupted frame.
+_NUMBER = rb'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*'
+_TEXT_TAIL = re.compile(rb'[\[(]' + _NUMBER + b',' + _NUMBER + b',' + _NUMBER + rb'[\])]?\s*\Z')
+
+
+def crc16(data):
+    """
+    CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), computed in C by binascii.
+    """
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_position_frame(x, y, z, seq, t_us, tag=0):
+    """
+    Builds one binary position frame, as the anchor firmware sends it.
+    """
+    body = HEADER.pack(SYNC_WORD, FRAME_POSITION, POSITION_PAYLOAD.size, tag,
+                       seq & 0xFFFF, t_us & 0xFFFFFFFF) + POSITION_PAYLOAD.pack(x, y, z)
+    return body + CRC.pack(crc16(body[2:]))
+
+
+def encode_ranges_frame(ranges, seq, t_us, tag=0):
+    """
+    Builds one binary ranges frame; ranges is one float per anchor.
+    """
+    payload = struct.pack(f'<{len(ranges)}f', *ranges)
+    body = HEADER.pack(SYNC_WORD, FRAME_RANGES, len(payload), tag,
+                       seq & 0xFFFF, t_us & 0xFFFFFFFF) + payload
+    return body + CRC.pack(crc16(body[2:]))
+
+
+def payload_length_ok(ftype, length):
+    if ftype == FRAME_POSITION:
+        return length == POSITION_PAYLOAD.size
+    if ftype == FRAME_RANGES:
+        return 0 < length <= 4 * MAX_ANCHORS and length % 4 == 0
+    return False
+
+
+def parse_text_position(line):
+    """
+    Parses a legacy text line such as b"[12.5, 300.1, 80.0]" without eval().
+    """
+    fields = line.strip(_TEXT_STRIP).split(b',')
+    if len(fields) != 3:
+        raise ValueError(f"expected 3 coordinates, got {len(fields)}")
+    return np.array([float(fields[0]), float(fields[1]), float(fields[2])])
+
+
+class SequenceStats:
+    """
+    Tracks received, lost and out-of-order frames from per-tag sequence numbers.
+    """
+
+    def __init__(self):
+        self.expected = {}
+        self.received = 0
+        self.lost = 0
+        self.out_of_order = 0
+
+    def update(self, tag, seq):
+        self.received += 1
+        expected = self.expected.get(tag)
+        if expected is not None:
+            gap = (seq - expected) & 0xFFFF
+            if gap >= 0x8000:
+                # Older than expected: a late or duplicated frame.
+                self.out_of_order += 1
+                return
+            self.lost += gap
+        self.expected[tag] = (seq + 1) & 0xFFFF
+
+    @property
+    def loss_rate(self):
+        total = self.received + self.lost
+        return self.lost / total if total else 0.0
+
+
+class PositionStreamDecoder:
+    """
+    Decodes a byte stream that may mix binary frames and legacy text lines.
+
+    Text lines are pure ASCII, so the 0xAA sync byte can never appear inside
+    one. On a bad header or CRC the decoder advances a single byte and scans
+    for the next sync word, so a good frame that starts inside a corrupted one
+    is still found. Incomplete frames and lines are left in the buffer until
+    the rest arrives; nothing that could still become a valid frame is dropped.
+    """
+
+    def __init__(self):
+        self.sequence = SequenceStats()
+
+        self.frames = 0
+        self.text_lines = 0
+        self.crc_errors = 0
+        self.text_errors = 0
+        self.skipped_bytes = 0
+
+    def decode(self, buf, end, t, emit):
+        """
+        Decodes complete frames in buf[:end], calling emit(t, fix) for each.
+        Returns the number of bytes consumed.
+        """
+        pos = 0
+        sync0 = SYNC_BYTES[0]
+        while pos < end:
+            if buf[pos] != sync0:
+                next_pos = self._decode_text(buf, pos, end, t, emit)
+                if next_pos is None:
+                    break
+                pos = next_pos
+                continue
+
+            if end - pos < HEADER.size:
+                break
+            sync, ftype, length, tag, seq, t_us = HEADER.unpack_from(buf, pos)
+            if sync != SYNC_WORD or not payload_length_ok(ftype, length):
+                self.skipped_bytes += 1
+                pos += 1
+                continue
+
+            if ftype == FRAME_POSITION and end - pos >= 2 * POSITION_FRAME_SIZE:
+                n = self._decode_position_run(buf, pos, end, t, emit)
+                if n:
+                    pos += n * POSITION_FRAME_SIZE
+                    continue
+
+            frame_size = HEADER.size + length + CRC.size
+            if end - pos < frame_size:
+                break
+            crc_end = pos + HEADER.size + length
+            if crc16(memoryview(buf)[pos + 2:crc_end]) != CRC.unpack_from(buf, crc_end)[0]:
+                self.crc_errors += 1
+                self.skipped_bytes += 1
+                pos += 1
+                continue
+
+            if ftype == FRAME_POSITION:
+                x, y, z = POSITION_PAYLOAD.unpack_from(buf, pos + HEADER.size)
+                self._emit(t, emit, tag, seq, t_us, np.array([x, y, z]))
+            else:
+                ranges = np.frombuffer(buf, dtype='<f4', count=length // 4,
+                                       offset=pos + HEADER.size).astype(float)
+                self._emit(t, emit, tag, seq, t_us, None, ranges)
+            pos += frame_size
+
+        return pos
+
+    def _decode_text(self, buf, pos, end, t, emit):
+        """
+        Handles a legacy text line starting at pos. Returns the new position,
+        or None when the line is still incomplete.
+        """
+        nl = buf.find(b'\n', pos, end)
+        sync = buf.find(SYNC_BYTES, pos, end if nl < 0 else nl)
+        if sync >= 0:
+            # Bytes in front of a sync word that are not a full line are noise.
+            self.skipped_bytes += sync - pos
+            return sync
+        if nl < 0:
+            # A lone trailing 0xAA may be the first half of a sync word.
+            return None
+
+        line = bytes(buf[pos:nl])
+        if line.strip():
+            try:
+                coords = parse_text_position(line)
+            except ValueError as e:
+                # The line may be a good fix glued to the tail of a bad frame.
+                match = _TEXT_TAIL.search(line)
+                if match is None:
+                    self.text_errors += 1
+                    log.warning("Error parsing line: %s | Line was: %r", e, line)
+                    return nl + 1
+                self.skipped_bytes += match.start()
+                coords = np.array([float(v) for v in match.groups()])
+            self.text_lines += 1
+            emit(t, PositionFix(0, None, None, coords))
+        return nl + 1
+
+    def _decode_position_run(self, buf, pos, end, t, emit):
+        """
+        Decodes back-to-back position frames through a single NumPy view.
+        Returns how many frames were consumed; 0 leaves it to the slow path.
+        """
+        count = (end - pos) // POSITION_FRAME_SIZE
+        frames = np.frombuffer(buf, dtype=POSITION_FRAME_DTYPE, count=count, offset=pos)
+        bad = np.flatnonzero((frames['sync'] != SYNC_WORD) |
+                             (frames['type'] != FRAME_POSITION) |
+                             (frames['length'] != POSITION_PAYLOAD.size))
+        if bad.size:
+            count = int(bad[0])
+
+        view = memoryview(buf)
+        crcs = frames['crc']
+        for i in range(count):
+            start = pos + i * POSITION_FRAME_SIZE
+            if crc16(view[start + 2:start + POSITION_FRAME_SIZE - CRC.size]) != crcs[i]:
+                count = i
+                break
+        if not count:
+            return 0
+
+        run = frames[:count]
+        coords = run['pos'].astype(float)
+        for tag, seq, t_us, xyz in zip(run['tag'].tolist(), run['seq'].tolist(),
+                                       run['t_us'].tolist(), coords):
+            self._emit(t, emit, tag, seq, t_us, xyz)
+        return count
+
+    def _emit(self, t, emit, tag, seq, t_us, coords, ranges=None):
+        self.frames += 1
+        self.sequence.update(tag, seq)
+        emit(t, PositionFix(tag, seq, t_us, coords, ranges))
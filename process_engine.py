@@ -0,0 +1,356 @@
+# process_engine.py
+
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+
+import numpy as np
+
+from events import Signal
+from metrics import METRICS
+from shared_ring import SharedRing
+from drone_registry import DroneRegistry, DroneLink
+from crazyflie_telemetry import TelemetryRing, TELEMETRY_DTYPE
+
+log = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+#   Worker process
+#
+#   The TrackingEngine runs in its own process, so serial reads, the
+#   filter, the rules and the radio links never wait for the GUI's GIL.
+#   Filtered fixes and telemetry records, the high-rate data, go into two
+#   SharedRings the GUI reads whenever it likes. The rare events (rules,
+#   zones, link messages, connection changes) and periodic link stats go
+#   through a multiprocessing queue, commands come back through another:
+#
+#     ("send_command", value, drone)  ("emergency_stop",)
+#     ("reconnect", link name)        ("stop",)
+# ------------------------------------------------------------------
+POSITION_DTYPE = np.dtype([('seq', '<u8'), ('t', '<f8'), ('drone', '<i4'), ('pos', '<f8', (3,))])
+TELEMETRY_RECORD_DTYPE = np.dtype([('seq', '<u8'), ('drone', '<i4'), ('rec', TELEMETRY_DTYPE)])
+
+POSITION_RING_SIZE = 8192
+TELEMETRY_RING_SIZE = 4096      # per drone
+STATUS_INTERVAL = 0.5           # seconds between link stats updates
+POLL_INTERVAL = 0.005           # seconds between ring reads in the GUI process
+
+
+class RingPublisher:
+    """
+    Worker side: copies an engine's output into the rings and the event
+    queue. Telemetry arrives on one radio thread per drone, so its ring
+    is written under a lock to keep a single writer.
+    """
+
+    def __init__(self, engine, positions, telemetry, events):
+        self.engine = engine
+        self.positions = positions
+        self.telemetry = telemetry
+        self.events = events
+        self._telemetry_lock = threading.Lock()
+
+        tracker = engine.tracker
+        connections = engine.connections
+        # Stamped with the arrival time of the fix behind the position, not
+        # the time it is published.
+        engine.positionUpdated.connect(
+            lambda drone, pos: positions.append(tracker.drone_fix_t[drone], drone, pos))
+        engine.telemetryReceived.connect(self.publish_telemetry)
+        engine.ruleFired.connect(lambda rule, t, pos, drone: events.put(
+            ("rule", rule, t, pos.tolist(), drone,
+             (tracker.player1_score, tracker.player2_score, tracker.virtual_wall))))
+        engine.zoneChanged.connect(lambda zone, inside, t, drone: events.put(("zone", zone, inside, t, drone)))
+        engine.telemetryMessage.connect(lambda drone, text: events.put(("message", drone, text)))
+        engine.connectionChanged.connect(lambda name, state: events.put(
+            ("connection", name, state, connections.summary(), connections.all_connected(),
+             connections.time_to_ready())))
+
+    def publish_telemetry(self, drone, n):
+        rec = self.engine.registry[drone].telemetry.record(n)
+        if rec is None:
+            return
+        with self._telemetry_lock:
+            self.telemetry.append(drone, rec)
+
+    def publish_status(self):
+        self.events.put(("links", [link.telemetry.link_stats.summary() for link in self.engine.registry]))
+
+
+def run_worker(args, config, ring_names, commands, events):
+    """
+    Worker process entry point: builds the engine as program.py would,
+    publishes its output and carries out commands until told to stop.
+    The worker owns the devices, the session recording and the metrics
+    exporters.
+    """
+    from cflib.crtp import init_drivers
+    from diagnostics import setup_logging
+    from session_log import SessionRecorder
+    import program
+
+    setup_logging(args.log_level or config["log_level"])
+    init_drivers()
+    positions = SharedRing.attach(ring_names["positions"], POSITION_DTYPE)
+    telemetry = SharedRing.attach(ring_names["telemetry"], TELEMETRY_RECORD_DTYPE)
+    recorder = SessionRecorder(args.record) if args.record else None
+    engine, stand_ins, replayer = program.build_engine(args, config, recorder)
+    runner = program.build_runner(engine, args.io or config["io_backend"])
+    exporters = program.start_metrics_export(config)
+    publisher = RingPublisher(engine, positions, telemetry, events)
+
+    runner.start()
+    if replayer is not None:
+        replayer.start()
+    log.info("Engine worker %d running", multiprocessing.current_process().pid)
+    status_at = time.monotonic() + STATUS_INTERVAL
+    while True:
+        try:
+            command = commands.get(timeout=max(0.0, status_at - time.monotonic()))
+        except queue.Empty:
+            command = None
+        except (KeyboardInterrupt, EOFError):
+            break
+        if time.monotonic() >= status_at:
+            publisher.publish_status()
+            status_at = time.monotonic() + STATUS_INTERVAL
+        if command is None:
+            continue
+        name, *params = command
+        if name == "stop":
+            break
+        if name == "send_command":
+            engine.send_command(*params)
+        elif name == "emergency_stop":
+            engine.emergency_stop()
+        elif name == "reconnect":
+            engine.connections.reconnect(*params)
+        else:
+            log.warning("Unknown worker command %r", name)
+
+    if replayer is not None:
+        replayer.stop()
+    runner.stop()
+    for exporter in exporters:
+        exporter.stop()
+    for stand_in in stand_ins:
+        stand_in.stop()
+    if recorder is not None:
+        recorder.close()
+    positions.close()
+    telemetry.close()
+
+
+# ------------------------------------------------------------------
+#   GUI side
+# ------------------------------------------------------------------
+class LinkSummary:
+    """
+    The worker's latest LinkStats.summary() text for one drone.
+    """
+
+    def __init__(self):
+        self.text = "no telemetry"
+
+    def summary(self):
+        return self.text
+
+
+class RemoteTelemetry(TelemetryRing):
+    """
+    A drone's telemetry ring rebuilt in the GUI process from the shared
+    ring, so plots and the log read it exactly as a CrazyflieTelemetry's.
+    """
+
+    def __init__(self, ring_size=TELEMETRY_RING_SIZE):
+        self.ring = np.zeros(ring_size, dtype=TELEMETRY_DTYPE)
+        self.count = 0
+        self.link_stats = LinkSummary()
+
+    def extend(self, records):
+        """
+        Stores TELEMETRY_DTYPE records; returns their sample numbers.
+        """
+        n = np.arange(self.count, self.count + len(records))
+        self.ring[n % len(self.ring)] = records
+        self.count += len(records)
+        return n
+
+
+class RemoteTracker:
+    """
+    What the GUI reads from DroneTracker: the arena, the scores and a clock.
+    """
+
+    def __init__(self, arena):
+        self.arena = arena
+        self.clock = time.monotonic
+        self.player1_score = 0
+        self.player2_score = 0
+        self.virtual_wall = 0
+
+
+class RemoteConnections:
+    """
+    The worker's ConnectionManager as of its last state change.
+    """
+
+    def __init__(self, commands):
+        self.commands = commands
+        self.text = ""
+        self.connected = False
+        self.ready_seconds = None
+
+    def reconnect(self, name):
+        self.commands.put(("reconnect", name))
+
+    def summary(self):
+        return self.text
+
+    def all_connected(self):
+        return self.connected
+
+    def time_to_ready(self):
+        return self.ready_seconds
+
+
+class ProcessEngine:
+    """
+    A TrackingEngine running in a worker process, as seen from the GUI.
+
+    It offers the attributes and callbacks MainForm and EngineBridge use.
+    A poller thread reads the shared rings and the event queue and
+    re-emits what it finds, so nothing the window does can hold up
+    acquisition or commands. The callbacks are:
+
+        positionUpdated(drone, pos)         from the positions ring
+        ruleFired(rule name, t, pos, drone) scores are updated first
+        zoneChanged(zone, inside, t, drone)
+        telemetryReceived(drone, n)         n indexes registry[drone].telemetry
+        telemetryMessage(drone, text)
+        connectionChanged(name, state)
+
+    All of them are called from the poller thread.
+    """
+
+    def __init__(self, args, config, names, arena, ring_size=TELEMETRY_RING_SIZE):
+        context = multiprocessing.get_context("spawn")
+        self.positions = SharedRing.create(POSITION_DTYPE, POSITION_RING_SIZE)
+        self.telemetry = SharedRing.create(TELEMETRY_RECORD_DTYPE, ring_size * len(names))
+        self.commands = context.Queue()
+        self.events = context.Queue()
+        ring_names = {"positions": self.positions.name, "telemetry": self.telemetry.name}
+        self.process = context.Process(target=run_worker, name="engine-worker", daemon=True,
+                                       args=(args, config, ring_names, self.commands, self.events))
+
+        self.registry = DroneRegistry([DroneLink(name, tag=i, telemetry=RemoteTelemetry(ring_size))
+                                       for i, name in enumerate(names)])
+        self.tracker = RemoteTracker(arena)
+        self.connections = RemoteConnections(self.commands)
+
+        self.positionUpdated = Signal()
+        self.ruleFired = Signal()
+        self.zoneChanged = Signal()
+        self.telemetryReceived = Signal()
+        self.telemetryMessage = Signal()
+        self.connectionChanged = Signal()
+
+        self.lost = {"positions": 0, "telemetry": 0}
+        self._seq = {"positions": 0, "telemetry": 0}
+        self._stop_event = threading.Event()
+        self._thread = None
+        for ring in self.lost:
+            METRICS.counter("ring_records_lost_total", "Shared ring records overwritten before the GUI read them",
+                            {"ring": ring}, fn=lambda ring=ring: self.lost[ring])
+
+    @property
+    def running(self):
+        return self.process.is_alive()
+
+    def start(self):
+        """
+        Starts the worker and the poller; does nothing if already started.
+        """
+        if self._thread is not None:
+            return
+        self.process.start()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="engine-poller")
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.commands.put(("stop",))
+        self.process.join(timeout=5.0)
+        if self.process.is_alive():
+            log.warning("Engine worker did not stop, terminating it")
+            self.process.terminate()
+            self.process.join(timeout=1.0)
+        self._stop_event.set()
+        self._thread.join(timeout=2.0)
+        self._thread = None
+        self.events.cancel_join_thread()
+        self.positions.close()
+        self.telemetry.close()
+
+    def emergency_stop(self):
+        self.commands.put(("emergency_stop",))
+
+    def send_command(self, value, drone=0):
+        self.commands.put(("send_command", value, drone))
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                event = self.events.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                event = None
+            # Fixes before the events that may have come from them.
+            self.poll_rings()
+            while event is not None:
+                self.dispatch(event)
+                try:
+                    event = self.events.get_nowait()
+                except queue.Empty:
+                    event = None
+            if not self.process.is_alive() and not self._stop_event.is_set():
+                log.error("Engine worker exited with code %s", self.process.exitcode)
+                break
+
+    def poll_rings(self):
+        records, self._seq["positions"], lost = self.positions.read_since(self._seq["positions"])
+        self.lost["positions"] += lost
+        for rec in records:
+            self.positionUpdated.emit(int(rec['drone']), rec['pos'])
+
+        records, self._seq["telemetry"], lost = self.telemetry.read_since(self._seq["telemetry"])
+        self.lost["telemetry"] += lost
+        if not len(records):
+            return
+        drones = records['drone']
+        for drone in np.unique(drones).tolist():
+            samples = self.registry[drone].telemetry.extend(records['rec'][drones == drone])
+            for n in samples.tolist():
+                self.telemetryReceived.emit(drone, n)
+
+    def dispatch(self, event):
+        kind, *params = event
+        if kind == "rule":
+            rule, t, pos, drone, scores = params
+            tracker = self.tracker
+            tracker.player1_score, tracker.player2_score, tracker.virtual_wall = scores
+            self.ruleFired.emit(rule, t, np.asarray(pos), drone)
+        elif kind == "zone":
+            self.zoneChanged.emit(*params)
+        elif kind == "message":
+            self.telemetryMessage.emit(*params)
+        elif kind == "connection":
+            name, state, summary, connected, ready_seconds = params
+            connections = self.connections
+            connections.text, connections.connected, connections.ready_seconds = summary, connected, ready_seconds
+            self.connectionChanged.emit(name, state)
+        elif kind == "links":
+            for link, text in zip(self.registry, params[0]):
+                link.telemetry.link_stats.text = text
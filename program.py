@@ -1,18 +1,257 @@
 # program.py
 
 import sys
-from PyQt5.QtWidgets import QApplication
-from main_form import MainForm
+import argparse
+import threading
+import contextlib
 from cflib.crtp import init_drivers
-from playsound import playsound
+from config import load_config
+from diagnostics import setup_logging
+from session_log import SessionRecorder, SessionLog, SessionReplayer
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Drone Pong tracking and telemetry")
+    parser.add_argument('--config', metavar='FILE',
+                        help="JSON file overriding the defaults in config.py")
+    parser.add_argument('--sim', action='store_true',
+                        help="use the simulated anchor feed and Crazyflie (same as backend=simulation)")
+    parser.add_argument('--record', metavar='FILE',
+                        help="append raw serial and CRTP traffic to a session log")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="replay a session log instead of opening the hardware")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="replay speed factor, 0 = as fast as possible (default 1)")
+    parser.add_argument('--io', choices=["threads", "asyncio"],
+                        help="I/O backend (default: io_backend from the config)")
+    parser.add_argument('--worker-process', action='store_true',
+                        help="run the engine in a worker process next to the GUI (same as engine_process)")
+    parser.add_argument('--audio', metavar='SINK',
+                        help="sound output: device, null, off or a .wav file to record to (default: from the config)")
+    parser.add_argument('--control', choices=["center", "lane", "bounce", "off"],
+                        help="steer drones in DIRECTIONAL from their tracked position (default: from the config)")
+    parser.add_argument('--lead-time', type=float, metavar='SECONDS',
+                        help="score predictively, firing this much earlier on top of the measured latency")
+    parser.add_argument('--log-level', choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="diagnostics level (default: log_level from the config)")
+    parser.add_argument('--metrics-file', metavar='FILE',
+                        help="keep FILE updated with the metrics in Prometheus text format")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="serve the metrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument('--headless', action='store_true',
+                        help="run tracking, scoring and telemetry without the GUI")
+    parser.add_argument('--events', metavar='FILE', default='-',
+                        help="headless: append events as JSON lines to FILE (default stdout)")
+    parser.add_argument('--event-types', nargs='+', metavar='TYPE',
+                        default=["position", "rule", "zone", "connection", "message"],
+                        help="headless: position, rule, zone, connection, message, telemetry and/or state")
+    parser.add_argument('--duration', type=float, metavar='SECONDS',
+                        help="headless: stop after this long (default: Ctrl-C or end of replay)")
+    return parser.parse_known_args(argv[1:])
+
+def configured_drones(config):
+    """
+    The drone list from the config, defaulting to the single radio_uri drone.
+    """
+    return config["drones"] or [{"name": "drone1", "uri": config["radio_uri"], "tag": 0}]
+
+def start_simulation(config, arena):
+    """
+    Starts the virtual anchor feed and returns (serial_port, drones, stand-ins).
+    """
+    from simulation import VirtualSerialAnchor, FakeCrazyflie, SteerablePath, offset_trajectory, lissajous
+
+    sim = config["simulation"]
+    tags = list(range(sim["drones"]))
+    # One path per drone, 2 s apart on the Lissajous figure, which its
+    # FakeCrazyflie's setpoints can take over and the anchor reports.
+    paths = [SteerablePath(offset_trajectory(lissajous, tag * 2.0)) for tag in tags]
+    anchor = VirtualSerialAnchor(rate_hz=sim["fix_rate_hz"], frame_format=sim["frame_format"],
+                                 position_noise=sim["position_noise"], anchors=arena.anchors, tags=tags,
+                                 seed=sim["seed"], trajectories=paths)
+    anchor.start()
+    drones = [{"name": f"drone{tag + 1}", "uri": f"sim://{tag}", "tag": tag,
+               "crazyflie": FakeCrazyflie(telemetry_rate_hz=sim["telemetry_rate_hz"], seed=sim["seed"] + tag,
+                                          packet_loss=sim["telemetry_loss"], trajectory=paths[tag])}
+              for tag in tags]
+    return anchor.port, drones, [anchor]
+
+def drone_names(args, config):
+    """
+    Names of the drones build_engine() registers, in index order.
+    """
+    if args.replay:
+        return ["drone1"]
+    if config["backend"] == "simulation":
+        return [f"drone{tag + 1}" for tag in range(config["simulation"]["drones"])]
+    return [entry.get("name", f"drone{i + 1}") for i, entry in enumerate(configured_drones(config))]
+
+def build_engine(args, config, recorder):
+    """
+    The TrackingEngine for the selected backend, with the simulation
+    stand-ins and the session replayer (or None) that feed it.
+    """
+    from engine import TrackingEngine
+    from arena import Arena
+
+    arena = Arena.from_config(config["arena"])
+    stand_ins = []
+    replayer = None
+    if args.replay:
+        engine = TrackingEngine([{"name": "drone1", "uri": None, "tag": 0}], scoring=config["scoring"],
+                                arena=arena, outliers=config["outliers"], multilateration=config["multilateration"],
+                                fusion=config["fusion"], audio=config["audio"])
+        replayer = SessionReplayer(SessionLog(args.replay), engine.tracker,
+                                   engine.registry[0].telemetry, speed=args.speed)
+    elif config["backend"] == "simulation":
+        serial_port, drones, stand_ins = start_simulation(config, arena)
+        engine = TrackingEngine(drones, serial_port=serial_port, recorder=recorder,
+                                telemetry_format=config["telemetry_format"], scoring=config["scoring"],
+                                arena=arena, outliers=config["outliers"], multilateration=config["multilateration"],
+                                fusion=config["fusion"], audio=config["audio"], control=config["control"])
+    else:
+        engine = TrackingEngine(configured_drones(config), serial_port=config["serial_port"],
+                                baud_rate=config["baud_rate"], recorder=recorder,
+                                toc_cache=config["toc_cache"], telemetry_format=config["telemetry_format"],
+                                scoring=config["scoring"], arena=arena, outliers=config["outliers"],
+                                multilateration=config["multilateration"], fusion=config["fusion"],
+                                audio=config["audio"], control=config["control"])
+    return engine, stand_ins, replayer
+
+def start_metrics_export(config):
+    """
+    Starts the configured Prometheus exporters; returns them for stopping.
+    """
+    from metrics import MetricsFileWriter, MetricsServer
+
+    exporters = []
+    settings = config["metrics"]
+    if settings["file"]:
+        exporters.append(MetricsFileWriter(settings["file"], settings["interval"]))
+    if settings["port"]:
+        exporters.append(MetricsServer(settings["port"]))
+    for exporter in exporters:
+        exporter.start()
+    return exporters
+
+def build_runner(engine, io_backend):
+    """
+    What starts and stops the engine: the engine itself (threads) or an
+    async_io.AsyncEngine driving it.
+    """
+    if io_backend == "asyncio":
+        from async_io import AsyncEngine
+        return AsyncEngine(engine)
+    return engine
+
+def run_gui(engine, runner, replayer, qt_args):
+    from PyQt5.QtWidgets import QApplication
+    from main_form import MainForm
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    loop = None
+    if runner is not engine:
+        # On Qt's own loop when qasync is available, else in a thread.
+        from async_io import qt_event_loop
+        loop = qt_event_loop(app)
+        runner.start(loop)
+    main_window = MainForm(engine=engine)
+    main_window.show()
+    if replayer is not None:
+        replayer.start()
+    if loop is not None:
+        loop.run_forever()
+        return 0
+    return app.exec_()
+
+def run_gui_with_worker(args, config, qt_args):
+    """
+    The GUI on a process_engine.ProcessEngine. The worker process opens
+    the devices, records the session and exports the metrics.
+    """
+    from arena import Arena
+    from process_engine import ProcessEngine
+
+    engine = ProcessEngine(args, config, drone_names(args, config), Arena.from_config(config["arena"]))
+    try:
+        return run_gui(engine, engine, None, qt_args)
+    finally:
+        engine.stop()
+
+def run_headless(args, engine, runner, replayer):
+    """
+    Runs the engine without Qt until Ctrl-C, --duration or the end of the
+    replay, streaming events as JSON lines. When they go to stdout the
+    diagnostics are moved to stderr.
+    """
+    from engine import JsonLinesWriter
+
+    out = sys.stdout if args.events == '-' else open(args.events, 'a', encoding='utf-8')
+    events = engine.subscribe(args.event_types)
+    writer = JsonLinesWriter(events, out, engine.registry)
+    done = threading.Event()
+    if replayer is not None:
+        replayer.on_finished = done.set
+
+    with contextlib.redirect_stdout(sys.stderr if out is sys.stdout else sys.stdout):
+        writer.start()
+        runner.start()
+        if replayer is not None:
+            replayer.start()
+        try:
+            done.wait(args.duration)
+        except KeyboardInterrupt:
+            pass
+        if replayer is not None:
+            replayer.stop()
+        runner.stop()
+        writer.stop()
+    if out is not sys.stdout:
+        out.close()
+    print(f"{writer.written} events written, {events.dropped} dropped", file=sys.stderr)
+    return 0
 
 def main():
-    #playsound("wining.mp3")
+    args, qt_args = parse_args(sys.argv)
+    config = load_config(args.config)
+    if args.sim:
+        config["backend"] = "simulation"
+    if args.audio == "off":
+        config["audio"]["enabled"] = False
+    elif args.audio:
+        config["audio"]["sink"] = args.audio
+    if args.control == "off":
+        config["control"]["enabled"] = False
+    elif args.control:
+        config["control"]["enabled"] = True
+        config["control"]["behavior"]["mode"] = args.control
+    if args.lead_time is not None:
+        config["scoring"].update(predictive=True, lead_time=args.lead_time)
+    if args.metrics_file:
+        config["metrics"]["file"] = args.metrics_file
+    if args.metrics_port:
+        config["metrics"]["port"] = args.metrics_port
+    setup_logging(args.log_level or config["log_level"])
+    if not args.headless and (args.worker_process or config["engine_process"]):
+        sys.exit(run_gui_with_worker(args, config, qt_args))
+
     init_drivers()
-    app = QApplication(sys.argv)
-    main_window = MainForm()
-    main_window.show()
-    sys.exit(app.exec_())
+    recorder = SessionRecorder(args.record) if args.record else None
+    engine, stand_ins, replayer = build_engine(args, config, recorder)
+    runner = build_runner(engine, args.io or config["io_backend"])
+    exporters = start_metrics_export(config)
+
+    if args.headless:
+        exit_code = run_headless(args, engine, runner, replayer)
+    else:
+        exit_code = run_gui(engine, runner, replayer, qt_args)
+        runner.stop()
+    for exporter in exporters:
+        exporter.stop()
+    for stand_in in stand_ins:
+        stand_in.stop()
+    if recorder is not None:
+        recorder.close()
+    sys.exit(exit_code)
 
 if __name__ == '__main__':
     main()
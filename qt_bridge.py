@@ -0,0 +1,57 @@
+# qt_bridge.py
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+class EngineBridge(QObject):
+    """
+    Re-emits a TrackingEngine's callbacks as Qt signals.
+
+    The engine calls back from its own, the reader and the radio threads;
+    Qt queues these signals to receivers living in the GUI thread, so
+    widgets connected here are only ever touched from that thread.
+
+    Positions and telemetry arrive far faster than anything is drawn, so
+    they are not queued one by one: the engine's threads only note each
+    drone's newest position and ring sample number, and a display-rate
+    timer in the GUI thread emits what changed since the last frame. A
+    frame delivers one positionUpdated per drone that moved and one
+    telemetryReceived per drone with new samples, with their count.
+    """
+
+    positionUpdated = pyqtSignal(int, object)       # drone, newest filtered position
+    ruleFired = pyqtSignal(str, int)                # rule name, drone
+    telemetryReceived = pyqtSignal(int, int, int)   # drone, newest ring sample number, samples since last frame
+    telemetryMessage = pyqtSignal(int, str)         # drone, status text
+    connectionChanged = pyqtSignal(str, str)        # link name, state
+
+    def __init__(self, engine, parent=None, frame_ms=33):
+        super().__init__(parent)
+        # Written from the engine's threads, emptied by flush(); a single
+        # dict store or pop needs no lock.
+        self._positions = {}
+        self._telemetry = {}
+        self._emitted = {}      # drone -> newest sample number already delivered
+        engine.positionUpdated.connect(self._positions.__setitem__)
+        engine.ruleFired.connect(lambda rule, t, pos, drone: self.ruleFired.emit(rule, drone))
+        engine.telemetryReceived.connect(self._telemetry.__setitem__)
+        engine.telemetryMessage.connect(self.telemetryMessage.emit)
+        engine.connectionChanged.connect(self.connectionChanged.emit)
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.flush)
+        self._timer.start(frame_ms)
+
+    def flush(self):
+        """
+        Emits the newest position and the new telemetry of every drone
+        that has any; called by the frame timer.
+        """
+        for drone in list(self._positions):
+            self.positionUpdated.emit(drone, self._positions.pop(drone))
+        for drone in list(self._telemetry):
+            n = self._telemetry.pop(drone)
+            count = n - self._emitted.get(drone, -1)
+            if count > 0:
+                self._emitted[drone] = n
+                self.telemetryReceived.emit(drone, n, count)
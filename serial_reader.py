@@ -0,0 +1,147 @@
+# serial_reader.py
+
+import time
+import logging
+import threading
+from collections import deque
+
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+PARSE_SECONDS = METRICS.stage("parse")
+READ_BYTES = METRICS.histogram("serial_read_bytes", "Bytes returned by one serial read",
+                               buckets=(1, 16, 64, 256, 1024, 4096, 16384, 65536))
+
+
+class SerialReader(threading.Thread):
+    """
+    Background acquisition thread for the UWB serial feed.
+
+    Everything waiting on the port is read in one call into a preallocated
+    buffer, the decoder splits out complete frames and the parsed fixes are
+    pushed onto a deque that the GUI thread drains. deque.append and
+    deque.popleft are atomic, so no lock is taken on the hot path; the
+    deque is bounded, so a full queue drops its oldest fix within the
+    append itself.
+    """
+
+    def __init__(self, ser, decoder, on_fixes=None, buffer_size=65536, queue_size=4096, recorder=None,
+                 on_error=None):
+        super().__init__(daemon=True)
+        self.ser = ser
+        self.decoder = decoder
+        self.on_fixes = on_fixes
+        # Called from this thread with the exception if the port fails.
+        self.on_error = on_error
+        # Optional session_log.SessionRecorder for the raw bytes.
+        self.recorder = recorder
+
+        # (timestamp, fix) tuples handed over to the consumer thread.
+        self.fixes = deque(maxlen=queue_size)
+        self.queue_size = queue_size
+
+        # -------------------------- Receive Buffer --------------------------
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.fill = 0
+
+        # -------------------------- Counters --------------------------
+        self.bytes_read = 0
+        self.fixes_read = 0
+        self.dropped_fixes = 0
+        self.overflows = 0
+
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.read_available(block=True)
+            except Exception as e:
+                if not self._stop_event.is_set():
+                    log.warning("Serial reader stopped: %s", e)
+                    if self.on_error is not None:
+                        self.on_error(e)
+                break
+
+    def read_available(self, block=False):
+        """
+        Reads everything waiting on the port in one call and decodes it.
+        With block=True waits for at least one byte first; without it, this
+        is the non-blocking read an event loop calls when the port is
+        readable. Returns the number of bytes read.
+        """
+        want = self.ser.in_waiting
+        if block:
+            want = max(1, want)
+        elif not want:
+            # Readable with nothing waiting: let readinto() report the error.
+            want = 1
+        free = len(self.buffer) - self.fill
+        n = self.ser.readinto(self.view[self.fill:self.fill + min(want, free)])
+        if n:
+            t_ns = time.monotonic_ns()
+            READ_BYTES.observe(n)
+            if self.recorder is not None:
+                self.recorder.write_serial(t_ns, self.view[self.fill:self.fill + n])
+            self.ingest(n, t_ns * 1e-9)
+        return n
+
+    def feed(self, data, t=None):
+        """
+        Injects bytes as if they had just been read from the port. Used by
+        replay and simulation; call from a single thread only.
+        """
+        t = time.monotonic() if t is None else t
+        data = memoryview(data)
+        while len(data):
+            n = min(len(data), len(self.buffer) - self.fill)
+            self.buffer[self.fill:self.fill + n] = data[:n]
+            data = data[n:]
+            self.ingest(n, t)
+
+    def ingest(self, n, t):
+        self.bytes_read += n
+        self.fill += n
+        if self.decode_buffer(t) and self.on_fixes is not None:
+            self.on_fixes()
+
+    def decode_buffer(self, t):
+        """
+        Decodes every complete frame in the buffer and keeps the partial tail.
+        Returns the number of fixes queued.
+        """
+        queued = self.fixes_read
+        t0 = time.perf_counter()
+        consumed = self.decoder.decode(self.buffer, self.fill, t, self.push)
+        PARSE_SECONDS.observe(time.perf_counter() - t0)
+
+        if consumed:
+            # Move the partial frame to the front of the buffer.
+            remaining = self.fill - consumed
+            self.buffer[:remaining] = self.buffer[consumed:self.fill]
+            self.fill = remaining
+        elif self.fill == len(self.buffer):
+            # A full buffer without a single complete frame is garbage; start over.
+            self.overflows += 1
+            self.fill = 0
+
+        return self.fixes_read - queued
+
+    def push(self, t, fix):
+        self.fixes_read += 1
+        # The consumer may drain the queue in between, so this can count
+        # a drop that did not happen, never miss one or fail.
+        if len(self.fixes) >= self.queue_size:
+            self.dropped_fixes += 1
+        self.fixes.append((t, fix))
+
+    def stop(self):
+        self._stop_event.set()
+        # Wake a blocking read where the platform supports it.
+        if self.ser is not None and hasattr(self.ser, 'cancel_read'):
+            try:
+                self.ser.cancel_read()
+            except Exception:
+                pass
@@ -0,0 +1,248 @@
+# session_log.py
+
+import mmap
+import time
+import struct
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+# ------------------------------------------------------------------
+#   Log layout (little-endian, append-only)
+#
+#   file header   magic "DPLOG\0", version u16, wall-clock start ns i64
+#   record        t_ns u64 (time.monotonic_ns), stream u8, meta u8,
+#                 length u16, then `length` payload bytes
+#
+#   STREAM_SERIAL payloads are raw serial reads, meta unused.
+#   STREAM_CRTP payloads are CRTP packet data, meta = port << 4 | channel.
+# ------------------------------------------------------------------
+MAGIC = b'DPLOG\x00'
+VERSION = 1
+FILE_HEADER = struct.Struct('<6sHq')
+RECORD_HEADER = struct.Struct('<QBBH')
+
+STREAM_SERIAL = 1
+STREAM_CRTP = 2
+
+MAX_PAYLOAD = 0xFFFF
+
+# Stand-in for cflib's CRTPPacket when packets are replayed.
+ReplayPacket = namedtuple('ReplayPacket', ['port', 'channel', 'data'])
+
+
+class SessionRecorder:
+    """
+    Appends raw serial reads and CRTP payloads to a binary session log.
+
+    Safe to call from the serial reader thread and cflib's callback threads
+    at the same time; each record is written under one short lock.
+    """
+
+    def __init__(self, path, buffering=1 << 20):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb', buffering=buffering)
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, time.time_ns()))
+        self.records = 0
+        self.bytes_written = FILE_HEADER.size
+
+    def write_serial(self, t_ns, data):
+        # Serial reads can exceed a record; split them.
+        for i in range(0, len(data), MAX_PAYLOAD):
+            self._write(t_ns, STREAM_SERIAL, 0, data[i:i + MAX_PAYLOAD])
+
+    def write_crtp(self, t_ns, port, channel, data):
+        self._write(t_ns, STREAM_CRTP, ((port & 0x0F) << 4) | (channel & 0x03), data)
+
+    def _write(self, t_ns, stream, meta, data):
+        header = RECORD_HEADER.pack(t_ns, stream, meta, len(data))
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(header)
+            self._file.write(data)
+            self.records += 1
+            self.bytes_written += RECORD_HEADER.size + len(data)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SessionLog:
+    """
+    Memory-mapped, read-only view of a session log.
+
+    Opening a log only walks the record headers to build NumPy index
+    arrays (offset, timestamp, stream, length); payloads are sliced out of
+    the mapping on demand, so multi-gigabyte sessions are never loaded.
+    A truncated final record, e.g. from a crash, is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.start_wall_ns = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a session log")
+        if version != VERSION:
+            raise ValueError(f"unsupported session log version {version}")
+        self._build_index()
+
+    def _build_index(self):
+        offsets, stamps, streams, metas, lengths = [], [], [], [], []
+        size = len(self._map)
+        pos = FILE_HEADER.size
+        unpack = RECORD_HEADER.unpack_from
+        while pos + RECORD_HEADER.size <= size:
+            t_ns, stream, meta, length = unpack(self._map, pos)
+            if pos + RECORD_HEADER.size + length > size:
+                break
+            offsets.append(pos + RECORD_HEADER.size)
+            stamps.append(t_ns)
+            streams.append(stream)
+            metas.append(meta)
+            lengths.append(length)
+            pos += RECORD_HEADER.size + length
+
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.t_ns = np.array(stamps, dtype=np.uint64)
+        self.streams = np.array(streams, dtype=np.uint8)
+        self.metas = np.array(metas, dtype=np.uint8)
+        self.lengths = np.array(lengths, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def duration(self):
+        if not len(self):
+            return 0.0
+        return (int(self.t_ns[-1]) - int(self.t_ns[0])) * 1e-9
+
+    def payload(self, i):
+        start = int(self.offsets[i])
+        return self._map[start:start + int(self.lengths[i])]
+
+    def records(self, start=0, stop=None):
+        """
+        Yields (t_ns, stream, meta, payload) for records start..stop.
+        """
+        stop = len(self) if stop is None else stop
+        for i in range(start, stop):
+            yield int(self.t_ns[i]), int(self.streams[i]), int(self.metas[i]), self.payload(i)
+
+    def index_at(self, t_ns):
+        """
+        Index of the first record at or after monotonic time t_ns.
+        """
+        return int(np.searchsorted(self.t_ns, np.uint64(t_ns)))
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class ReplayClock:
+    """
+    Monotonic clock that runs on the recording's time base during replay.
+
+    At a finite speed it advances `speed` times faster than wall time from
+    the first record; at maximum speed it reads `now`, which whoever
+    consumes the records moves on.
+    """
+
+    def __init__(self, t0, speed):
+        self.t0 = t0
+        self.speed = speed
+        self.wall0 = time.monotonic()
+        self.now = t0
+
+    def __call__(self):
+        if self.speed:
+            return self.t0 + (time.monotonic() - self.wall0) * self.speed
+        return self.now
+
+
+class SessionReplayer(threading.Thread):
+    """
+    Feeds a session log back into DroneTracker and CrazyflieTelemetry.
+
+    speed 1.0 replays in real time, N replays N times faster and 0 runs as
+    fast as the consumers allow. Both consumers are switched to a
+    ReplayClock so timestamps, filtering and cooldowns see the recorded
+    time base instead of the wall clock.
+
+    At maximum speed the replay thread reads ahead of the engine, so the
+    tracker gets a clock of its own that follows the fixes it has taken
+    (see DroneTracker.process_fixes) rather than the newest record read. Its
+    predictions then look as far ahead as they did live, and a replay
+    fires the same rules at the same fixes.
+    """
+
+    def __init__(self, log, tracker=None, telemetry=None, speed=1.0, on_finished=None):
+        super().__init__(daemon=True)
+        self.log = log
+        self.tracker = tracker
+        self.telemetry = telemetry
+        self.speed = speed
+        self.on_finished = on_finished
+        self.records_replayed = 0
+        self._stop_event = threading.Event()
+
+        t0 = int(log.t_ns[0]) * 1e-9 if len(log) else 0.0
+        self.clock = ReplayClock(t0, speed)
+        if telemetry is not None:
+            telemetry.clock = self.clock
+        if tracker is not None:
+            tracker.clock = self.clock if speed else ReplayClock(t0, speed)
+            tracker.clock_follows_fixes = not speed
+
+    def run(self):
+        self.replay()
+
+    def replay(self, drain=False):
+        """
+        Replays the whole log in the calling thread. With drain=True the
+        tracker processes its fixes right after each serial record instead
+        of on its next wake-up, which makes a run fully deterministic; only
+        use it from the thread the tracker lives in.
+        """
+        clock = self.clock
+        clock.wall0 = time.monotonic()
+        for t_ns, stream, meta, payload in self.log.records():
+            if self._stop_event.is_set():
+                break
+
+            t = t_ns * 1e-9
+            if self.speed:
+                delay = (t - clock.t0) / self.speed - (time.monotonic() - clock.wall0)
+                if delay > 0 and self._stop_event.wait(delay):
+                    break
+            else:
+                clock.now = t
+
+            if stream == STREAM_SERIAL and self.tracker is not None:
+                self.tracker.reader.feed(payload, t)
+                if drain:
+                    self.tracker.update()
+            elif stream == STREAM_CRTP and self.telemetry is not None:
+                self.telemetry.packet_callback(ReplayPacket(meta >> 4, meta & 0x03, payload))
+            self.records_replayed += 1
+
+        if self.on_finished is not None:
+            self.on_finished()
+
+    def stop(self):
+        self._stop_event.set()
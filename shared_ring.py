@@ -0,0 +1,95 @@
+# shared_ring.py
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Header: records published so far, capacity. Kept 64 bytes so the records
+# start on their own cache line.
+HEADER_BYTES = 64
+
+
+class SharedRing:
+    """
+    Ring of fixed-size NumPy records in a multiprocessing.shared_memory
+    block, written by one process and read by others without a lock.
+
+    Record n goes to slot n % capacity with n in its 'seq' field. append()
+    stores the record first and then publishes it by advancing the header
+    count. read_since() copies the slots it wants and afterwards keeps
+    only those the writer cannot have reused while they were being
+    copied. A reader that falls a whole ring behind loses records, and it
+    is told how many; it never gets a torn one.
+    """
+
+    def __init__(self, shm, dtype, owner=False):
+        self.shm = shm
+        self.dtype = np.dtype(dtype)
+        self.owner = owner
+        self.header = np.ndarray(2, dtype=np.uint64, buffer=shm.buf)
+        self.capacity = int(self.header[1])
+        self.records = np.ndarray(self.capacity, dtype=self.dtype, buffer=shm.buf, offset=HEADER_BYTES)
+
+    @classmethod
+    def create(cls, dtype, capacity):
+        """
+        A new, empty ring; the creating side unlinks it on close().
+        """
+        dtype = np.dtype(dtype)
+        if dtype.names is None or 'seq' not in dtype.names:
+            raise ValueError("SharedRing records need a 'seq' field")
+        shm = shared_memory.SharedMemory(create=True, size=HEADER_BYTES + capacity * dtype.itemsize)
+        np.ndarray(2, dtype=np.uint64, buffer=shm.buf)[:] = (0, capacity)
+        ring = cls(shm, dtype, owner=True)
+        ring.records['seq'] = np.iinfo(ring.records['seq'].dtype).max
+        return ring
+
+    @classmethod
+    def attach(cls, name, dtype):
+        """
+        The existing ring called `name`, e.g. in a worker process.
+        """
+        return cls(shared_memory.SharedMemory(name=name), dtype)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def count(self):
+        return int(self.header[0])
+
+    def append(self, *values):
+        """
+        Stores one record from its field values after 'seq'; returns its
+        sequence number. Single writer only.
+        """
+        n = int(self.header[0])
+        self.records[n % self.capacity] = (n, *values)
+        self.header[0] = n + 1
+        return n
+
+    def read_since(self, seq):
+        """
+        (records, next seq, lost): copies of the records from sequence
+        number seq on, the seq to ask for next time, and how many records
+        in between were overwritten before they could be read.
+        """
+        count = int(self.header[0])
+        start = max(seq, count - self.capacity)
+        seqs = np.arange(start, count)
+        records = self.records[seqs % self.capacity]
+        # Slots the writer may have reused while they were copied.
+        reused = int(self.header[0]) - self.capacity
+        keep = (seqs > reused) & (records['seq'] == seqs)
+        records = records[keep]
+        return records, count, (count - seq) - len(records)
+
+    def close(self):
+        """
+        Detaches from the block; the creating side also frees it.
+        """
+        self.header = self.records = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,360 @@
+# simulation.py
+
+import os
+import math
+import time
+import threading
+
+import numpy as np
+from cflib.utils.callbacks import Caller
+from cflib.crtp.crtpstack import CRTPPacket
+
+from position_protocol import encode_position_frame, encode_ranges_frame
+from telemetry_protocol import V1_SAMPLE, FORMAT_REQUEST, V2Encoder, is_setpoint, decode_setpoint
+from multilateration import DEFAULT_ANCHORS
+
+TELEMETRY_PORT = 0x0F
+TELEMETRY_CHANNEL = 0x07
+
+# Arena used by the synthetic trajectory (matches the plotted boundary).
+ARENA_CENTER = (147.0, 287.0)
+ARENA_HALF_SIZE = (160.0, 300.0)
+# Simulated multiranger surroundings: walls RANGE_MARGIN outside the arena.
+RANGE_MARGIN = 20.0
+CEILING = 250.0
+# State byte in which a drone flies velocity setpoints, and how long it
+# keeps flying the last one before it stops (as the firmware's watchdog would).
+DIRECTIONAL = 0x14
+SETPOINT_TIMEOUT = 0.5
+
+
+def lissajous(t, center=ARENA_CENTER, half_size=ARENA_HALF_SIZE, period=8.0, height=80.0):
+    """
+    Synthetic drone path: sweeps the whole arena, crossing both goal lines
+    and the virtual wall once per period. Returns (x, y, z).
+    """
+    w = 2.0 * math.pi / period
+    x = center[0] + half_size[0] * math.sin(3.0 * w * t)
+    y = center[1] + half_size[1] * math.sin(w * t)
+    z = height + 10.0 * math.sin(5.0 * w * t)
+    return x, y, z
+
+
+def offset_trajectory(trajectory, dt):
+    """
+    The same path, `dt` seconds ahead; gives each simulated drone its own position.
+    """
+    return lambda t: trajectory(t + dt)
+
+
+class SteerablePath:
+    """
+    A trajectory that velocity setpoints can take over, shared by a
+    drone's FakeCrazyflie and the VirtualSerialAnchor so the host sees
+    where it steered the drone.
+
+    It follows `trajectory` until the first steer(); from then on the
+    drone flies the last velocity (arena units per second) on the wall
+    clock, whatever t it is asked for, and stops when no setpoint came
+    for `timeout` seconds. It never leaves the arena rectangle.
+    """
+
+    def __init__(self, trajectory=lissajous, timeout=SETPOINT_TIMEOUT, center=ARENA_CENTER,
+                 half_size=ARENA_HALF_SIZE):
+        self.trajectory = trajectory
+        self.timeout = timeout
+        self.lo = np.subtract(center, half_size)
+        self.hi = np.add(center, half_size)
+        self.clock = time.monotonic
+        self.steered = False
+        self._last = (0.0, 0.0, 0.0)
+        self._origin = None      # (t, x, y) the current velocity flies from
+        self._velocity = (0.0, 0.0)
+        self._lock = threading.Lock()
+
+    def __call__(self, t):
+        with self._lock:
+            if not self.steered:
+                self._last = self.trajectory(t)
+                return self._last
+            return self._position(self.clock())
+
+    def _position(self, now):
+        t0, x0, y0 = self._origin
+        dt = min(now, t0 + self.timeout) - t0
+        x, y = np.clip((x0 + self._velocity[0] * dt, y0 + self._velocity[1] * dt), self.lo, self.hi)
+        return float(x), float(y), self._last[2]
+
+    def steer(self, vx, vy):
+        with self._lock:
+            now = self.clock()
+            x, y, _ = self._position(now) if self.steered else self._last
+            self.steered = True
+            self._origin = (now, x, y)
+            self._velocity = (vx, vy)
+
+
+class RateTicker:
+    """
+    Tells a producer loop how many items are due, so high rates are served
+    in bursts instead of relying on sub-millisecond sleeps.
+    """
+
+    def __init__(self, rate_hz, max_burst=1000):
+        self.period = 1.0 / rate_hz
+        self.max_burst = max_burst
+        self.t0 = time.monotonic()
+        self.sent = 0
+
+    def due(self):
+        count = int((time.monotonic() - self.t0) / self.period) + 1 - self.sent
+        return max(0, min(count, self.max_burst))
+
+    def wait(self, stop_event):
+        next_t = self.t0 + self.sent * self.period
+        return stop_event.wait(max(0.0, min(next_t - time.monotonic(), 0.05)))
+
+
+class VirtualSerialAnchor(threading.Thread):
+    """
+    pty-backed stand-in for the UWB anchor's serial port (Linux/macOS).
+
+    Open `port` like any serial device. The thread writes the trajectory as
+    binary position frames, legacy text lines or raw anchor ranges at
+    rate_hz, which can go far beyond what the real anchor delivers. With
+    several tags every tick carries one frame per tag, each following the
+    trajectory `tag_spacing` seconds apart, or its own of `trajectories`.
+    """
+
+    def __init__(self, rate_hz=50.0, frame_format='binary', trajectory=lissajous,
+                 position_noise=2.0, anchors=DEFAULT_ANCHORS, tags=(0,), tag_spacing=2.0, seed=0,
+                 trajectories=None):
+        super().__init__(daemon=True)
+        import pty
+        import tty
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.rate_hz = rate_hz
+        self.frame_format = frame_format
+        self.trajectory = trajectory
+        self.position_noise = position_noise
+        self.anchors = np.asarray(anchors, dtype=float)
+        self.tags = list(tags)
+        self.tag_spacing = tag_spacing
+        self.trajectories = trajectories
+        self.rng = np.random.default_rng(seed)
+
+        self.frames_sent = 0
+        self._stop_event = threading.Event()
+
+    def encode(self, seq, t):
+        return b''.join(self.encode_tag(seq, t, i, tag) for i, tag in enumerate(self.tags))
+
+    def encode_tag(self, seq, t, index, tag):
+        if self.trajectories is not None:
+            x, y, z = self.trajectories[index](t)
+        else:
+            x, y, z = self.trajectory(t + index * self.tag_spacing)
+        if self.frame_format == 'ranges':
+            ranges = np.hypot(self.anchors[:, 0] - x, self.anchors[:, 1] - y)
+            ranges += self.rng.normal(0.0, self.position_noise, len(ranges))
+            return encode_ranges_frame(ranges, seq, int(t * 1e6), tag)
+
+        x, y, z = np.array([x, y, z]) + self.rng.normal(0.0, self.position_noise, 3)
+        if self.frame_format == 'text':
+            # The text format has no tag; only the first drone is sent.
+            return f"[{x:.2f}, {y:.2f}, {z:.2f}]\n".encode() if index == 0 else b''
+        return encode_position_frame(x, y, z, seq, int(t * 1e6), tag)
+
+    def run(self):
+        ticker = RateTicker(self.rate_hz)
+        while not self._stop_event.is_set():
+            count = ticker.due()
+            if count:
+                chunk = b''.join(self.encode(ticker.sent + i, (ticker.sent + i) * ticker.period)
+                                 for i in range(count))
+                try:
+                    os.write(self.master, chunk)
+                except OSError:
+                    break
+                ticker.sent += count
+                self.frames_sent += count
+            ticker.wait(self._stop_event)
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout=1.0)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class FakeCrazyflie:
+    """
+    In-process stand-in for cflib's Crazyflie, covering the calls this
+    application makes.
+
+    open_link() "connects" at once and starts a thread that samples
+    telemetry at telemetry_rate_hz and delivers it on the telemetry port,
+    as 16-byte v1 packets or, once the host asks for it and 2 is in
+    `versions`, as multi-sample v2 packets after echoing the request.
+    `packet_loss` drops that
+    fraction of packets at random. Packets passed to send_packet() are
+    recorded, and single-byte state commands are reflected in the low
+    byte of the telemetry flags. Velocity setpoints are kept in
+    `setpoints` and, in DIRECTIONAL, steer a SteerablePath trajectory.
+
+    For exercising reconnects, `connect_delay` makes the connected callback
+    arrive that much later from another thread (as cflib's does after the
+    TOC download), the first `connect_failures` attempts report
+    connection_failed, and drop_link() simulates a lost link.
+    """
+
+    def __init__(self, telemetry_rate_hz=100.0, trajectory=lissajous, seed=0,
+                 versions=(1, 2), packet_loss=0.0, connect_delay=0.0, connect_failures=0):
+        self.connected = Caller()
+        self.disconnected = Caller()
+        self.connection_failed = Caller()
+        self.connection_lost = Caller()
+        self.link_uri = None
+
+        self.telemetry_rate_hz = telemetry_rate_hz
+        self.trajectory = trajectory
+        self.rng = np.random.default_rng(seed)
+        self.state = 0
+        self.versions = versions
+        self.format_version = 1
+        self.packet_loss = packet_loss
+        self.packets_dropped = 0
+        self.connect_delay = connect_delay
+        self.connect_failures = connect_failures
+        self.port_callbacks = {}
+        self.sent_packets = []
+        self.setpoints = []      # (time.monotonic, vx, vy, vz, yaw rate) in mm/s, deg/s
+        self.packets_delivered = 0
+
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    # -----------------------------------------------------------------
+    #   cflib Crazyflie API
+    # -----------------------------------------------------------------
+    def open_link(self, link_uri):
+        if self.connect_delay:
+            threading.Timer(self.connect_delay, self._connect, args=(link_uri,)).start()
+        else:
+            self._connect(link_uri)
+
+    def _connect(self, link_uri):
+        if self.connect_failures > 0:
+            self.connect_failures -= 1
+            self.connection_failed.call(link_uri, "simulated connection failure")
+            return
+        self.link_uri = link_uri
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.connected.call(link_uri)
+
+    def drop_link(self, msg="simulated link loss"):
+        """
+        Stops the telemetry stream and reports the link lost, as cflib does
+        when the radio stops answering.
+        """
+        link_uri = self.link_uri
+        self.close_link()
+        if link_uri is not None:
+            self.connection_lost.call(link_uri, msg)
+
+    def close_link(self):
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+        if self.link_uri is not None:
+            self.disconnected.call(self.link_uri)
+        self.link_uri = None
+
+    def is_connected(self):
+        return self._thread is not None
+
+    def add_port_callback(self, port, cb):
+        self.port_callbacks.setdefault(port, Caller()).add_callback(cb)
+
+    def remove_port_callback(self, port, cb):
+        self.port_callbacks[port].remove_callback(cb)
+
+    def send_packet(self, pk):
+        self.sent_packets.append((time.monotonic(), pk.port, pk.channel, bytes(pk.data)))
+        if pk.port == TELEMETRY_PORT and len(pk.data) == 1:
+            self.state = pk.data[0]
+        elif pk.port == TELEMETRY_PORT and len(pk.data) == 2 and pk.data[0] == FORMAT_REQUEST:
+            if pk.data[1] in self.versions:
+                # Echoed ahead of the first packet in the new format. cflib
+                # retries until the radio acknowledges, so the simulated
+                # telemetry loss does not apply.
+                callbacks = self.port_callbacks.get(TELEMETRY_PORT)
+                if callbacks is not None:
+                    callbacks.call(self.telemetry_packet(0.0, bytes(pk.data)))
+                self.format_version = pk.data[1]
+        elif pk.port == TELEMETRY_PORT and is_setpoint(pk.data):
+            vx, vy, vz, yaw_rate = decode_setpoint(pk.data)
+            self.setpoints.append((self.sent_packets[-1][0], vx, vy, vz, yaw_rate))
+            steer = getattr(self.trajectory, "steer", None)
+            if self.state == DIRECTIONAL and steer is not None:
+                steer(vx / 10.0, vy / 10.0)
+
+    # -----------------------------------------------------------------
+    #   Telemetry generator
+    # -----------------------------------------------------------------
+    def telemetry_sample(self, t):
+        """
+        (flags, front, back, left, right, up, height, yaw) at time t.
+        """
+        x, y, z = self.trajectory(t)
+        # Multiranger distances (mm) to walls just outside the arena, with
+        # sensor noise; they change smoothly, as real readings do.
+        (cx, cy), (hx, hy) = ARENA_CENTER, ARENA_HALF_SIZE
+        walls = (cy + hy + RANGE_MARGIN - y, y - cy + hy + RANGE_MARGIN,
+                 x - cx + hx + RANGE_MARGIN, cx + hx + RANGE_MARGIN - x, CEILING - z)
+        ranges = np.clip(np.asarray(walls) * 10.0 + self.rng.normal(0.0, 5.0, 5), 0, 0xFFFF)
+        yaw = int((20.0 * t % 360.0) / 360.0 * 65536.0)
+        yaw = yaw - 0x10000 if yaw >= 0x8000 else yaw
+        return (self.state, *(int(r) for r in ranges), int(max(z, 0.0) * 10.0), yaw)
+
+    def telemetry_packet(self, t, data=None):
+        pk = CRTPPacket()
+        pk.port = TELEMETRY_PORT
+        pk.channel = TELEMETRY_CHANNEL
+        pk.data = data if data is not None else V1_SAMPLE.pack(*self.telemetry_sample(t))
+        return pk
+
+    def _deliver(self, pk):
+        if self.packet_loss and self.rng.random() < self.packet_loss:
+            self.packets_dropped += 1
+            return
+        callbacks = self.port_callbacks.get(pk.port)
+        if callbacks is not None:
+            callbacks.call(pk)
+            self.packets_delivered += 1
+
+    def _run(self):
+        ticker = RateTicker(self.telemetry_rate_hz)
+        encoder = V2Encoder(max(1, round(1000.0 * ticker.period)))
+        while not self._stop_event.is_set():
+            for _ in range(ticker.due()):
+                t = ticker.sent * ticker.period
+                ticker.sent += 1
+                if self.format_version == 2:
+                    for payload in encoder.add(int(t * 1000.0), self.telemetry_sample(t)):
+                        self._deliver(self.telemetry_packet(t, payload))
+                else:
+                    self._deliver(self.telemetry_packet(t))
+            ticker.wait(self._stop_event)
@@ -0,0 +1,88 @@
+# stats_panel.py
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView
+
+from metrics import METRICS, RateMeter
+
+COLUMNS = ("Metric", "Value", "Rate / p50", "p99")
+
+
+def metric_label(name, labels):
+    if not labels:
+        return name
+    return f"{name} {' '.join(str(v) for v in labels.values())}"
+
+
+def format_seconds(value):
+    if value is None:
+        return "-"
+    if value < 1e-3:
+        return f"{value * 1e6:.0f} us"
+    if value < 1.0:
+        return f"{value * 1e3:.2f} ms"
+    return f"{value:.2f} s"
+
+
+class StatsPanel(QWidget):
+    """
+    Live table of the metrics registry: counters with their rate per
+    second, gauges, and latency histograms as count, median and p99.
+    Refreshed every `interval_ms` while visible, so a hidden panel costs
+    nothing.
+    """
+
+    def __init__(self, parent=None, registry=METRICS, interval_ms=1000):
+        super().__init__(parent)
+        self.registry = registry
+        self.meter = RateMeter()
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(interval_ms)
+
+    def rows(self):
+        rates = self.meter.rates(self.registry)
+        rows = []
+        for name, labels, metric in self.registry.collect():
+            label = metric_label(name, labels)
+            if metric.kind == "histogram":
+                if not metric.count:
+                    continue
+                if name.endswith("_seconds"):
+                    rows.append((label, str(metric.count), format_seconds(metric.quantile(0.5)),
+                                 format_seconds(metric.quantile(0.99))))
+                else:
+                    rows.append((label, str(metric.count), f"{metric.quantile(0.5):.0f}",
+                                 f"{metric.quantile(0.99):.0f}"))
+                continue
+            try:
+                value = metric.value
+            except Exception:
+                continue
+            rate = rates.get((name, tuple(sorted(labels.items()))))
+            rows.append((label, str(value), f"{rate:.1f}/s" if rate is not None else "", ""))
+        return rows
+
+    def refresh(self):
+        if not self.isVisible():
+            return
+        rows = self.rows()
+        self.table.setRowCount(len(rows))
+        for r, row in enumerate(rows):
+            for c, text in enumerate(row):
+                item = self.table.item(r, c)
+                if item is None:
+                    self.table.setItem(r, c, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
@@ -0,0 +1,250 @@
+# telemetry_protocol.py
+
+import struct
+from collections import deque
+
+from position_protocol import SequenceStats
+
+# ------------------------------------------------------------------
+#   Telemetry payloads on port 0x0F (big-endian)
+#
+#   v1, 16 bytes, one sample:
+#     flags u16, multiranger front/back/left/right/up u16 mm,
+#     height u16 mm, yaw i16 (65536 = full turn)
+#
+#   v2, up to 30 bytes (one CRTP payload), several samples:
+#     head    u8    0x20 | sample count
+#     seq     u16   sequence number of the first sample, wraps
+#     t_ms    u16   device time of the first sample in ms, wraps
+#     period  u8    ms between consecutive samples
+#     sample 0      as v1 (16 bytes)
+#     sample k > 0  multiranger x5, height, yaw as i8 changes from
+#                   sample k-1 (7 bytes); flags are those of sample 0
+#
+#   The device falls back to a one-sample packet whenever a change does
+#   not fit in an i8, so v2 is lossless.
+#
+#   The header and the absolute first sample take 22 of the 30 bytes,
+#   which leaves room for a single delta: V2_MAX_SAMPLES is 2. v2 thus
+#   halves the packet rate for the same samples (29 bytes for two, not
+#   2 x 16) and no more; narrower deltas would overflow on multiranger
+#   noise (several mm per sample) most of the time.
+#
+#   The host asks for v2 with a FORMAT_REQUEST packet on connect. A
+#   device that supports the version echoes the request back before its
+#   first v2 packet; one that does not keeps sending v1. The host decodes
+#   every packet as the version last acknowledged, v1 until then.
+# ------------------------------------------------------------------
+MAX_PAYLOAD = 30
+
+V1_SAMPLE = struct.Struct('>7Hh')
+V1_SIZE = V1_SAMPLE.size
+
+V2_VERSION = 2
+V2_HEADER = struct.Struct('>BHHB')
+V2_DELTA = struct.Struct('>7b')
+V2_MAX_SAMPLES = 1 + (MAX_PAYLOAD - V2_HEADER.size - V1_SIZE) // V2_DELTA.size   # 2
+
+# Host -> device: [FORMAT_REQUEST, version]; the device echoes it to accept.
+FORMAT_REQUEST = 0x7F
+
+# Host -> device while the drone is in DIRECTIONAL (0x14):
+#   [VELOCITY_SETPOINT, vx, vy, vz, yaw rate], velocities i16 in mm/s in
+#   arena axes, yaw rate i16 in deg/s. State commands stay single bytes.
+VELOCITY_SETPOINT = 0x7E
+SETPOINT = struct.Struct('>B4h')
+
+
+def format_request(version):
+    return bytes([FORMAT_REQUEST, version])
+
+
+def encode_setpoint(vx, vy, vz=0.0, yaw_rate=0.0):
+    """
+    A VELOCITY_SETPOINT payload; values are rounded and clipped to i16.
+    """
+    return SETPOINT.pack(VELOCITY_SETPOINT, *(max(-32768, min(32767, int(round(v))))
+                                              for v in (vx, vy, vz, yaw_rate)))
+
+
+def decode_setpoint(data):
+    """
+    (vx, vy, vz, yaw_rate) from a VELOCITY_SETPOINT payload.
+    """
+    return SETPOINT.unpack_from(data)[1:]
+
+
+def is_setpoint(data):
+    return len(data) == SETPOINT.size and data[0] == VELOCITY_SETPOINT
+
+
+def is_format_ack(data):
+    return len(data) == 2 and data[0] == FORMAT_REQUEST
+
+
+def v2_complete(data):
+    """
+    True if data is as long as the sample count in its v2 header says.
+    """
+    count = data[0] & 0x0F if data else 0
+    return 0 < count <= V2_MAX_SAMPLES and len(data) == V2_HEADER.size + V1_SIZE + (count - 1) * V2_DELTA.size
+
+
+def encode_v2(seq, t_ms, period_ms, samples):
+    """
+    Packs samples (flags, f, b, l, r, u, height, yaw) into one v2 payload.
+    Raises ValueError if there are too many or a change does not fit.
+    """
+    if not 0 < len(samples) <= V2_MAX_SAMPLES:
+        raise ValueError(f"a v2 payload holds 1..{V2_MAX_SAMPLES} samples")
+    parts = [V2_HEADER.pack(0x20 | len(samples), seq & 0xFFFF, t_ms & 0xFFFF, period_ms),
+             V1_SAMPLE.pack(*samples[0])]
+    for prev, cur in zip(samples, samples[1:]):
+        parts.append(V2_DELTA.pack(*(c - p for c, p in zip(cur[1:], prev[1:]))))
+    return b''.join(parts)
+
+
+def fits_delta(prev, cur):
+    """
+    True if cur can follow prev in the same v2 payload.
+    """
+    return cur[0] == prev[0] and all(-128 <= c - p <= 127 for c, p in zip(cur[1:], prev[1:]))
+
+
+def decode_v2(data):
+    """
+    Returns (seq, t_ms, period_ms, samples) from a v2 payload.
+    """
+    head, seq, t_ms, period = V2_HEADER.unpack_from(data)
+    count = head & 0x0F
+    sample = V1_SAMPLE.unpack_from(data, V2_HEADER.size)
+    samples = [sample]
+    offset = V2_HEADER.size + V1_SIZE
+    for _ in range(count - 1):
+        delta = V2_DELTA.unpack_from(data, offset)
+        sample = (sample[0],) + tuple(v + d for v, d in zip(sample[1:], delta))
+        samples.append(sample)
+        offset += V2_DELTA.size
+    return seq, t_ms, period, samples
+
+
+class V2Encoder:
+    """
+    Device-side packer: collects samples and returns a payload once no
+    more fit. Used by the simulated Crazyflie.
+    """
+
+    def __init__(self, period_ms):
+        self.period_ms = period_ms
+        self.pending = []
+        self.seq = 0
+        self.t_ms = 0
+
+    def add(self, t_ms, sample):
+        """
+        Adds a sample; returns the list of payloads it completed.
+        """
+        out = []
+        if self.pending and not fits_delta(self.pending[-1], sample):
+            out.append(self.flush())
+        if not self.pending:
+            self.t_ms = t_ms
+        self.pending.append(sample)
+        if len(self.pending) == V2_MAX_SAMPLES:
+            out.append(self.flush())
+        return out
+
+    def flush(self):
+        if not self.pending:
+            return None
+        payload = encode_v2(self.seq, self.t_ms, self.period_ms, self.pending)
+        self.seq = (self.seq + len(self.pending)) & 0xFFFF
+        self.pending = []
+        return payload
+
+
+class LinkStats:
+    """
+    Radio link quality from v2 telemetry.
+
+    Sequence numbers give lost and out-of-order samples. Sample age is the
+    host arrival time minus the device timestamp, measured relative to the
+    quickest delivery seen (the clocks are not synchronized), so it shows
+    queueing, batching and retry delays on top of the best case.
+    """
+
+    def __init__(self, window=256):
+        self.sequence = SequenceStats()
+        self.packets = 0
+        self.v1_packets = 0
+        self.malformed = 0      # v2 packets whose length does not match their header
+        self.ages = deque(maxlen=window)
+        self._device_ms = None
+        self._last_t_ms = None
+        self._offset = None
+
+    def restart(self):
+        """
+        Forgets the sequence and clock position, keeping the totals; call
+        when the link reconnects and the device starts counting again.
+        """
+        self.sequence.expected.clear()
+        self._last_t_ms = None
+        self._offset = None
+
+    def update_v1(self):
+        self.v1_packets += 1
+
+    def update(self, t, seq, t_ms, period_ms, count):
+        """
+        Records a v2 packet that arrived at host time t (seconds).
+        """
+        self.packets += 1
+        for k in range(count):
+            self.sequence.update(0, (seq + k) & 0xFFFF)
+
+        # Unwrap the u16 millisecond clock; late packets step backwards.
+        if self._last_t_ms is None:
+            self._device_ms = t_ms
+        else:
+            step = (t_ms - self._last_t_ms) & 0xFFFF
+            self._device_ms += step if step < 0x8000 else step - 0x10000
+        self._last_t_ms = t_ms
+
+        newest = (self._device_ms + (count - 1) * period_ms) * 1e-3
+        delay = t - newest
+        if self._offset is None or delay < self._offset:
+            self._offset = delay
+        for k in range(count):
+            self.ages.append(delay - self._offset + (count - 1 - k) * period_ms * 1e-3)
+
+    @property
+    def samples(self):
+        return self.sequence.received
+
+    @property
+    def lost(self):
+        return self.sequence.lost
+
+    @property
+    def out_of_order(self):
+        return self.sequence.out_of_order
+
+    @property
+    def loss_rate(self):
+        return self.sequence.loss_rate
+
+    @property
+    def mean_age(self):
+        return sum(self.ages) / len(self.ages) if self.ages else 0.0
+
+    @property
+    def max_age(self):
+        return max(self.ages) if self.ages else 0.0
+
+    def summary(self):
+        if not self.packets:
+            return f"v1: {self.v1_packets} packets" if self.v1_packets else "no telemetry"
+        return (f"v2: {self.samples / self.packets:.1f} samples/packet, "
+                f"loss {100.0 * self.loss_rate:.1f}%, {self.out_of_order} reordered, "
+                f"age {1e3 * self.mean_age:.1f}/{1e3 * self.max_age:.1f} ms")
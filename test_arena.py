@@ -0,0 +1,33 @@
+# test_arena.py
+
+import numpy as np
+
+from arena import Arena, ZoneIndex, ARENA_ZONE
+
+POLYGONS = [
+    [[0, 0], [5, 573], [295, 570], [289, 0]],                   # the default boundary
+    [[50, 50], [250, 50], [250, 250], [150, 120], [50, 250]],   # concave
+    [[100, 100], [200, 300], [100, 500]],                       # overlaps both
+    [[10, 400], [280, 402], [280, 403], [10, 401]],             # a sliver thinner than a cell
+]
+
+
+def test_contains_equals_exact():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-50.0, 650.0, (20000, 2))
+    # Points right next to the vertices and edges as well.
+    a = np.vstack([np.asarray(p, dtype=float) for p in POLYGONS])
+    b = np.vstack([np.roll(np.asarray(p, dtype=float), -1, axis=0) for p in POLYGONS])
+    s = rng.uniform(0.0, 1.0, (len(a), 50))[..., None]
+    near = (a[:, None] + s * (b - a)[:, None]).reshape(-1, 2) + rng.normal(0.0, 0.5, (len(a) * 50, 2))
+    points = np.vstack([points, near])
+    for cells in (8, 64):
+        index = ZoneIndex(POLYGONS, cells=cells)
+        assert np.array_equal(index.contains(points), index.exact(points))
+
+
+def test_arena_zone_names_follow_the_polygons():
+    arena = Arena(boundary=POLYGONS[0], zones=[{"name": "box", "polygon": POLYGONS[1]}])
+    assert arena.zone_names == [ARENA_ZONE, "box"]
+    inside = arena.contains(np.array([[100.0, 80.0, 0.0], [150.0, 200.0, 0.0], [400.0, 80.0, 0.0]]))
+    assert inside.tolist() == [[True, True], [True, False], [False, False]]
@@ -0,0 +1,41 @@
+# test_audio.py
+
+import wave
+
+import numpy as np
+import pytest
+
+import audio
+from audio import AudioEngine
+
+
+def write_wav(path, seconds=0.05, rate=22050):
+    tone = (np.sin(np.arange(int(seconds * rate)) * 0.1) * 8000).astype('<i2')
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(tone.tobytes())
+    return str(path)
+
+
+def test_wav_effects_play_without_miniaudio(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio, "miniaudio", None)
+    engine = AudioEngine({"goal": write_wav(tmp_path / "goal.wav")}, sink="null")
+    assert engine.effects["goal"].shape[1] == audio.CHANNELS
+    engine.play("goal")
+    block = engine.render(256)
+    assert np.abs(block).max() > 0
+    assert engine.played == 1
+
+
+def test_device_sink_without_miniaudio_fails_loudly(monkeypatch):
+    monkeypatch.setattr(audio, "miniaudio", None)
+    with pytest.raises(RuntimeError, match="miniaudio"):
+        AudioEngine({}, sink="device")
+
+
+def test_mp3_effects_without_miniaudio_fail_loudly(monkeypatch):
+    monkeypatch.setattr(audio, "miniaudio", None)
+    with pytest.raises(RuntimeError, match="wining.mp3"):
+        AudioEngine({"goal": "wining.mp3"}, sink="null")
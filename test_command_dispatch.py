@@ -0,0 +1,37 @@
+# test_command_dispatch.py
+
+import time
+import threading
+
+from command_dispatch import CommandDispatcher, PRIORITY_CRITICAL, PRIORITY_GAME
+
+
+def test_land_moved_up_to_critical_drops_lower_lanes():
+    dispatcher = CommandDispatcher(lambda value: None)
+    dispatcher.submit(0x08, PRIORITY_GAME)
+    dispatcher.submit(0x01)
+    dispatcher.submit(0x04)
+    assert not dispatcher.submit(0x08, PRIORITY_CRITICAL)
+    assert list(dispatcher.lanes[PRIORITY_CRITICAL]) == [0x08]
+    assert not any(dispatcher.lanes[PRIORITY_CRITICAL + 1:])
+
+
+def test_timeout_callback_may_use_the_dispatcher():
+    called = threading.Event()
+
+    def on_timeout(value):
+        dispatcher.stats()
+        dispatcher.submit(0x08)
+        called.set()
+
+    dispatcher = CommandDispatcher(lambda value: None, ack_timeout=0.05, on_timeout=on_timeout)
+    dispatcher.start()
+    try:
+        dispatcher.submit(0x04)
+        assert called.wait(2.0)
+        deadline = time.monotonic() + 2.0
+        while dispatcher.sent < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert dispatcher.sent == 2
+    finally:
+        dispatcher.stop()
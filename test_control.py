@@ -0,0 +1,49 @@
+# test_control.py
+
+import time
+
+from engine import TrackingEngine
+from simulation import FakeCrazyflie
+from command_dispatch import CommandDispatcher
+from telemetry_protocol import is_setpoint, encode_setpoint
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_setpoints_refused_while_land_pending():
+    sent = []
+    dispatcher = CommandDispatcher(sent.append, send_setpoint=sent.append)
+    assert dispatcher.submit_setpoint(encode_setpoint(100, 0))
+    dispatcher.submit(0x08)
+    assert dispatcher.setpoint is None
+    assert not dispatcher.submit_setpoint(encode_setpoint(100, 0))
+
+
+def test_no_setpoints_after_emergency_stop():
+    cf = FakeCrazyflie()
+    engine = TrackingEngine([{"name": "drone1", "uri": "sim://0", "tag": 0, "crazyflie": cf}],
+                            control={"enabled": True, "rate_hz": 100.0})
+    telemetry = engine.registry[0].telemetry
+    engine.start()
+    try:
+        assert wait_for(engine.connections.all_connected)
+        engine.send_command(0x14)
+        assert wait_for(lambda: len(cf.setpoints) >= 5)
+        engine.emergency_stop()
+        assert not telemetry.send_setpoint(100.0, 0.0)
+        time.sleep(0.3)
+        assert not telemetry.send_setpoint(100.0, 0.0)
+    finally:
+        engine.stop()
+
+    packets = [data for _, _, _, data in cf.sent_packets]
+    assert b'\x08' in packets
+    land = packets.index(b'\x08')
+    assert not any(is_setpoint(data) for data in packets[land:])
@@ -0,0 +1,20 @@
+# test_engine.py
+
+import numpy as np
+
+from engine import TrackingEngine
+from metrics import METRICS
+
+
+def test_event_metrics_cover_every_subscription():
+    engine = TrackingEngine([{"name": "drone1", "uri": None, "tag": 0}])
+    first = engine.subscribe(["position"], maxsize=2)
+    second = engine.subscribe(["position"], maxsize=10)
+    for _ in range(3):
+        engine.positionUpdated.emit(0, np.zeros(3))
+
+    depth = METRICS.gauge("queue_depth", labels={"queue": "events"})
+    dropped = METRICS.counter("events_dropped_total")
+    assert (first.qsize(), first.dropped, second.qsize()) == (2, 1, 3)
+    assert depth.value == 5
+    assert dropped.value == 1
@@ -0,0 +1,51 @@
+# test_estimator.py
+
+import numpy as np
+
+from estimator import KalmanBank, KalmanEstimator
+
+
+def track(n=200, velocity=(80.0, -40.0, 0.0), sigma=3.0, rate_hz=100.0, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / rate_hz
+    truth = np.array([100.0, 200.0, 50.0]) + t[:, None] * np.asarray(velocity)
+    return t, truth, truth + rng.normal(0.0, sigma, truth.shape)
+
+
+def test_tracks_a_constant_velocity():
+    t, truth, fixes = track()
+    kf = KalmanEstimator()
+    for ti, p in zip(t, fixes):
+        estimate = kf.update(ti, p)
+    assert np.allclose(kf.velocity, (80.0, -40.0, 0.0), atol=10.0)
+    assert np.hypot(*(estimate - truth[-1])[:2]) < 3.0
+
+
+def test_predict_extrapolates_up_to_the_horizon_without_changing_the_state():
+    t, truth, _ = track(sigma=0.0)
+    kf = KalmanEstimator(max_horizon=0.2)
+    for ti, p in zip(t, truth):
+        kf.update(ti, p)
+    before = kf.position
+    ahead = kf.predict(t[-1] + 0.1)
+    assert np.allclose(ahead[:2], truth[-1, :2] + 0.1 * np.array([80.0, -40.0]), atol=1.0)
+    assert np.allclose(kf.predict(t[-1] + 5.0), kf.predict(t[-1] + 0.2))
+    assert np.array_equal(kf.position, before)
+
+
+def test_yaw_wraps_across_north():
+    kf = KalmanEstimator()
+    for i, yaw in enumerate([350.0, 355.0, 0.0, 5.0, 10.0]):
+        kf.update_yaw(0.1 * i, yaw)
+    assert kf.yaw < 20.0 or kf.yaw > 340.0
+
+
+def test_bank_matches_its_rows():
+    t, _, fixes = track()
+    bank, single = KalmanBank(2), KalmanBank(2)
+    for ti, p in zip(t, fixes):
+        bank.update([0, 1], [ti, ti], [p, p + 10.0])
+        single.row(0).update(ti, p)
+        single.row(1).update(ti, p + 10.0)
+    assert np.allclose(bank.positions, single.positions)
+    assert np.allclose(bank.velocities, single.velocities)
@@ -0,0 +1,87 @@
+# test_fusion.py
+
+import math
+
+import pytest
+
+from crazyflie_telemetry import CrazyflieTelemetry
+from drone_registry import DroneRegistry, DroneLink
+from fusion import StateFusion
+from simulation import FakeCrazyflie
+from telemetry_protocol import V1_SAMPLE
+
+NO_OBSTACLE = (4000, 4000, 4000, 4000, 4000)
+
+
+class Fixture:
+    def __init__(self, with_telemetry=True, **kwargs):
+        self.telemetry = CrazyflieTelemetry(uri=None, crazyflie=FakeCrazyflie()) if with_telemetry else None
+        registry = DroneRegistry([DroneLink("drone1", telemetry=self.telemetry)])
+        self.now = 0.0
+        self.fusion = StateFusion(registry, clock=lambda: self.now, **kwargs)
+        self.states = []
+        self.fusion.stateFused.connect(self.states.append)
+
+    def sample(self, t, height_mm, yaw_deg, ranges=NO_OBSTACLE):
+        raw_yaw = int(round(yaw_deg / 360.0 * 65536.0)) % 65536
+        raw_yaw -= 0x10000 if raw_yaw >= 0x8000 else 0
+        self.telemetry.clock = lambda: t
+        self.telemetry.packet_callback(self.telemetry.cf.telemetry_packet(
+            t, V1_SAMPLE.pack(0, *ranges, height_mm, raw_yaw)))
+        self.now = max(self.now, t)
+        self.fusion.flush(0)
+
+    def fix(self, t, pos=(100.0, 200.0, 40.0)):
+        self.now = max(self.now, t)
+        self.fusion.add_position(0, t, pos)
+
+
+def test_telemetry_is_interpolated_to_the_fix():
+    f = Fixture()
+    f.sample(1.00, 500, 350.0)
+    f.sample(1.02, 600, 10.0)
+    f.fix(1.01)
+    state, = f.states
+    assert state.z == pytest.approx(55.0)
+    assert min(state.yaw, 360.0 - state.yaw) == pytest.approx(0.0, abs=0.1)
+    assert state.telemetry_age == 0.0
+
+
+def test_fix_waits_for_the_next_sample_but_not_past_max_latency():
+    f = Fixture(max_latency=0.05)
+    f.sample(1.00, 500, 0.0)
+    f.fix(1.01)
+    assert f.states == []
+    f.sample(1.02, 700, 0.0)
+    assert [s.z for s in f.states] == [pytest.approx(60.0)]
+
+    f.fix(1.03)
+    f.now = 1.09
+    f.fusion.flush()
+    assert len(f.states) == 2
+    assert f.states[1].z == pytest.approx(70.0)
+    assert f.states[1].telemetry_age == pytest.approx(0.01)
+    assert f.fusion.held == 1
+
+
+def test_stale_telemetry_is_not_waited_for():
+    f = Fixture(stale_after=0.5)
+    f.sample(1.0, 500, 0.0)
+    f.fix(2.0)
+    assert len(f.states) == 1
+
+
+def test_without_telemetry_the_uwb_height_is_used():
+    f = Fixture(with_telemetry=False)
+    f.fix(1.0, (10.0, 20.0, 30.0))
+    state, = f.states
+    assert state.z == 30.0
+    assert math.isnan(state.yaw) and state.telemetry_age == math.inf
+
+
+def test_nearest_obstacle_and_its_direction():
+    f = Fixture()
+    f.sample(1.00, 500, 0.0, (900, 4000, 300, 4000, 4000))
+    f.sample(1.02, 500, 0.0, (900, 4000, 300, 4000, 4000))
+    f.fix(1.01)
+    assert (f.states[0].obstacle, f.states[0].obstacle_direction) == (300.0, "left")
@@ -0,0 +1,67 @@
+# test_game_rules.py
+
+import numpy as np
+
+from game_rules import RulesEngine, LatencyBudget, horizontal_line
+
+
+def sweep(engine, ys, dt=0.01, t0=0.0, x=100.0, drone=0, vel=None):
+    """
+    Feeds fixes at y = ys, dt apart; returns (t, rule name) of every firing.
+    """
+    fired = []
+    for i, y in enumerate(ys):
+        t = t0 + i * dt
+        for rule in engine.evaluate(t, (x, y, 0.0), drone, vel):
+            fired.append((t, rule.name))
+    return fired
+
+
+def test_one_firing_per_crossing_despite_jitter():
+    engine = RulesEngine([horizontal_line("goal", 50.0, cooldown=0.0)])
+    # Dithers across the line by less than the hysteresis on its way over.
+    ys = np.concatenate([np.linspace(0.0, 49.0, 50), [50.5, 49.5, 51.0, 49.2, 50.8], np.linspace(52.0, 100.0, 20)])
+    assert [name for _, name in sweep(engine, ys)] == ["goal"]
+    assert engine.reactive == 1
+
+
+def test_cooldown_is_honoured():
+    engine = RulesEngine([horizontal_line("goal", 50.0, cooldown=1.0)])
+    there_and_back = [40.0, 60.0, 40.0, 60.0]
+    fired = sweep(engine, there_and_back, dt=0.1)
+    assert len(fired) == 1
+    fired = sweep(engine, [40.0, 60.0], dt=0.1, t0=1.5)
+    assert len(fired) == 1
+
+
+def test_wrong_direction_is_ignored():
+    engine = RulesEngine([horizontal_line("goal", 50.0, direction=1, cooldown=0.0)])
+    assert sweep(engine, [80.0, 60.0, 40.0, 20.0]) == []
+    assert [name for _, name in sweep(engine, [20.0, 40.0, 60.0], t0=1.0)] == ["goal"]
+
+
+def test_drones_are_independent():
+    engine = RulesEngine([horizontal_line("goal", 50.0)], n_drones=2)
+    engine.evaluate_many([0, 1], [0.0, 0.0], [(10.0, 40.0), (10.0, 60.0)])
+    fired = engine.evaluate_many([0, 1], [0.1, 0.1], [(10.0, 60.0), (10.0, 60.0)])
+    assert [(drone, rule.name) for drone, rule in fired] == [(0, "goal")]
+
+
+def test_predicted_firing_is_confirmed_by_the_crossing():
+    engine = RulesEngine([horizontal_line("goal", 50.0)], budget=LatencyBudget(lead_time=0.1))
+    vel = (0.0, 100.0)
+    fired = sweep(engine, np.arange(30.0, 70.0, 1.0), vel=vel)
+    assert len(fired) == 1
+    t, _ = fired[0]
+    assert abs(t - 0.1) < 0.02      # 10 units before the line at 100 units/s
+    assert (engine.predicted, engine.reactive, engine.confirmed, engine.false_triggers) == (1, 0, 1, 0)
+
+
+def test_predicted_firing_without_a_crossing_is_a_false_trigger():
+    engine = RulesEngine([horizontal_line("goal", 50.0)], budget=LatencyBudget(lead_time=0.1),
+                         confirm_margin=0.1)
+    sweep(engine, np.arange(30.0, 42.0, 1.0), vel=(0.0, 100.0))
+    # Turns back; the forecast runs out 0.1 s after the expected crossing at t = 0.2.
+    sweep(engine, np.arange(41.0, 30.0, -1.0), dt=0.03, vel=(0.0, -30.0), t0=0.12)
+    assert (engine.predicted, engine.confirmed, engine.false_triggers) == (1, 0, 1)
+    assert engine.false_trigger_rate == 1.0
@@ -0,0 +1,29 @@
+# test_multilateration.py
+
+import numpy as np
+
+from multilateration import Multilaterator, DEFAULT_ANCHORS
+
+
+def ranges_to(p, anchors=DEFAULT_ANCHORS):
+    a = np.asarray(anchors, dtype=float)[:, :2]
+    return np.hypot(*(a - p).T)
+
+
+def test_good_fix_is_solved():
+    solver = Multilaterator()
+    p, rms, used = solver.solve(ranges_to(np.array([150.0, 300.0])))
+    assert np.hypot(*(p[0] - (150.0, 300.0))) < 1.0
+    assert solver.rejected == 0
+
+
+def test_fix_with_a_bad_range_it_cannot_drop_is_rejected():
+    solver = Multilaterator()
+    r = np.full(len(DEFAULT_ANCHORS), np.nan)
+    keep = [1, 2, 5]
+    r[keep] = ranges_to(np.array([150.0, 300.0]))[keep]
+    r[2] += 80.0
+    p, rms, used = solver.solve(r, tags=[0])
+    assert np.isnan(p).all()
+    assert solver.rejected == 1
+    assert 0 not in solver.last
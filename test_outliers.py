@@ -0,0 +1,58 @@
+# test_outliers.py
+
+import numpy as np
+
+from outliers import OutlierGate
+
+
+def noisy_track(n, sigma, velocity=(0.0, 0.0), rate_hz=100.0, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / rate_hz
+    pos = np.column_stack([100.0 + velocity[0] * t, 200.0 + velocity[1] * t, np.full(n, 50.0)])
+    pos[:, :2] += rng.normal(0.0, sigma, (n, 2))
+    return t, pos
+
+
+def run_one(gate, t, pos, drone=0):
+    return np.array([gate.check_one(drone, ti, p) for ti, p in zip(t, pos)])
+
+
+def test_clean_noise_is_accepted():
+    for velocity in ((0.0, 0.0), (80.0, -50.0)):
+        t, pos = noisy_track(4000, 5.0, velocity)
+        gate = OutlierGate(1)
+        run_one(gate, t, pos)
+        assert gate.rejected_hampel <= 0.005 * len(t)
+
+
+def test_single_spike_is_rejected():
+    t, pos = noisy_track(50, 2.0, (60.0, 0.0))
+    pos[30, 1] += 80.0
+    gate = OutlierGate(1)
+    accepted = run_one(gate, t, pos)
+    assert not accepted[30]
+    assert accepted[31:].all()
+    assert gate.rejected_hampel == 1
+
+
+def test_relocation_is_accepted_as_a_jump():
+    t, pos = noisy_track(60, 2.0)
+    pos[30:, 0] += 300.0
+    gate = OutlierGate(1)
+    accepted = run_one(gate, t, pos)
+    assert not accepted[30]
+    assert accepted[40:].all()
+    assert gate.jumps == 1
+
+
+def test_check_matches_check_one():
+    t, pos = noisy_track(600, 4.0, (70.0, 30.0), seed=1)
+    pos[100, 0] += 60.0
+    pos[250:260, 1] -= 40.0
+    pos[400:, 0] += 300.0
+    vectorized, scalar = OutlierGate(2), OutlierGate(2)
+    a = np.array([vectorized.check([1], [ti], p[None])[0] for ti, p in zip(t, pos)])
+    b = run_one(scalar, t, pos, drone=1)
+    assert (a == b).all()
+    assert (vectorized.rejected_hampel, vectorized.rejected_speed, vectorized.jumps) == \
+        (scalar.rejected_hampel, scalar.rejected_speed, scalar.jumps)
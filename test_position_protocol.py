@@ -0,0 +1,66 @@
+# test_position_protocol.py
+
+import numpy as np
+
+from position_protocol import (PositionStreamDecoder, encode_position_frame, encode_ranges_frame,
+                               POSITION_FRAME_SIZE)
+from serial_reader import SerialReader
+
+
+def decode(data, chunk=None):
+    """
+    The fixes decoded from data, fed in pieces of `chunk` bytes.
+    """
+    decoder = PositionStreamDecoder()
+    reader = SerialReader(None, decoder)
+    chunk = chunk or len(data)
+    for start in range(0, len(data), chunk):
+        reader.feed(data[start:start + chunk], t=0.0)
+    return decoder, [fix for _, fix in reader.fixes]
+
+
+def frames(n):
+    return [encode_position_frame(10.0 * i, 20.0, 30.0, i, 1000 * i) for i in range(n)]
+
+
+def test_corrupted_frame_drops_only_that_frame():
+    parts = frames(6)
+    bad = bytearray(parts[2])
+    bad[POSITION_FRAME_SIZE // 2] ^= 0xFF
+    parts[2] = bytes(bad)
+    for chunk in (None, 7):
+        decoder, fixes = decode(b''.join(parts), chunk)
+        assert [fix.seq for fix in fixes] == [0, 1, 3, 4, 5]
+        assert decoder.crc_errors >= 1
+        assert decoder.sequence.lost == 1
+        assert np.allclose(fixes[2].pos, (30.0, 20.0, 30.0))
+
+
+def test_truncated_frame_followed_by_a_good_one():
+    parts = frames(3)
+    data = parts[0] + parts[1][:9] + parts[2]
+    decoder, fixes = decode(data)
+    assert [fix.seq for fix in fixes] == [0, 2]
+
+
+def test_mixed_text_and_binary_frames_decode():
+    data = (b"[1.5, 2.5, 3.5]\n" + encode_position_frame(4.0, 5.0, 6.0, 0, 0) +
+            b"(7, 8, 9)\n" + encode_ranges_frame([100.0, float('nan'), 300.0], 1, 10) +
+            encode_position_frame(10.0, 11.0, 12.0, 2, 20))
+    for chunk in (None, 1, 5):
+        decoder, fixes = decode(data, chunk)
+        assert len(fixes) == 5
+        assert np.allclose(fixes[0].pos, (1.5, 2.5, 3.5)) and fixes[0].seq is None
+        assert np.allclose(fixes[1].pos, (4.0, 5.0, 6.0)) and fixes[1].seq == 0
+        assert np.allclose(fixes[2].pos, (7.0, 8.0, 9.0))
+        assert fixes[3].pos is None and np.isnan(fixes[3].ranges[1]) and fixes[3].ranges[2] == 300.0
+        assert np.allclose(fixes[4].pos, (10.0, 11.0, 12.0))
+        assert (decoder.frames, decoder.text_lines, decoder.crc_errors, decoder.text_errors) == (3, 2, 0, 0)
+
+
+def test_text_fix_glued_to_the_tail_of_a_bad_frame():
+    data = frames(1)[0][5:] + b"[1.0, 2.0, 3.0]\n" + b"garbage\n"
+    decoder, fixes = decode(data)
+    assert len(fixes) == 1
+    assert np.allclose(fixes[0].pos, (1.0, 2.0, 3.0))
+    assert decoder.text_errors == 1
@@ -0,0 +1,26 @@
+# test_process_engine.py
+
+import queue
+
+import numpy as np
+
+from engine import TrackingEngine
+from position_protocol import PositionFix
+from process_engine import RingPublisher, POSITION_DTYPE, TELEMETRY_RECORD_DTYPE
+from shared_ring import SharedRing
+
+
+def test_positions_are_stamped_with_their_fix_time():
+    engine = TrackingEngine([{"name": "drone1", "uri": None, "tag": 0}])
+    positions = SharedRing.create(POSITION_DTYPE, 16)
+    telemetry = SharedRing.create(TELEMETRY_RECORD_DTYPE, 16)
+    try:
+        RingPublisher(engine, positions, telemetry, queue.Queue())
+        engine.tracker.clock = lambda: 100.0
+        engine.tracker.process_fixes([(99.5, PositionFix(0, 0, None, (100.0, 200.0, 0.0))),
+                                      (99.6, PositionFix(0, 1, None, (101.0, 200.0, 0.0)))])
+        records, _, _ = positions.read_since(0)
+        assert np.allclose(records['t'], [99.5, 99.6])
+    finally:
+        positions.close()
+        telemetry.close()
@@ -0,0 +1,38 @@
+# test_qt_bridge.py
+
+from PyQt5.QtCore import QCoreApplication
+
+from events import Signal
+from qt_bridge import EngineBridge
+
+
+class FakeEngine:
+    def __init__(self):
+        self.positionUpdated = Signal()
+        self.ruleFired = Signal()
+        self.telemetryReceived = Signal()
+        self.telemetryMessage = Signal()
+        self.connectionChanged = Signal()
+
+
+def test_positions_and_telemetry_are_coalesced_per_frame():
+    QCoreApplication.instance() or QCoreApplication([])
+    engine = FakeEngine()
+    bridge = EngineBridge(engine)
+    positions, telemetry = [], []
+    bridge.positionUpdated.connect(lambda drone, pos: positions.append((drone, pos)))
+    bridge.telemetryReceived.connect(lambda drone, n, count: telemetry.append((drone, n, count)))
+
+    for i in range(100):
+        engine.positionUpdated.emit(0, (i, 0.0, 0.0))
+        engine.telemetryReceived.emit(1, i)
+    engine.positionUpdated.emit(1, (5.0, 5.0, 0.0))
+    bridge.flush()
+    assert sorted(positions) == [(0, (99, 0.0, 0.0)), (1, (5.0, 5.0, 0.0))]
+    assert telemetry == [(1, 99, 100)]
+
+    engine.telemetryReceived.emit(1, 101)
+    bridge.flush()
+    bridge.flush()
+    assert len(positions) == 2
+    assert telemetry[1:] == [(1, 101, 2)]
@@ -0,0 +1,53 @@
+# test_replay.py
+
+import time
+import threading
+
+import numpy as np
+
+from arena import Arena
+from config import load_config
+from engine import TrackingEngine
+from program import start_simulation
+from session_log import SessionRecorder, SessionLog, SessionReplayer
+
+
+def collect_rules(engine):
+    fired = []
+    engine.ruleFired.connect(lambda rule, t, pos, drone: fired.append((rule, t, np.array(pos), drone)))
+    return fired
+
+
+def test_max_speed_replay_fires_the_live_rules(tmp_path):
+    path = str(tmp_path / "session.log")
+    config = load_config()
+    arena = Arena.from_config(config["arena"])
+
+    # Live: the simulated drone sweeps across the virtual wall and a goal.
+    recorder = SessionRecorder(path)
+    serial_port, drones, stand_ins = start_simulation(config, arena)
+    live = TrackingEngine(drones, serial_port=serial_port, recorder=recorder, arena=arena)
+    live_rules = collect_rules(live)
+    live.start()
+    time.sleep(4.0)
+    live.stop()
+    for stand_in in stand_ins:
+        stand_in.stop()
+    recorder.close()
+
+    # Replayed as fast as possible, the engine running in its own thread.
+    replay = TrackingEngine([{"name": "drone1", "uri": None, "tag": 0}], arena=arena)
+    replay_rules = collect_rules(replay)
+    done = threading.Event()
+    replayer = SessionReplayer(SessionLog(path), replay.tracker, replay.registry[0].telemetry, speed=0,
+                               on_finished=done.set)
+    replay.start()
+    replayer.start()
+    assert done.wait(30.0)
+    replay.stop()
+
+    assert live_rules
+    assert [r[0] for r in replay_rules] == [r[0] for r in live_rules]
+    for (_, t_live, pos_live, _), (_, t_replay, pos_replay, _) in zip(live_rules, replay_rules):
+        assert abs(t_replay - t_live) < 0.01
+        assert np.hypot(*(pos_replay[:2] - pos_live[:2])) < 5.0
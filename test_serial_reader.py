@@ -0,0 +1,53 @@
+# test_serial_reader.py
+
+from collections import deque
+
+from engine import TrackingEngine
+from position_protocol import PositionFix
+from serial_reader import SerialReader
+
+
+def fix(i):
+    return PositionFix(0, i & 0xFFFF, None, (0.0, 0.0, 0.0))
+
+
+class StaleLength(deque):
+    """
+    A queue whose length is read just before the other thread runs: it
+    reports the old length, then `between` runs on it.
+    """
+
+    def __init__(self, *args, between=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.between = between
+
+    def __len__(self):
+        n = super().__len__()
+        if self.between is not None:
+            between, self.between = self.between, None
+            between(self)
+        return n
+
+
+def test_full_queue_drops_the_oldest():
+    reader = SerialReader(None, None, queue_size=4)
+    for i in range(7):
+        reader.push(float(i), fix(i))
+    assert reader.dropped_fixes == 3
+    assert [t for t, _ in reader.fixes] == [3.0, 4.0, 5.0, 6.0]
+
+
+def test_push_survives_a_drain_after_its_length_check():
+    reader = SerialReader(None, None, queue_size=4)
+    for i in range(4):
+        reader.push(float(i), fix(i))
+    reader.fixes = StaleLength(reader.fixes, maxlen=4, between=deque.clear)
+    reader.push(4.0, fix(4))
+    assert [t for t, _ in reader.fixes] == [4.0]
+
+
+def test_take_fixes_survives_a_shorter_queue_than_it_measured():
+    tracker = TrackingEngine([{"name": "drone1", "uri": None, "tag": 0}]).tracker
+    fixes = StaleLength(((float(i), fix(i)) for i in range(4)), maxlen=4, between=deque.popleft)
+    tracker.reader.fixes = fixes
+    assert [t for t, _ in tracker.take_fixes()] == [1.0, 2.0, 3.0]
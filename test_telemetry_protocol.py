@@ -0,0 +1,60 @@
+# test_telemetry_protocol.py
+
+import time
+
+from crazyflie_telemetry import CrazyflieTelemetry
+from simulation import FakeCrazyflie
+from telemetry_protocol import V1_SAMPLE, V2_VERSION, encode_v2
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_v2_is_decoded_once_the_device_acknowledges():
+    cf = FakeCrazyflie(versions=(1, 2))
+    telemetry = CrazyflieTelemetry(uri="sim://0", crazyflie=cf, autoconnect=False)
+    try:
+        telemetry.open_link()
+        assert telemetry.link_version == V2_VERSION
+        assert wait_for(lambda: telemetry.link_stats.packets >= 5)
+        assert telemetry.link_stats.v1_packets == 0
+        assert telemetry.link_stats.malformed == 0
+    finally:
+        telemetry.close()
+
+
+def test_v1_device_stays_v1():
+    cf = FakeCrazyflie(versions=(1,))
+    telemetry = CrazyflieTelemetry(uri="sim://0", crazyflie=cf, autoconnect=False)
+    try:
+        telemetry.open_link()
+        assert wait_for(lambda: telemetry.link_stats.v1_packets >= 5)
+        assert telemetry.link_version == 1
+        assert telemetry.link_stats.packets == 0
+    finally:
+        telemetry.close()
+
+
+def test_v1_sample_with_a_v2_looking_first_byte_is_not_misread():
+    telemetry = CrazyflieTelemetry(uri=None, crazyflie=FakeCrazyflie())
+    try:
+        # Flags 0x2100: the first byte looks like a v2 header with one sample.
+        sample = (0x2100, 1000, 1000, 1000, 1000, 1000, 500, 0)
+        cf = telemetry.cf
+        telemetry.packet_callback(cf.telemetry_packet(0.0, V1_SAMPLE.pack(*sample) + bytes(6)))
+        assert telemetry.count == 1
+        assert telemetry.link_stats.packets == 0
+        assert int(telemetry.record(0)['flags']) == 0x2100
+
+        telemetry.packet_callback(cf.telemetry_packet(0.0, bytes([0x7F, V2_VERSION])))
+        telemetry.packet_callback(cf.telemetry_packet(0.0, encode_v2(0, 0, 10, [sample, sample])))
+        assert telemetry.count == 3
+        assert telemetry.link_stats.packets == 1
+    finally:
+        telemetry.close()